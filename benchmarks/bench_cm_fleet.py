@@ -0,0 +1,186 @@
+"""
+Нагрузочный тест пула на локальном CM-заменителе: настоящие SteamClient + SteamManager + SessionPool,
+без сети. Поднимает N аккаунтов, проверяет, что заменитель получил их games_played, рвет часть
+соединений и меряет, за сколько ConnectionSupervisor всех вернул.
+
+Запуск: python -m benchmarks.bench_cm_fleet --sessions 1000 [--drop-fraction 0.5] [--output cm_fleet.json]
+С заменителем в другом процессе: --address 127.0.0.1:27020 --key-file standin.pem
+"""
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import resource
+import argparse
+import tempfile
+import statistics
+
+import gevent
+from steam.client import SteamClient
+
+from benchmarks.cm_standin import CMStandIn, point_client, trust_key_file
+from benchmarks.fakes import StoreStub
+from zoblako.core.name_cache import GameNameCache
+from zoblako.core.name_resolver import GameNameResolver
+from zoblako.core.playtime import PlaytimeLedger
+from zoblako.core.session_pool import SessionPool
+from zoblako.core.login_pipeline import LoginPipeline, set_time_offset
+from zoblako.core.steam_client import SteamManager
+
+APP_IDS = (730, 440, 570)
+
+
+def raise_fd_limit():
+    """Тысяча сессий - тысяча сокетов, мягкий лимит 1024 не хватит"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def percentiles(values):
+    """Медиана / p95 / максимум, секунды"""
+    if not values:
+        return None
+    values = sorted(values)
+    return {"median": statistics.median(values), "p95": values[int(len(values) * 0.95) - 1 if len(values) > 1 else 0],
+            "max": values[-1], "n": len(values)}
+
+
+def wait_until(condition, timeout, step=0.05):
+    """Ожидание условия без блокировки хаба"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        gevent.sleep(step)
+    return condition()
+
+
+class TimedManager(SteamManager):
+    """SteamManager, запоминающий, когда закончился вход. По событию logged_on мерить нельзя:
+    под нагрузкой эмиттер SteamClient доставляет его уже после возврата из login"""
+
+    login_done = {}
+
+    def login(self, username, *args, **kwargs):
+        result = super().login(username, *args, **kwargs)
+        self.login_done.setdefault(username, time.monotonic())
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--address", help="host:port заменителя из другого процесса, иначе поднимаем свой")
+    parser.add_argument("--key-file", help="ключ заменителя из другого процесса")
+    parser.add_argument("--login-latency", type=float, default=0.0, help="задержка входа на своем заменителе, с")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля входов с ошибкой на своем заменителе")
+    parser.add_argument("--guard", action="store_true",
+                        help="своему заменителю требовать код Steam Guard, коды считаются из shared_secret")
+    parser.add_argument("--login-concurrency", type=int, default=LoginPipeline.CONCURRENCY)
+    parser.add_argument("--drop-fraction", type=float, default=0.5, help="какую долю соединений оборвать")
+    parser.add_argument("--update-status", action="store_true",
+                        help="после входа дернуть SteamManager.update_status в гринлете на каждую сессию")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", default="cm_fleet.json")
+    args = parser.parse_args()
+
+    fd_limit = raise_fd_limit()
+    set_time_offset(0)  # Часы заменителя - часы хоста, в WebAPI за временем Steam не ходим
+    usernames = [f"fleet{i:05d}" for i in range(args.sessions)]
+    secrets = {username: base64.b64encode(os.urandom(20)).decode() for username in usernames} if args.guard else {}
+    tmp = tempfile.mkdtemp(prefix="zetpar-cm-")
+    store = StoreStub().start()
+    standin = None
+    if args.address:
+        host, port = args.address.rsplit(":", 1)
+        address = (host, int(port))
+        trust_key_file(args.key_file)
+    else:
+        standin = CMStandIn(login_latency=args.login_latency, fail_rate=args.fail_rate,
+                            guard_secrets=secrets).start()
+        standin.trust()
+        address = standin.address
+
+    resolver = GameNameResolver(cache=GameNameCache(os.path.join(tmp, "names.db")), api_url=store.api_url)
+    resolver.resolve_many(APP_IDS)
+
+    def make_manager(events):
+        manager = TimedManager(client=point_client(SteamClient(), address), resolver=resolver, events=events)
+        manager.sentry_path = tmp
+        manager.rotation_path = tmp
+        return manager
+
+    pool = SessionPool(manager_factory=make_manager, ledger=PlaytimeLedger(os.path.join(tmp, "ledger.db")),
+                       pipeline=LoginPipeline(concurrency=args.login_concurrency))
+
+    report = {"sessions": args.sessions, "fd_limit": fd_limit, "update_status": args.update_status}
+    cpu_start, started = time.process_time(), time.monotonic()
+    try:
+        for username in usernames:
+            pool.add_session(username, "password", APP_IDS, shared_secret=secrets.get(username))
+        pool.wait_logins(timeout=args.timeout)
+        elapsed = time.monotonic() - started
+        report["login"] = {
+            "online": pool.online_count(),
+            "seconds": elapsed,
+            "per_second": pool.online_count() / elapsed if elapsed else None,
+            "latency": percentiles([at - started for at in TimedManager.login_done.values()]),
+            "cpu_seconds": time.process_time() - cpu_start,
+            "failed": {session.username: session.status for session in pool.sessions.values()
+                       if session.status != "online"},
+            "pipeline": pool.pipeline.report(),
+        }
+
+        if args.update_status:
+            for session in pool.sessions.values():
+                if session.status == "online":
+                    gevent.spawn(session.manager.update_status)
+
+        online = [session for session in pool.sessions.values() if session.status == "online"]
+        if standin is not None:
+            synced = wait_until(lambda: all(
+                sorted(standin.accounts[session.username].games_played) == sorted(APP_IDS)
+                for session in online), 30)
+            report["games_played_synced"] = synced
+
+            cpu_start = time.process_time()
+            gevent.sleep(5)
+            report["idle_cpu_percent"] = (time.process_time() - cpu_start) / 5 * 100
+
+            dropped = standin.drop_fraction(args.drop_fraction)
+            drop_at = time.monotonic()
+            gevent.sleep(0.5)  # Чтобы клиенты успели заметить обрыв
+
+            def recovered():
+                return all(session.manager.supervisor.down_since is None for session in online)
+
+            report["reconnect"] = {
+                "dropped": dropped,
+                "all_back": wait_until(recovered, args.timeout),
+                "seconds": time.monotonic() - drop_at,
+                "downtime": percentiles([session.manager.supervisor.last_downtime for session in online
+                                         if session.manager.supervisor.reconnects]),
+                "games_played_resynced": wait_until(lambda: all(
+                    sorted(standin.accounts[session.username].games_played) == sorted(APP_IDS)
+                    for session in online), 30),
+            }
+            report["standin"] = standin.stats()
+    finally:
+        pool.stop()
+        if standin is not None:
+            standin.stop()
+        store.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["login"]["online"] == args.sessions else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
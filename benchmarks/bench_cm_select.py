@@ -0,0 +1,152 @@
+"""
+Выбор CM: свой случайный список у каждого SteamClient (как в библиотеке steam) против общего
+CMDirectory с замерами. Поднимает несколько заменителей с разной задержкой и один мертвый адрес,
+меряет холодный старт пачки сессий, возврат после обрыва и куда сессии в итоге сели.
+
+Запуск: python -m benchmarks.bench_cm_select [--sessions 100] [--output cm_select.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+
+import gevent
+from Cryptodome.PublicKey import RSA
+from steam.client import SteamClient
+
+from benchmarks.bench_cm_fleet import TimedManager, percentiles, wait_until, raise_fd_limit
+from benchmarks.cm_standin import CMStandIn
+from benchmarks.fakes import StoreStub
+from zoblako.core.cm_directory import CMDirectory
+from zoblako.core.name_cache import GameNameCache
+from zoblako.core.name_resolver import GameNameResolver
+from zoblako.core.playtime import PlaytimeLedger
+from zoblako.core.session_pool import SessionPool
+
+APP_IDS = (730,)
+LATENCIES = (0.0, 0.05, 0.15, 0.3)  # Задержка каждого сообщения у заменителей, с
+
+
+def dead_address():
+    """Адрес, на котором никто не слушает: connect сразу получает отказ"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()
+
+
+def stock_client(addresses):
+    """SteamClient со своим списком, как без CMDirectory: порядок случайный, про задержку он не знает"""
+    client = SteamClient()
+    client.cm_servers.clear()
+    client.cm_servers.merge_list(addresses)
+    client.cm_servers.last_updated = time.time()
+    client.auto_discovery = False
+    return client
+
+
+def run(mode, addresses, standins, directory, sessions, tmp, resolver, timeout):
+    """Один прогон: вход пачки, обрыв всех соединений, возврат. Отчет по прогону"""
+    def make_manager(events):
+        if directory is None:
+            client = stock_client(addresses)
+        else:
+            client = SteamClient()
+            client.auto_discovery = False
+            directory.attach(client)
+        manager = TimedManager(client=client, resolver=resolver, events=events)
+        manager.sentry_path = tmp
+        manager.rotation_path = tmp
+        return manager
+
+    pool = SessionPool(manager_factory=make_manager, ledger=PlaytimeLedger(os.path.join(tmp, f"{mode}.db")))
+    by_port = {standin.address[1]: latency for standin, latency in zip(standins, LATENCIES)}
+    report = {}
+    started = time.monotonic()
+    try:
+        for i in range(sessions):
+            pool.add_session(f"{mode}{i:04d}", "password", APP_IDS)
+        pool.wait_logins(timeout=timeout)
+        report["cold_start"] = {
+            "online": pool.online_count(),
+            "seconds": time.monotonic() - started,
+            "login": percentiles([TimedManager.login_done[username] - started
+                                  for username in pool.sessions if username in TimedManager.login_done]),
+        }
+        placement = Counter(by_port.get(session.manager.client.current_server_addr[1])
+                            for session in pool.sessions.values() if session.status == "online")
+        report["placement"] = {str(latency): count for latency, count in sorted(placement.items())}
+
+        online = [session for session in pool.sessions.values() if session.status == "online"]
+        dropped = sum(standin.drop_fraction(1.0) for standin in standins)
+        drop_at = time.monotonic()
+        gevent.sleep(0.5)
+        report["reconnect"] = {
+            "dropped": dropped,
+            "all_back": wait_until(lambda: all(session.manager.supervisor.down_since is None
+                                               for session in online), timeout),
+            "seconds": time.monotonic() - drop_at,
+            "downtime": percentiles([session.manager.supervisor.last_downtime for session in online
+                                     if session.manager.supervisor.reconnects]),
+        }
+    finally:
+        pool.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", default="cm_select.json")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    tmp = tempfile.mkdtemp(prefix="zetpar-cm-select-")
+    store = StoreStub().start()
+    key = RSA.generate(1024)  # Ключ канала доверяется на весь процесс, так что он один на все заменители
+    standins = [CMStandIn(key=key, message_latency=latency).start() for latency in LATENCIES]
+    standins[0].trust()
+    addresses = [standin.address for standin in standins] + [dead_address()]
+    resolver = GameNameResolver(cache=GameNameCache(os.path.join(tmp, "names.db")), api_url=store.api_url)
+    resolver.resolve_many(APP_IDS)
+
+    report = {"sessions": args.sessions, "servers": {f"{host}:{port}": latency for (host, port), latency
+                                                      in zip(addresses, LATENCIES + ("dead",))}}
+    directory = None
+    try:
+        report["stock"] = run("stock", addresses, standins, None, args.sessions, tmp, resolver, args.timeout)
+
+        path = os.path.join(tmp, "cm_servers.json")
+        directory = CMDirectory(path=path)
+        directory.merge_list(addresses)
+        probe_started = time.monotonic()
+        directory.start(wait=CMDirectory.PROBE_TIMEOUT + 1)
+        report["probe_seconds"] = time.monotonic() - probe_started
+        report["directory"] = run("directory", addresses, standins, directory, args.sessions, tmp, resolver,
+                                  args.timeout)
+        directory.stop()
+
+        # Перезапуск: ранжирование уже на диске, до первого замера
+        reloaded = CMDirectory(path=path)
+        report["reloaded_ranking"] = [f"{host}:{port}" for host, port in reloaded.ranked()]
+    finally:
+        if directory is not None:
+            directory.stop()
+        for standin in standins:
+            standin.stop()
+        store.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["directory"]["cold_start"]["online"] == args.sessions else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
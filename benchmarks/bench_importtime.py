@@ -0,0 +1,100 @@
+"""
+Время импорта на старте по -X importtime: каждый сценарий - свежий процесс python, берем медиану.
+Бюджеты лежат в benchmarks/importtime_budget.json, превышение или запрещенный модуль - код возврата 1.
+
+Запуск: python -m benchmarks.bench_importtime [--runs 7] [--output importtime.json] [--update]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(ROOT, "benchmarks", "importtime_budget.json")
+
+# сценарий -> (что импортируем, какие пакеты на этом пути грузиться не должны)
+SCENARIOS = {
+    # Сам main.py: все тяжелое внутри функций
+    "main": ("import main", ("rich", "colorama", "steam", "gevent", "cryptography")),
+    # --import-profiles / --export-profiles
+    "profiles": ("import main\nimport zoblako.core.profile_manager", ("rich", "colorama", "steam", "gevent")),
+    # --fleet: steam нужен, интерфейс - нет
+    "fleet": ("import main\nimport zoblako.core.session_pool\nimport zoblako.core.profile_manager",
+              ("rich", "colorama")),
+    # daemon.py ctl: только сокет
+    "daemon_ctl": ("import daemon", ("rich", "colorama", "steam", "cryptography")),
+    # Обычный запуск с терминалом, для сравнения
+    "interactive": ("import main\nimport colorama\nimport zoblako.ui.console\nimport zoblako.core.steam_client",
+                    ()),
+}
+
+
+def run_once(code):
+    """Один процесс с -X importtime: (сумма собственного времени импортов в мс, загруженные модули)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    total_us, modules = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        modules.add(name.strip())
+    return total_us / 1000, modules
+
+
+def measure(code, runs):
+    """Медиана по runs процессам, первый прогон - на прогрев кэша байткода и диска"""
+    run_once(code)
+    timings, modules = [], set()
+    for _ in range(runs):
+        total_ms, modules = run_once(code)
+        timings.append(total_ms)
+    return statistics.median(timings), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--output", default="importtime.json", help="куда писать JSON с замерами")
+    parser.add_argument("--update", action="store_true", help="переписать бюджеты по текущим замерам")
+    parser.add_argument("--headroom", type=float, default=1.5, help="запас при --update: бюджет = замер * headroom")
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as f:
+        budgets = json.load(f)
+
+    report, failures = {}, []
+    for name, (code, forbidden) in SCENARIOS.items():
+        median_ms, modules = measure(code, args.runs)
+        loaded = sorted(package for package in forbidden
+                        if any(module == package or module.startswith(package + ".") for module in modules))
+        budget_ms = budgets.get(name)
+        report[name] = {"median_ms": median_ms, "budget_ms": budget_ms, "modules": len(modules),
+                        "forbidden_loaded": loaded}
+        if loaded:
+            failures.append(f"{name}: грузит {', '.join(loaded)}")
+        if budget_ms is not None and median_ms > budget_ms and not args.update:
+            failures.append(f"{name}: {median_ms:.1f} мс при бюджете {budget_ms:.1f} мс")
+        print(f"{name:<12} {median_ms:8.1f} мс  бюджет {budget_ms if budget_ms is not None else '-':>6}  "
+              f"модулей {len(modules)}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.update:
+        budgets = {name: round(entry["median_ms"] * args.headroom) for name, entry in report.items()}
+        with open(BUDGET_FILE, "w") as f:
+            json.dump(budgets, f, indent=2)
+            f.write("\n")
+        print(f"Бюджеты обновлены: {BUDGET_FILE}")
+
+    for line in failures:
+        print(f"Превышено: {line}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Синхронизация библиотеки на CM-заменителе: первая синхронизация, повторная без изменений,
+после покупки/изменения пакетов и idle по индексу. Считает запросы в заменитель и время.
+
+Запуск: python -m benchmarks.bench_library [--accounts 20] [--packages 300] [--output library.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import gevent
+from steam.client import SteamClient
+
+from benchmarks.bench_cm_fleet import percentiles, raise_fd_limit, wait_until
+from benchmarks.cm_standin import CMStandIn, point_client
+from benchmarks.fakes import StoreStub
+from zoblako.core.library import LibraryIndex
+from zoblako.core.name_cache import GameNameCache
+from zoblako.core.name_resolver import GameNameResolver
+from zoblako.core.playtime import PlaytimeLedger
+from zoblako.core.session_pool import SessionPool
+from zoblako.core.steam_client import SteamManager
+
+APP_ID_BASE = 100000
+
+
+def make_library(rng, packages, game_ids, dlc_ids):
+    """Пакеты аккаунта: в каждом игра и иногда пара DLC"""
+    library = {}
+    for package_id in range(1, packages + 1):
+        app_ids = [rng.choice(game_ids)] + rng.sample(dlc_ids, rng.choice((0, 0, 1, 2)))
+        library[package_id] = (rng.randint(1, 10 ** 6), app_ids)
+    return library
+
+
+def sync_all(pool, standin, **kwargs):
+    """Синхронизация всех сессий: время на аккаунт и сколько пакетов/GetOwnedGames ушло в заменитель"""
+    packages, owned = standin.product_info_packages, standin.owned_games_requests
+    timings, reports = [], []
+    for session in pool.sessions.values():
+        started = time.perf_counter()
+        reports.append(session.manager.sync_library(pool.ledger, **kwargs))
+        timings.append(time.perf_counter() - started)
+    return {
+        "seconds": percentiles(timings),
+        "failed": sum(report is None for report in reports),
+        "requests": sum(report["requests"] for report in reports if report),
+        "product_info_packages": standin.product_info_packages - packages,
+        "owned_games_requests": standin.owned_games_requests - owned,
+        "games": percentiles([report["games"] for report in reports if report]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--packages", type=int, default=300, help="пакетов на аккаунт")
+    parser.add_argument("--catalog", type=int, default=5000, help="игр в каталоге заменителя")
+    parser.add_argument("--under-hours", type=float, default=10)
+    parser.add_argument("--output", default="library.json")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    rng = random.Random(1)
+    game_ids = list(range(APP_ID_BASE, APP_ID_BASE + args.catalog))
+    dlc_ids = list(range(APP_ID_BASE + args.catalog, APP_ID_BASE + 2 * args.catalog))
+    usernames = [f"lib{i:04d}" for i in range(args.accounts)]
+    libraries = {username: make_library(rng, args.packages, game_ids, dlc_ids) for username in usernames}
+
+    tmp = tempfile.mkdtemp(prefix="zetpar-library-")
+    store = StoreStub().start()
+    standin = CMStandIn(libraries=libraries, games={app_id: f"Game {app_id}" for app_id in game_ids}).start()
+    standin.trust()
+    for (username, library) in libraries.items():
+        for _, app_ids in library.values():
+            standin.playtime[(username, app_ids[0])] = rng.randint(0, 3000)
+
+    resolver = GameNameResolver(cache=GameNameCache(os.path.join(tmp, "names.db")), api_url=store.api_url)
+    index = LibraryIndex(os.path.join(tmp, "library.db"))
+
+    def make_manager(events):
+        manager = SteamManager(client=point_client(SteamClient(), standin.address), resolver=resolver,
+                               events=events, library=index)
+        manager.sentry_path = tmp
+        manager.rotation_path = tmp
+        return manager
+
+    pool = SessionPool(manager_factory=make_manager, ledger=PlaytimeLedger(os.path.join(tmp, "ledger.db")))
+    report = {"accounts": args.accounts, "packages": args.packages}
+    try:
+        for username in usernames:
+            pool.add_session(username, "password")
+        pool.wait_logins(timeout=120)
+        report["online"] = pool.online_count()
+
+        report["first"] = sync_all(pool, standin)
+        report["unchanged"] = sync_all(pool, standin)
+
+        # У каждого аккаунта: новая покупка, обновленный пакет и возврат денег за третий
+        for username, library in libraries.items():
+            library[args.packages + 1] = (1, [rng.choice(game_ids)])
+            change_number, app_ids = library[1]
+            library[1] = (change_number + 1, app_ids + [rng.choice(dlc_ids)])
+            library.pop(2)
+        # Новый список лицензий заменитель пришлет при следующем входе
+        standin.drop()
+        gevent.sleep(0.5)  # Чтобы клиенты успели заметить обрыв
+        wait_until(lambda: all(session.manager.supervisor.down_since is None and session.manager.client.licenses
+                               for session in pool.sessions.values()), 120)
+        report["changed"] = sync_all(pool, standin)
+
+        timings, started_games = [], []
+        for session in pool.sessions.values():
+            started = time.perf_counter()
+            session.manager.idle_owned(args.under_hours, pool.ledger)
+            timings.append(time.perf_counter() - started)
+            started_games.append(len(session.manager.running_games))
+        report["idle_under_hours"] = {"seconds": percentiles(timings), "games": percentiles(started_games)}
+        report["full"] = sync_all(pool, standin, full=True)
+    finally:
+        pool.stop()
+        standin.stop()
+        store.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["unchanged"]["requests"] == 0 and not report["first"]["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Бенчмарк старта ProfileManager: PBKDF2 при каждом запуске против ленивого ключа и кэша ключа
+
+Запуск: python -m benchmarks.bench_startup [--runs 20]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from zoblako.core.profile_manager import ProfileManager
+
+
+def measure(action, runs):
+    """Медиана и минимум времени выполнения, мс"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        action()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+def measure_process(code, env, runs):
+    """Время целого запуска процесса, мс"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    profiles_dir = tempfile.mkdtemp(prefix="zetpar-bench-")
+    try:
+        ProfileManager(profiles_dir).save_profile("bench", "password")
+
+        def eager():
+            # Как было раньше: ключ считается в __init__ всегда
+            manager = ProfileManager(profiles_dir)
+            manager.key
+
+        def lazy_no_decrypt():
+            ProfileManager(profiles_dir).get_profiles()
+
+        def lazy_decrypt():
+            ProfileManager(profiles_dir).load_profile("bench")
+
+        def cached_decrypt():
+            ProfileManager(profiles_dir, key_cache=True).load_profile("bench")
+
+        cached_decrypt()  # Прогреваем кэш ключа
+        results = [
+            ("до: PBKDF2 в __init__", measure(eager, args.runs)),
+            ("лениво, без расшифровки", measure(lazy_no_decrypt, args.runs)),
+            ("лениво, с расшифровкой", measure(lazy_decrypt, args.runs)),
+            ("кэш ключа, с расшифровкой", measure(cached_decrypt, args.runs)),
+        ]
+
+        code = ("from zoblako.core.profile_manager import ProfileManager; "
+                f"ProfileManager({profiles_dir!r}).load_profile('bench')")
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        process_runs = max(args.runs // 4, 3)
+        env.pop("ZETPAR_KEY_CACHE", None)
+        results.append(("процесс целиком, без кэша", measure_process(code, env, process_runs)))
+        results.append(("процесс целиком, кэш ключа",
+                        measure_process(code, dict(env, ZETPAR_KEY_CACHE="1"), process_runs)))
+    finally:
+        shutil.rmtree(profiles_dir, ignore_errors=True)
+
+    print(f"{'сценарий':<30} {'медиана, мс':>12} {'минимум, мс':>12}")
+    for name, (median, best) in results:
+        print(f"{name:<30} {median:>12.2f} {best:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Набор бенчмарков без сети: поддельный SteamClient, локальная заглушка стора, временные базы.
+Результаты пишутся в JSON, чтобы сравнивать версии между собой.
+
+Запуск: python -m benchmarks.bench_suite [--quick] [--output bench_results.json] [--compare old.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+import gevent
+from rich.console import Console
+
+from benchmarks.fakes import FakeSteamClient, StoreStub
+from zoblako.core.steam_client import SteamManager
+from zoblako.core.name_cache import GameNameCache
+from zoblako.core.name_resolver import GameNameResolver
+from zoblako.core.catalog import AppCatalog
+from zoblako.core.profile_store import ProfileStore
+from zoblako.core.profile_manager import ProfileManager
+from zoblako.core.playtime import PlaytimeLedger
+from zoblako.core.session_pool import SessionPool
+from zoblako.ui.console import ConsoleUI
+
+
+def summarize(timings, unit="ms"):
+    """Сводка по замерам в секундах: медиана, p95, минимум в указанных единицах"""
+    scale = {"ms": 1000, "us": 1000000}[unit]
+    timings = sorted(t * scale for t in timings)
+    return {
+        "unit": unit,
+        "n": len(timings),
+        "median": statistics.median(timings),
+        "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min": timings[0],
+    }
+
+
+def measure(action, runs, unit="ms"):
+    """Время каждого вызова action"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings, unit)
+
+
+class Bench:
+    """Окружение одного прогона: временная папка, заглушка стора, резолвер на ней"""
+
+    def __init__(self, store_latency):
+        self.tmp = tempfile.mkdtemp(prefix="zetpar-bench-")
+        self.store = StoreStub(latency=store_latency).start()
+        self.results = {}
+
+    def resolver(self, name="names", catalog=None):
+        """Резолвер со своим пустым кэшем и пустым каталогом, если не передан свой"""
+        cache = GameNameCache(os.path.join(self.tmp, f"{name}.db"))
+        if catalog is None:  # Пустой переданный каталог - тоже каталог, len() == 0 не повод его подменять
+            catalog = AppCatalog(os.path.join(self.tmp, f"{name}.tsv"))
+        return GameNameResolver(cache=cache, api_url=self.store.api_url, catalog=catalog)
+
+    def manager(self, resolver=None, events=None):
+        """SteamManager на поддельном клиенте, уже в сети"""
+        manager = SteamManager(client=FakeSteamClient(), resolver=resolver or self.resolver(), events=events)
+        manager.sentry_path = self.tmp
+        manager.rotation_path = self.tmp
+        return manager
+
+    def close(self):
+        self.store.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def bench_commands(bench, runs):
+    """start/stop одной игры и пачки из 32 на подключенном менеджере с теплым кэшем"""
+    resolver = bench.resolver("commands")
+    manager = bench.manager(resolver)
+    manager.login("bench", "password")
+    resolver.resolve_many(range(10, 10 + 32 * 10, 10))  # Названия уже в кэше, как в обычной работе
+
+    def start_stop():
+        manager.start_games([10])
+        manager.stop_game(10)
+
+    batch = list(range(10, 10 + 32 * 10, 10))
+
+    def start_stop_batch():
+        manager.start_games(batch)
+        manager.stop_all_games()
+
+    return {
+        "start_stop_single": measure(start_stop, runs, "us"),
+        "start_stop_batch_32": measure(start_stop_batch, max(runs // 10, 10), "us"),
+    }
+
+
+def bench_names(bench, count):
+    """get_game_names пачкой и get_game_name по одному: холодный кэш (запросы в заглушку) и теплый"""
+    result = {}
+    manager = bench.manager(bench.resolver("names_batch"))
+    app_ids = list(range(1000, 1000 + count))
+    before = bench.store.requests
+    result["batch_cold"] = measure(lambda: manager.get_game_names(app_ids), 1)
+    result["batch_cold"]["store_requests"] = bench.store.requests - before
+    result["batch_warm"] = measure(lambda: manager.get_game_names(app_ids), 20)
+
+    manager = bench.manager(bench.resolver("names_single"))
+    app_ids = iter(range(5000, 5000 + count))
+    result["single_cold"] = measure(lambda: manager.get_game_name(next(app_ids)), count)
+    result["single_warm"] = measure(lambda: manager.get_game_name(5000), 200, "us")
+    return result
+
+
+WORDS = ("dark", "souls", "counter", "strike", "space", "simulator", "farm", "legend", "tales", "war",
+         "city", "racing", "dragon", "knight", "zombie", "survival", "tycoon", "puzzle", "quest", "hero",
+         "empire", "galaxy", "dungeon", "shadow", "island", "train", "truck", "football", "ninja", "pixel")
+
+
+def bench_catalog(bench, size, runs):
+    """Каталог приложений на size названий: загрузка снимка, название по id, поиск по началу и неточный"""
+    rng = random.Random(7)
+    entries = {10 * i: f"{' '.join(rng.sample(WORDS, rng.randint(1, 4))).title()} {rng.randint(1, 999)}"
+               for i in range(1, size + 1)}
+    path = os.path.join(bench.tmp, "catalog.tsv")
+    catalog = AppCatalog(path)
+    catalog._build(entries)
+    catalog.save()
+
+    result = {"size": size}
+    catalog = AppCatalog(path)
+    result["load"] = measure(catalog.load, 1)
+    app_ids = list(entries)
+    result["name"] = measure(lambda: catalog.name(rng.choice(app_ids)), runs, "us")
+
+    manager = bench.manager(bench.resolver("catalog_names", catalog))
+    before = bench.store.requests
+    batch = rng.sample(app_ids, 100)
+    result["get_game_names_cold_100"] = measure(lambda: manager.get_game_names(batch), 1)
+    result["get_game_names_cold_100"]["store_requests"] = bench.store.requests - before
+
+    names = list(entries.values())
+    result["prefix"] = measure(lambda: catalog.prefix(rng.choice(names)[:rng.randint(3, 10)]), runs, "us")
+    result["word_index_build"] = measure(catalog._ensure_words, 1)
+
+    def typo():
+        name = rng.choice(names).lower()
+        i = rng.randrange(len(name) - 1)
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]  # Переставленные буквы
+
+    result["fuzzy"] = measure(lambda: catalog.fuzzy(typo(), 10), runs, "us")
+    result["search"] = measure(lambda: catalog.search(typo(), 10), runs, "us")
+    return result
+
+
+def bench_render(runs):
+    """Цена одного кадра интерфейса: поменялось время в игре у всех игр и ничего не поменялось"""
+    result = {}
+    for games in (1, 8, 32):
+        ui = ConsoleUI(refresh_per_second=1000000)
+        ui.console = Console(file=io.StringIO(), theme=ui.steam_theme, width=120, force_terminal=True)
+        ui.start_live()
+        session = {"status": "В сети", "username": "bench", "steam_id": 76561197960265728,
+                   "games_running": games}
+        tick = [0]
+
+        def frame(changed):
+            if changed:
+                tick[0] += 1
+            play_time = SteamManager.format_duration(tick[0])
+            rows = [{"id": 10 * i, "name": f"Game {i}", "start_time": "12:00:00", "play_time": play_time}
+                    for i in range(games)]
+            ui.update_display(session, rows, None)
+
+        result[f"changed_{games}_games"] = measure(lambda: frame(True), runs)
+        result[f"unchanged_{games}_games"] = measure(lambda: frame(False), runs, "us")
+        ui.stop_live()
+    return result
+
+
+def bench_profiles(bench, sizes, runs):
+    """Операции с хранилищем профилей при 10 / 1k / 10k профилей"""
+    result = {}
+    for size in sizes:
+        path = os.path.join(bench.tmp, f"profiles_{size}.db")
+        store = ProfileStore(path)
+        profiles = {f"user{i:05d}": {"password": f"enc-{i}", "login_key": f"key-{i}"} for i in range(size)}
+        entry = {"import_all": measure(lambda: store.import_profiles(profiles), 1)}
+        names = list(profiles)
+        entry["get"] = measure(lambda: store.get(random.choice(names)), runs, "us")
+        entry["set_fields"] = measure(lambda: store.set_fields(random.choice(names), login_key="new"), runs, "us")
+        entry["usernames"] = measure(store.usernames, max(runs // 10, 5))
+        entry["export_all"] = measure(store.export_profiles, max(runs // 20, 3))
+        store.close()
+
+        # То же через ProfileManager: шифрование Fernet поверх хранилища, ключ уже выведен
+        manager = ProfileManager(os.path.join(bench.tmp, f"manager_{size}"))
+        manager.store.import_profiles(profiles)
+        manager.key
+        entry["manager_save"] = measure(lambda: manager.save_profile(random.choice(names), "password"), runs, "us")
+        manager.save_profile(names[0], "password")
+        entry["manager_load"] = measure(lambda: manager.load_profile(names[0]), runs, "us")
+        result[str(size)] = entry
+    return result
+
+
+def bench_sessions(bench, counts, idle_seconds):
+    """Память и CPU на сессию при росте числа сессий в одном пуле"""
+    result = {}
+    resolver = bench.resolver("sessions")
+    resolver.resolve_many([730, 440, 570])
+
+    def run_pool(count, traced):
+        ledger = PlaytimeLedger(os.path.join(bench.tmp, f"ledger_{count}_{traced}.db"))
+        pool = SessionPool(manager_factory=lambda events: bench.manager(resolver, events), ledger=ledger)
+        if traced:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0] if traced else 0
+        cpu_before, wall_before = time.process_time(), time.perf_counter()
+        for i in range(count):
+            pool.add_session(f"bench{i:05d}", "password", [730, 440, 570])
+        pool.wait_logins()
+        entry = {
+            "online": pool.online_count(),
+            "bring_up_seconds": time.perf_counter() - wall_before,
+            "bring_up_cpu_ms_per_session": (time.process_time() - cpu_before) * 1000 / count,
+        }
+        if traced:
+            entry["traced_kb_per_session"] = (tracemalloc.get_traced_memory()[0] - before) / 1024 / count
+            tracemalloc.stop()
+        else:
+            cpu_before = time.process_time()
+            gevent.sleep(idle_seconds)
+            entry["idle_cpu_percent_per_session"] = ((time.process_time() - cpu_before) / idle_seconds
+                                                     * 100 / count)
+            budget = pool.measure_budget()
+            entry["rss_kb_per_session"] = budget["rss_per_session_kb"]
+        pool.stop()
+        return entry
+
+    for count in counts:
+        entry = run_pool(count, traced=False)
+        entry.update(run_pool(count, traced=True))
+        result[str(count)] = entry
+    return result
+
+
+def git_revision():
+    """Коммит, на котором гоняли, чтобы было с чем сравнивать"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous, threshold, path=()):
+    """Сравнение медиан с прошлым прогоном, возвращает строки о замедлениях"""
+    regressions = []
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if old is None:
+            continue
+        if isinstance(value, dict) and "median" in value and isinstance(old, dict) and old.get("median"):
+            ratio = value["median"] / old["median"]
+            if ratio > 1 + threshold:
+                regressions.append(f"{'.'.join(path + (key,))}: {old['median']:.3f} -> "
+                                   f"{value['median']:.3f} {value['unit']} (x{ratio:.2f})")
+        elif isinstance(value, dict):
+            regressions.extend(compare(value, old, threshold, path + (key,)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="меньше прогонов и размеров, для быстрой проверки")
+    parser.add_argument("--output", default="bench_results.json", help="куда писать JSON с результатами")
+    parser.add_argument("--compare", help="JSON прошлого прогона: покажет, что стало медленнее")
+    parser.add_argument("--threshold", type=float, default=0.2, help="замедление медианы, которое считаем регрессией")
+    parser.add_argument("--store-latency", type=float, default=0.02, help="задержка заглушки стора, с")
+    args = parser.parse_args()
+
+    runs = 50 if args.quick else 500
+    bench = Bench(args.store_latency)
+    try:
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "quick": args.quick,
+                "store_latency": args.store_latency,
+            },
+            "commands": bench_commands(bench, runs),
+            "names": bench_names(bench, 20 if args.quick else 100),
+            "render": bench_render(runs // 5),
+            "catalog": bench_catalog(bench, 20000 if args.quick else 150000, runs),
+            "profiles": bench_profiles(bench, (10, 1000) if args.quick else (10, 1000, 10000), runs),
+            "sessions": bench_sessions(bench, (1, 10, 100) if args.quick else (1, 10, 100, 1000),
+                                       1 if args.quick else 5),
+        }
+    finally:
+        bench.close()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps({key: value for key, value in report.items() if key != "meta"}, ensure_ascii=False, indent=2))
+    print(f"Результаты: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"Медленнее: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
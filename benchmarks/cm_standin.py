@@ -0,0 +1,498 @@
+"""
+Локальный заменитель CM-сервера Steam для нагрузочных тестов и проверки переподключений.
+
+Говорит на том же протоколе, что и настоящий CM (кадры VT01, шифрование канала, protobuf-сообщения),
+так что к нему подключается обычный steam.client.SteamClient. Канал шифруется своим RSA-ключом:
+процесс-клиент должен ему доверять (CMStandIn.trust / trust_key_file) - это подмена публичного
+ключа Steam только для теста, в рабочем процессе так делать нельзя.
+
+Отдельным процессом: python -m benchmarks.cm_standin --port 27020 --key-file standin.pem [--drop-every 60]
+"""
+import os
+import time
+import random
+import socket
+import struct
+import logging
+import argparse
+import base64
+import binascii
+from collections import Counter
+
+import gevent
+import vdf
+from gevent.server import StreamServer
+from Cryptodome.Cipher import PKCS1_OAEP
+from Cryptodome.Hash import SHA1
+from Cryptodome.PublicKey import RSA
+from steam.enums import EResult, EUniverse
+from steam.enums.emsg import EMsg
+from steam.core import crypto
+from steam.core.msg import Msg, MsgProto, get_um
+from steam.guard import generate_twofactor_code_for_time
+from steam.steamid import SteamID
+from steam.utils.proto import is_proto, clear_proto_bit
+
+log = logging.getLogger("zetpar.cm_standin")
+
+MAGIC = b"VT01"
+FRAME = struct.Struct("<I4s")
+
+
+def trust_key(public_key):
+    """Клиенты этого процесса будут шифровать ключ канала ключом заменителя, а не Steam"""
+    crypto.UniverseKey.Public = public_key
+
+
+def trust_key_file(path):
+    """То же по файлу ключа, когда заменитель запущен отдельным процессом"""
+    with open(path, "rb") as f:
+        trust_key(RSA.import_key(f.read()).publickey())
+
+
+def point_client(client, address):
+    """Настройка SteamClient на заменитель: только его адрес и без похода в WebAPI/DNS за списком"""
+    client.cm_servers.clear()
+    client.cm_servers.merge_list([address])
+    client.cm_servers.last_updated = time.time()  # Чтобы не подхватился cm_servers.json из папки сентри
+    client.auto_discovery = False
+    return client
+
+
+class AccountState:
+    """Что заменитель знает об аккаунте"""
+
+    __slots__ = ("name", "steam_id", "logons", "games_played", "games_played_messages",
+                 "heartbeats", "login_keys", "connection")
+
+    def __init__(self, name, steam_id):
+        self.name = name
+        self.steam_id = steam_id
+        self.logons = 0
+        self.games_played = []
+        self.games_played_messages = 0
+        self.heartbeats = 0
+        self.login_keys = set()
+        self.connection = None
+
+
+class _Connection:
+    """Одно TCP-подключение клиента"""
+
+    # Остальное только считается, тело не разбираем
+    HANDLED = frozenset((EMsg.ClientLogon, EMsg.ClientGamesPlayed, EMsg.ClientHeartBeat,
+                         EMsg.ClientRequestFriendData, EMsg.ClientLogOff, EMsg.ClientPICSProductInfoRequest,
+                         EMsg.ServiceMethodCallFromClient))
+
+    def __init__(self, server, sock, address):
+        self.server = server
+        self.sock = sock
+        self.address = address
+        self.stream = sock.makefile("rb")
+        self.channel_key = None
+        self.channel_hmac = None
+        self.account = None
+        self.session_id = None
+        self.closed = False
+
+    def _read_frame(self):
+        header = self.stream.read(FRAME.size)
+        if len(header) < FRAME.size:
+            return None
+        length, magic = FRAME.unpack(header)
+        if magic != MAGIC:
+            return None
+        data = self.stream.read(length)
+        return data if len(data) == length else None
+
+    def send(self, message):
+        """Отправка сообщения, после рукопожатия - зашифрованного"""
+        data = message.serialize()
+        if self.channel_key is not None:
+            data = crypto.symmetric_encrypt_HMAC(data, self.channel_key, self.channel_hmac)
+        self.sock.sendall(FRAME.pack(len(data), MAGIC) + data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.account is not None and self.account.connection is self:
+            self.account.connection = None
+        try:
+            # shutdown, а не только close: makefile держит ссылку на сокет, и без него клиент обрыва не увидит
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _handshake(self):
+        """ChannelEncryptRequest -> Response с ключом сессии под нашим RSA -> Result"""
+        challenge = os.urandom(16)
+        request = Msg(EMsg.ChannelEncryptRequest)
+        request.body.protocolVersion = 1
+        request.body.universe = EUniverse.Public
+        request.body.challenge = challenge
+        if self.server.message_latency:
+            gevent.sleep(self.server.message_latency)  # Дальний CM: задержка видна уже на первом кадре
+        self.send(request)
+
+        data = self._read_frame()
+        if data is None:
+            return False
+        response = Msg(EMsg.ChannelEncryptResponse, data)
+        result = Msg(EMsg.ChannelEncryptResult)
+        try:
+            if binascii.crc32(response.body.key) & 0xffffffff != response.body.crc:
+                raise ValueError("crc")
+            secret = PKCS1_OAEP.new(self.server.key, SHA1).decrypt(response.body.key)
+            if secret[32:] != challenge:
+                raise ValueError("challenge")
+        except ValueError:
+            result.body.eresult = EResult.Fail
+            self.send(result)
+            return False
+        result.body.eresult = EResult.OK
+        self.send(result)
+        self.channel_key, self.channel_hmac = secret[:32], secret[:16]
+        return True
+
+    def serve(self):
+        try:
+            if not self._handshake():
+                return
+            while not self.closed:
+                data = self._read_frame()
+                if data is None:
+                    return
+                message = crypto.symmetric_decrypt_HMAC(data, self.channel_key, self.channel_hmac)
+                if not self._dispatch(message):
+                    return
+        except (OSError, RuntimeError, ValueError, struct.error):
+            pass  # Клиент отвалился или прислал мусор - просто закрываем
+        finally:
+            self.server._connection_closed(self)
+            self.close()
+
+    def _dispatch(self, data):
+        """Обработка одного сообщения, False - закрыть соединение"""
+        emsg_id, = struct.unpack_from("<I", data)
+        emsg = EMsg(clear_proto_bit(emsg_id))
+        self.server.message_counts[emsg.name] += 1
+        if self.server.message_latency:
+            gevent.sleep(self.server.message_latency)
+        if not is_proto(emsg_id) or emsg not in self.HANDLED:
+            return True
+        message = MsgProto(emsg, data)
+
+        if emsg == EMsg.ClientLogon:
+            return self._logon(message)
+        if self.account is None:
+            return True
+        if emsg == EMsg.ClientGamesPlayed:
+            self.account.games_played = [game.game_id for game in message.body.games_played]
+            self.account.games_played_messages += 1
+        elif emsg == EMsg.ClientHeartBeat:
+            self.account.heartbeats += 1
+        elif emsg == EMsg.ClientRequestFriendData:
+            self._persona_state(message.body.friends)
+        elif emsg == EMsg.ClientPICSProductInfoRequest:
+            self._product_info(message)
+        elif emsg == EMsg.ServiceMethodCallFromClient:
+            self._service_method(message)
+        elif emsg == EMsg.ClientLogOff:
+            return False
+        return True
+
+    def _reply(self, request, response):
+        """Ответ на job-запрос клиента"""
+        response.header.steamid = self.account.steam_id
+        response.header.client_sessionid = self.session_id
+        response.header.jobid_target = request.header.jobid_source
+        self.send(response)
+
+    def _license_list(self):
+        """ClientLicenseList после входа, как у настоящего CM"""
+        licenses = MsgProto(EMsg.ClientLicenseList)
+        licenses.body.eresult = EResult.OK
+        for package_id, (change_number, _) in self.server.libraries.get(self.account.name, {}).items():
+            entry = licenses.body.licenses.add()
+            entry.package_id = package_id
+            entry.change_number = change_number
+            entry.access_token = package_id * 7919
+        self.send(licenses)
+
+    def _product_info(self, message):
+        """PICS: состав пакетов аккаунта бинарным VDF, о приложениях - только метаданные"""
+        library = self.server.libraries.get(self.account.name, {})
+        response = MsgProto(EMsg.ClientPICSProductInfoResponse)
+        for request in message.body.packages:
+            change_number, app_ids = library.get(request.packageid, (0, []))
+            package = response.body.packages.add()
+            package.packageid = request.packageid
+            package.change_number = change_number
+            package.missing_token = request.packageid not in library
+            package.buffer = b"\x00" * 4 + vdf.binary_dumps({str(request.packageid): {
+                "packageid": request.packageid, "appids": {str(i): app_id for i, app_id in enumerate(app_ids)}}})
+        for request in message.body.apps:
+            response.body.apps.add().appid = request.appid
+        self.server.product_info_packages += len(message.body.packages)
+        self._reply(message, response)
+
+    def _service_method(self, message):
+        """Unified messages: отвечаем только Player.GetOwnedGames, остальное - ошибкой"""
+        name = message.header.target_job_name
+        response = MsgProto(EMsg.ServiceMethodResponse)
+        response.header.target_job_name = name
+        if name != "Player.GetOwnedGames#1":
+            response.header.eresult = EResult.Fail
+            response.body = get_um(name, response=True)()
+            self._reply(message, response)
+            return
+        request = get_um(name)()
+        request.ParseFromString(message.payload or b"")
+        owned = {app_id for _, app_ids in self.server.libraries.get(self.account.name, {}).values()
+                 for app_id in app_ids if app_id in self.server.games}
+        wanted = set(request.appids_filter)
+        response.header.eresult = EResult.OK
+        response.body = get_um(name, response=True)()
+        for app_id in sorted(owned):
+            if wanted and app_id not in wanted:
+                continue
+            game = response.body.games.add()
+            game.appid = app_id
+            game.playtime_forever = self.server.playtime.get((self.account.name, app_id), 0)
+            if request.include_appinfo:
+                game.name = self.server.games[app_id]
+        response.body.game_count = len(response.body.games)
+        self.server.owned_games_requests += 1
+        self._reply(message, response)
+
+    def _logon(self, message):
+        """ClientLogon: проверка ключа/кода, инъекция ошибок, ответ и новый ключ входа"""
+        server = self.server
+        name = message.body.account_name
+        account = server.account(name)
+        if server.login_latency:
+            gevent.sleep(server.login_latency)
+
+        result = server.login_result(account, message.body)
+        response = MsgProto(EMsg.ClientLogOnResponse)
+        response.body.eresult = result
+        server.login_results[result.name] += 1
+        if result != EResult.OK:
+            self.send(response)
+            return False  # Настоящий CM после ошибки входа рвет соединение
+
+        if account.connection is not None and account.connection is not self:
+            account.connection.close()  # Второй вход выбивает первую сессию, как в Steam
+        account.connection = self
+        account.logons += 1
+        self.account = account
+        self.session_id = server.next_session_id()
+
+        response.header.steamid = account.steam_id
+        response.header.client_sessionid = self.session_id
+        response.body.heartbeat_seconds = server.heartbeat_seconds
+        response.body.cell_id = 0
+        response.body.rtime32_server_time = int(time.time())
+        self.send(response)
+
+        if message.body.should_remember_password:
+            login_key = binascii.hexlify(os.urandom(10)).decode()
+            account.login_keys.add(login_key)
+            new_key = MsgProto(EMsg.ClientNewLoginKey)
+            new_key.header.steamid = account.steam_id
+            new_key.header.client_sessionid = self.session_id
+            new_key.body.unique_id = server.next_session_id()
+            new_key.body.login_key = login_key
+            self.send(new_key)
+        self._license_list()
+        return True
+
+    def _persona_state(self, steam_ids):
+        """Ответ на запрос профиля: имя = логин"""
+        state = MsgProto(EMsg.ClientPersonaState)
+        state.body.status_flags = 863
+        for steam_id in steam_ids:
+            account = self.server.by_steam_id.get(steam_id)
+            friend = state.body.friends.add()
+            friend.friendid = steam_id
+            friend.persona_state = 1
+            friend.player_name = account.name if account else str(steam_id)
+        self.send(state)
+
+
+class CMStandIn:
+    """Заменитель CM: принимает входы, записывает games_played, отдает библиотеку аккаунта
+    (лицензии, PICS пакетов, Player.GetOwnedGames), умеет рвать соединения, задерживать ответы
+    и отвечать ошибками входа"""
+
+    def __init__(self, host="127.0.0.1", port=0, key=None, login_latency=0.0, message_latency=0.0,
+                 login_errors=None, fail_rate=0.0, fail_result=EResult.ServiceUnavailable,
+                 guard_secrets=None, heartbeat_seconds=9, libraries=None, games=None):
+        self.key = key or RSA.generate(1024)  # 1024 бит: ChannelEncryptResponse везет ровно 128 байт
+        self.login_latency = login_latency
+        self.message_latency = message_latency
+        self.login_errors = dict(login_errors or {})  # логин -> EResult, которым всегда отвечать
+        self.fail_rate = fail_rate
+        self.fail_result = fail_result
+        self.guard_secrets = dict(guard_secrets or {})  # логин -> shared_secret (base64, как в maFile), тогда нужен TOTP
+        self.heartbeat_seconds = heartbeat_seconds
+        self.libraries = dict(libraries or {})  # логин -> {package_id: (change_number, [app_id])}
+        self.games = dict(games or {})  # app_id -> название; приложения не отсюда считаются DLC
+        self.playtime = {}  # (логин, app_id) -> минут
+        self.product_info_packages = 0
+        self.owned_games_requests = 0
+        self.accounts = {}
+        self.by_steam_id = {}
+        self.connections = set()
+        self.peak_connections = 0
+        self.login_results = Counter()
+        self.message_counts = Counter()
+        self._session_ids = iter(range(1, 1 << 31))
+        self._server = StreamServer((host, port), self._handle, backlog=4096)
+        self._dropper = None
+
+    @property
+    def address(self):
+        return self._server.address
+
+    def start(self):
+        self._server.start()
+        log.info("CM-заменитель слушает %s:%d", *self.address)
+        return self
+
+    def stop(self):
+        if self._dropper is not None:
+            self._dropper.kill()
+        self._server.stop(timeout=1)
+        for connection in list(self.connections):
+            connection.close()
+
+    def trust(self):
+        """Доверие ключу заменителя в этом процессе, см. trust_key"""
+        trust_key(self.key.publickey())
+
+    def save_key(self, path):
+        """Ключ в файл для клиентов из другого процесса"""
+        with open(path, "wb") as f:
+            f.write(self.key.export_key())
+        os.chmod(path, 0o600)
+
+    def next_session_id(self):
+        return next(self._session_ids)
+
+    def account(self, name):
+        """Состояние аккаунта, заводится при первом входе"""
+        account = self.accounts.get(name)
+        if account is None:
+            steam_id = int(SteamID(id=len(self.accounts) + 1, type="Individual", universe="Public", instance=1))
+            account = AccountState(name, steam_id)
+            self.accounts[name] = account
+            self.by_steam_id[steam_id] = account
+        return account
+
+    def login_result(self, account, logon):
+        """Какой EResult отдать на вход"""
+        forced = self.login_errors.get(account.name)
+        if forced is not None:
+            return EResult(forced)
+        if self.fail_rate and random.random() < self.fail_rate:
+            return EResult(self.fail_result)
+        if logon.login_key:
+            return EResult.OK if logon.login_key in account.login_keys else EResult.InvalidPassword
+        secret = self.guard_secrets.get(account.name)
+        if secret is not None:
+            if not logon.two_factor_code:
+                return EResult.AccountLoginDeniedNeedTwoFactor
+            # Часы свои, без похода в WebAPI за временем Steam
+            if logon.two_factor_code != generate_twofactor_code_for_time(base64.b64decode(secret), time.time()):
+                return EResult.TwoFactorCodeMismatch
+        return EResult.OK
+
+    def _handle(self, sock, address):
+        connection = _Connection(self, sock, address)
+        self.connections.add(connection)
+        self.peak_connections = max(self.peak_connections, len(self.connections))
+        connection.serve()
+
+    def _connection_closed(self, connection):
+        self.connections.discard(connection)
+
+    def drop(self, names=None):
+        """Обрыв соединений: указанных аккаунтов или всех, возвращает сколько оборвали"""
+        targets = [connection for connection in list(self.connections)
+                   if names is None or (connection.account is not None and connection.account.name in names)]
+        for connection in targets:
+            connection.close()
+        return len(targets)
+
+    def drop_fraction(self, fraction):
+        """Обрыв случайной доли вошедших соединений"""
+        online = [connection for connection in self.connections if connection.account is not None]
+        targets = random.sample(online, int(len(online) * fraction))
+        for connection in targets:
+            connection.close()
+        return len(targets)
+
+    def drop_every(self, interval, fraction=1.0):
+        """Периодические обрывы в фоне"""
+        def loop():
+            while True:
+                gevent.sleep(interval)
+                log.info("Обрыв: %d соединений", self.drop_fraction(fraction))
+        self._dropper = gevent.spawn(loop)
+
+    def online(self):
+        """Логины с живой сессией"""
+        return [name for name, account in self.accounts.items() if account.connection is not None]
+
+    def stats(self):
+        """Сводка для отчетов нагрузочного теста"""
+        return {
+            "connections": len(self.connections),
+            "peak_connections": self.peak_connections,
+            "accounts": len(self.accounts),
+            "online": len(self.online()),
+            "login_results": dict(self.login_results),
+            "messages": dict(self.message_counts),
+            "product_info_packages": self.product_info_packages,
+            "owned_games_requests": self.owned_games_requests,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=27020)
+    parser.add_argument("--key-file", default="standin.pem", help="RSA-ключ канала, создается, если его нет")
+    parser.add_argument("--login-latency", type=float, default=0.0, help="задержка ответа на вход, с")
+    parser.add_argument("--message-latency", type=float, default=0.0, help="задержка обработки каждого сообщения, с")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля входов, на которые ответить ошибкой")
+    parser.add_argument("--drop-every", type=float, help="рвать соединения раз в N секунд")
+    parser.add_argument("--drop-fraction", type=float, default=1.0, help="какую долю соединений рвать")
+    parser.add_argument("--stats-every", type=float, default=10.0, help="печатать сводку раз в N секунд")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    key = None
+    if os.path.exists(args.key_file):
+        with open(args.key_file, "rb") as f:
+            key = RSA.import_key(f.read())
+    server = CMStandIn(args.host, args.port, key=key, login_latency=args.login_latency,
+                       message_latency=args.message_latency, fail_rate=args.fail_rate)
+    if key is None:
+        server.save_key(args.key_file)
+    server.start()
+    if args.drop_every:
+        server.drop_every(args.drop_every, args.drop_fraction)
+    try:
+        while True:
+            gevent.sleep(args.stats_every)
+            log.info("stats %s", server.stats())
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
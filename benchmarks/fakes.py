@@ -0,0 +1,126 @@
+"""
+Подделки для бенчмарков: SteamClient без сети и HTTP-заглушка Steam Store
+"""
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import gevent
+from steam.enums import EResult
+
+
+class FakeUser:
+    """client.user, из него SteamManager берет только имя"""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeSteamClient:
+    """То, что SteamManager трогает у SteamClient, без сокетов.
+    События отдаются синхронно, games_played только записывается"""
+
+    EVENT_LOGGED_ON = "logged_on"
+    EVENT_DISCONNECTED = "disconnected"
+    EVENT_NEW_LOGIN_KEY = "new_login_key"
+
+    def __init__(self, login_result=EResult.OK, login_delay=0.0):
+        self.login_result = login_result
+        self.login_delay = login_delay
+        self.connected = False
+        self.logged_on = False
+        self.username = None
+        self.user = None
+        self.steam_id = None
+        self.login_key = None
+        self.games_played_calls = []
+        self._handlers = {}
+
+    def on(self, event, callback):
+        self._handlers.setdefault(event, []).append(callback)
+
+    def emit(self, event, *args):
+        for callback in self._handlers.get(event, ()):
+            callback(*args)
+
+    def set_credential_location(self, path):
+        pass
+
+    def login(self, username, password=None, login_key=None, auth_code=None, two_factor_code=None):
+        if self.login_delay:
+            gevent.sleep(self.login_delay)
+        self.username = username
+        if self.login_result != EResult.OK:
+            return self.login_result
+        self.connected = self.logged_on = True
+        self.user = FakeUser(username)
+        self.steam_id = 76561197960265728 + (hash(username) & 0xFFFFFF)
+        self.emit(self.EVENT_LOGGED_ON)
+        return EResult.OK
+
+    def relogin(self):
+        return self.login(self.username, login_key=self.login_key)
+
+    def games_played(self, app_ids):
+        self.games_played_calls.append(list(app_ids))
+
+    def disconnect(self):
+        """Обрыв, как если бы CM закрыл соединение"""
+        self.connected = self.logged_on = False
+        self.emit(self.EVENT_DISCONNECTED)
+
+    def logout(self):
+        self.connected = self.logged_on = False
+
+    def run_forever(self):
+        while self.connected:
+            gevent.sleep(1)
+
+
+class StoreStub:
+    """Локальный appdetails: отдает "Game <id>" с заданной задержкой, считает запросы"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._server = None
+        self._lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/appdetails"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего стора
+            wbufsize = 65536  # Заголовки и тело одним пакетом, иначе Nagle + delayed ACK добавят 40 мс
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                app_id = parse_qs(urlparse(self.path).query)["appids"][0]
+                body = json.dumps({app_id: {"success": True, "data": {"name": f"Game {app_id}"}}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,106 @@
+"""
+Безголовый режим Zetpar: без терминала, управление через Unix-сокет
+"""
+from gevent import monkey
+monkey.patch_all()  # Потоки резолвера и ротации становятся гринлетами на том же хабе, что и SteamClient
+
+import sys
+import json
+import signal
+import logging
+import argparse
+import gevent
+
+from zoblako.core.control import ControlServer, send_command
+from zoblako.core import metrics, profiling
+
+
+def run_daemon(args):
+    """Запуск пула и управляющего сокета"""
+    # steam и cryptography нужны только самому демону, ctl без них стартует в разы быстрее
+    from zoblako.core.session_pool import SessionPool, load_fleet
+    from zoblako.core.profile_manager import ProfileManager
+    from zoblako.core.events import attach_logger
+    from zoblako.core.login_pipeline import LoginPipeline
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    log = logging.getLogger("zetpar.daemon")
+
+    profile_manager = ProfileManager()
+    pool = SessionPool(pipeline=LoginPipeline(concurrency=args.login_concurrency))
+    attach_logger(pool.events)
+    profile_manager.remember_login_keys(pool.events)
+    if args.fleet:
+        for account in load_fleet(args.fleet, profile_manager):
+            if not account.get("password") and not account.get("login_key"):
+                log.error("Нет пароля для %s", account["username"])
+                continue
+            pool.add_session(account["username"], account["password"], account.get("app_ids", []),
+                             account.get("two_factor_code"), account.get("login_key"),
+                             account.get("shared_secret"))
+
+    if args.profile_spans:
+        profiling.enable_spans()
+    if args.metrics_port:
+        log.info("Метрики: http://%s:%d/metrics", *metrics.REGISTRY.serve(args.metrics_port, args.metrics_host))
+    if args.metrics_file:
+        metrics.REGISTRY.start_file_export(args.metrics_file)
+
+    control = ControlServer(pool, args.socket, profile_manager)
+    control.start()
+    log.info("Управляющий сокет: %s", args.socket)
+
+    gevent.signal_handler(signal.SIGTERM, pool.stop)
+    gevent.signal_handler(signal.SIGINT, pool.stop)
+    def log_logins():
+        pool.wait_logins()
+        log.info("logins %s", json.dumps(pool.pipeline.report()))
+
+    gevent.spawn(log_logins)
+    pool.report_budget(args.budget_interval, lambda budget: log.info("budget %s", json.dumps(budget)))
+    try:
+        pool.serve_forever()
+    finally:
+        control.stop()
+        metrics.REGISTRY.stop()
+        log.info("Демон остановлен")
+
+
+def run_ctl(args):
+    """Отправка команды работающему демону"""
+    response = send_command(json.loads(args.request), args.socket)
+    print(json.dumps(response, ensure_ascii=False, indent=2))
+    return 0 if response.get("ok") else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zetpar без терминала")
+    parser.add_argument("--socket", default=ControlServer.DEFAULT_SOCKET, help="путь к управляющему сокету")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="запустить демон")
+    run_parser.add_argument("--fleet", help="JSON со списком аккаунтов, как для main.py --fleet")
+    run_parser.add_argument("--budget-interval", type=int, default=300,
+                            help="раз во сколько секунд писать в лог замер памяти/CPU")
+    run_parser.add_argument("--login-concurrency", type=int, default=16,
+                            help="сколько аккаунтов входят одновременно")
+    run_parser.add_argument("--metrics-port", type=int, help="отдавать метрики Prometheus на этом порту")
+    run_parser.add_argument("--metrics-host", default="127.0.0.1", help="адрес для метрик, по умолчанию только локально")
+    run_parser.add_argument("--metrics-file", help="или писать метрики в файл (textfile collector)")
+    run_parser.add_argument("--profile-spans", action="store_true",
+                            help="замерять время операций SteamManager/интерфейса (как ZETPAR_PROFILE=1)")
+
+    ctl_parser = subparsers.add_parser("ctl", help="отправить команду демону")
+    ctl_parser.add_argument("request", help='JSON-команда, например \'{"cmd": "status"}\'')
+
+    args = parser.parse_args()
+    if args.command == "ctl":
+        return run_ctl(args)
+    if args.command == "run":
+        return run_daemon(args)
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,19 +2,14 @@
 Главный файл приложения Zetpar
 """
 import os
-import time
-import threading
+import sys
 import platform
 from getpass import getpass
-from rich.console import Console
-from rich.panel import Panel
-from rich.text import Text
-from zoblako.core.steam_client import SteamManager
-from zoblako.ui.console import ConsoleUI
-from zoblako.core.profile_manager import ProfileManager
-import sys
-import colorama
-colorama.init()
+from zoblako.core import metrics, profiling
+
+# rich, colorama, steam (gevent, protobuf, крипта) и cryptography грузятся внутри функций, где нужны:
+# --import-profiles/--export-profiles и --fleet стартуют без rich, а python main.py без аргументов
+# не платит за импорты до первого кадра
 
 def clear_screen():
     """Очистка экрана для разных ОС"""
@@ -25,10 +20,21 @@ def clear_screen():
 
 def print_help(console_ui):
     """Вывод списка команд"""
+    from rich.panel import Panel
+    from rich.text import Text
+
     commands = {
-        "start <app_id>": "Запустить игру",
-        "stop <app_id>": "Остановить игру",
-        "stopall": "Остановить все игры",
+        "start <app_id> ...": "Запустить игры",
+        "stop <app_id> ...": "Остановить игры",
+        "stopall": "Остановить все игры и ротацию",
+        "rotate <app_id[:вес]> ...": "Крутить игры по очереди слотами по 30 мин",
+        "rotate stop": "Остановить ротацию",
+        "stats": "Наиграно по играм за все время",
+        "library": "Синхронизировать библиотеку аккаунта",
+        "idle owned": "Запустить все игры библиотеки",
+        "idle under <часов>": "Запустить игры, где наиграно меньше N часов",
+        "search <название>": "Найти App ID по названию в локальном каталоге",
+        "profile <секунды>": "Снять профиль CPU и памяти в data/diagnostics",
         "help": "Показать это сообщение",
         "exit": "Выйти из программы"
     }
@@ -36,13 +42,66 @@ def print_help(console_ui):
     help_text.append("\nДоступные команды:", style="steam_blue")
     
     for cmd, desc in commands.items():
-        help_text.append(f"\n  {cmd:<15}", style="steam_gray")
+        help_text.append(f"\n  {cmd:<26}", style="steam_gray")
         help_text.append(f" - {desc}", style="steam_blue")
     
     help_text.append("\n")
     console_ui.console.print(Panel(help_text, border_style="steam_blue"))
 
-def handle_command(cmd, steam_manager, console_ui):
+def print_stats(steam_manager, ledger, console_ui):
+    """Наигранное время аккаунта по играм"""
+    from rich.panel import Panel
+    from rich.text import Text
+
+    totals = ledger.total_by_app(steam_manager.client.username)
+    if not totals:
+        console_ui.display_error("Пока ничего не наиграно")
+        return
+    names = steam_manager.get_game_names(totals)
+    stats_text = Text()
+    for app_id, seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+        stats_text.append(f"\n  {names[app_id]} ({app_id})", style="steam_gray")
+        stats_text.append(f" - {steam_manager.format_duration(seconds)}", style="steam_blue")
+    stats_text.append("\n")
+    console_ui.console.print(Panel(stats_text, title="Наиграно", border_style="steam_blue"))
+
+def print_search(text, console_ui):
+    """Поиск App ID по названию в локальном каталоге, без сети"""
+    from rich.panel import Panel
+    from rich.text import Text
+    from zoblako.core.catalog import get_default_catalog
+
+    catalog = get_default_catalog()
+    if not len(catalog):
+        console_ui.display_error("Каталог пуст, обновите его: python main.py --refresh-catalog")
+        return
+    found = catalog.search(text)
+    if not found:
+        console_ui.display_error(f"По запросу '{text}' ничего не нашлось")
+        return
+    search_text = Text()
+    for app_id, name in found:
+        search_text.append(f"\n  {app_id:>8}", style="steam_blue")
+        search_text.append(f"  {name}", style="steam_gray")
+    search_text.append("\n")
+    console_ui.console.print(Panel(search_text, title=f"Поиск: {text}", border_style="steam_blue"))
+
+def start_profile(seconds, console_ui):
+    """Профилирование в отдельном гринлете, чтобы не блокировать ввод"""
+    import gevent
+
+    def run():
+        try:
+            files = profiling.capture(seconds)
+        except (RuntimeError, ValueError, OSError) as e:
+            console_ui.display_error(f"Профилирование не удалось: {e}")
+            return
+        console_ui.display_success("Профиль готов:\n" + "\n".join(files.values()))
+
+    gevent.spawn(run)
+    console_ui.display_success(f"Профилирование на {seconds:g} с запущено")
+
+def handle_command(cmd, steam_manager, console_ui, ledger=None):
     """Обработка команд пользователя"""
     cmd = cmd.strip().lower()
     
@@ -51,73 +110,178 @@ def handle_command(cmd, steam_manager, console_ui):
         return True
     elif cmd == "exit":
         return False
+    elif cmd == "stats" and ledger is not None:
+        print_stats(steam_manager, ledger, console_ui)
+        return True
+    elif cmd == "library":
+        report = steam_manager.sync_library(ledger)
+        if report is not None:
+            console_ui.display_success(
+                f"Библиотека: {report['games']} игр, {report['packages']} пакетов "
+                f"(изменилось пакетов {report['packages_changed']}, запросов в Steam {report['requests']})")
+        return True
+    elif cmd == "idle owned" or cmd.startswith("idle under"):
+        max_hours = None
+        if cmd != "idle owned":
+            try:
+                max_hours = float(cmd.split()[2])
+            except (IndexError, ValueError):
+                console_ui.display_error("Формат: idle under <часов>")
+                return True
+        success, message = steam_manager.idle_owned(max_hours, ledger)
+        if success:
+            console_ui.display_success(message)
+        else:
+            console_ui.display_error(message)
+        return True
+    elif cmd.startswith("search"):
+        text = cmd[len("search"):].strip()
+        if not text:
+            console_ui.display_error("Формат: search <название>")
+            return True
+        print_search(text, console_ui)
+        return True
+    elif cmd.startswith("profile"):
+        try:
+            seconds = float(cmd.split()[1])
+        except (IndexError, ValueError):
+            console_ui.display_error("Формат: profile <секунды>")
+            return True
+        start_profile(seconds, console_ui)
+        return True
     elif cmd == "stopall":
+        steam_manager.stop_rotation()
         steam_manager.stop_all_games()
         console_ui.display_success("Все игры остановлены")
         return True
-    elif cmd.startswith("start "):
+    elif cmd == "rotate stop":
+        if steam_manager.stop_rotation():
+            console_ui.display_success("Ротация остановлена")
+        else:
+            console_ui.display_error("Ротация не запущена")
+        return True
+    elif cmd.startswith("rotate "):
+        app_ids, weights = [], {}
         try:
-            app_id = int(cmd.split(" ")[1]) 
-            success, message = steam_manager.start_game(app_id)
-            if success:
-                console_ui.display_success(message)
-            else:
-                console_ui.display_error(message)
+            for item in cmd.split()[1:]:
+                app_id, _, weight = item.partition(":")
+                app_ids.append(int(app_id))
+                if weight:
+                    weights[int(app_id)] = float(weight)
         except ValueError:
-            console_ui.display_error("Неверный формат App ID. Используйте только цифры.")
-        except IndexError:
-            console_ui.display_error("Укажите App ID игры")
+            console_ui.display_error("Формат: rotate <app_id>[:вес] ...")
+            return True
+        success, message = steam_manager.start_rotation(app_ids, weights)
+        if success:
+            console_ui.display_success(message)
+        else:
+            console_ui.display_error(message)
         return True
-    elif cmd.startswith("stop "):
+    elif cmd.startswith("start ") or cmd.startswith("stop "):
         try:
-            app_id = int(cmd.split(" ")[1])  
-            success, message = steam_manager.stop_game(app_id)
+            app_ids = [int(app_id) for app_id in cmd.split()[1:]]
+        except ValueError:
+            console_ui.display_error("Неверный формат App ID. Используйте только цифры.")
+            return True
+        if not app_ids:
+            console_ui.display_error("Укажите App ID игры")
+            return True
+        if cmd.startswith("start "):
+            results = steam_manager.start_games(app_ids)
+        else:
+            results = [steam_manager.stop_game(app_id) for app_id in app_ids]
+        for success, message in results:
             if success:
                 console_ui.display_success(message)
             else:
                 console_ui.display_error(message)
-        except ValueError:
-            console_ui.display_error("Неверный формат App ID. Используйте только цифры.")
-        except IndexError:
-            console_ui.display_error("Укажите App ID игры")
         return True
     else:
         console_ui.display_error("Неизвестная команда. Введите 'help' для списка команд")
         return True
 
-def update_ui(steam_manager, console_ui, should_run):
-    """Обновление интерфейса"""
-    last_update = 0
-    update_interval = 5  
-    
-    while should_run[0]:
-        try:
-            current_time = time.time()
-            if current_time - last_update >= update_interval:
+def update_ui(steam_manager, console_ui):
+    """Гринлет обновления интерфейса"""
+    import gevent
+    from gevent.event import Event
+
+    # Просыпаемся по событиям SteamManager, а раз в кадр - только пока идут игры и тикает время.
+    # Без игр гринлет спит на событии, и хаб в простое не делает ничего
+    frame_interval = 1 / console_ui.refresh_per_second
+    wakeup = Event()
+    handler = steam_manager.events.subscribe(None, lambda event: wakeup.set())
+    try:
+        while True:
+            try:
+                wakeup.clear()
                 session_info = steam_manager.get_session_info()
-                games_info = steam_manager.get_current_games()
-                console_ui.update_display(session_info, games_info)
-                last_update = current_time
-            time.sleep(0.1)  
-        except Exception as e:
-            print(f"Ошибка обновления интерфейса: {e}")
-            time.sleep(5)
+                games_info = [steam_manager.format_game(game) for game in steam_manager.get_current_games()]
+                schedule_info = steam_manager.get_schedule()
+                console_ui.update_display(session_info, games_info, schedule_info)
+                wakeup.wait(frame_interval if steam_manager.running_games else None)
+            except Exception as e:
+                print(f"Ошибка обновления интерфейса: {e}")
+                gevent.sleep(5)
+    finally:
+        steam_manager.events.unsubscribe(None, handler)
+
+def command_reader():
+    """Чем читать строку команды, не вставая всем хабом.
+    В терминале - input (ради readline) в пуле потоков хаба, гринлет просто ждет строку.
+    Из пайпа - файл gevent: чтение отдает хаб другим гринлетам, а kill гринлета его сразу отменяет,
+    и на выходе не остается потока, застрявшего в чтении stdin"""
+    import gevent
+    from gevent.fileobject import FileObjectPosix
+
+    if sys.stdin.isatty():
+        threadpool = gevent.get_hub().threadpool
+
+        def read_line(prompt):
+            try:
+                return input(prompt)
+            except EOFError:
+                return None  # Исключение из пула потоков хаб еще и печатает, возвращаем признак
+
+        def read(prompt):
+            line = threadpool.apply(read_line, (prompt,))
+            if line is None:
+                raise EOFError
+            return line
+        return read
+
+    stdin = FileObjectPosix(sys.stdin.fileno(), "r", close=False)
 
-def handle_commands(steam_manager, console_ui, should_run):
-    """Поток обработки команд"""
-    while should_run[0]:
+    def read(prompt):
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+        line = stdin.readline()
+        if not line:
+            raise EOFError
+        return line.rstrip("\n")
+    return read
+
+def handle_commands(steam_manager, console_ui, stopped, ledger=None):
+    """Гринлет обработки команд, stopped - gevent Event, который он ставит на exit и конец ввода"""
+    read = command_reader()
+    while not stopped.is_set():
         try:
-            cmd = input("\n> ").strip()
-            if not cmd:  
+            cmd = console_ui.read_command(read=read).strip()
+            if not cmd:
                 continue
-            if not handle_command(cmd, steam_manager, console_ui):
-                should_run[0] = False
+            with profiling.timed("commands.handle"):
+                keep_running = handle_command(cmd, steam_manager, console_ui, ledger)
+            if not keep_running:
                 break
+        except EOFError:
+            break  # Ctrl+D или закрытый stdin - иначе input сразу падал бы снова и снова
         except Exception as e:
             console_ui.display_error(f"Ошибка обработки команды: {e}")
+    stopped.set()
 
 def get_styled_input(console_ui, prompt, password=False):
     """Получение ввода с стилизацией Steam"""
+    from rich.panel import Panel
+
     try:
         console_ui.console.print(Panel(prompt, style="steam_blue", border_style="steam_blue"))
         if password:
@@ -130,6 +294,8 @@ def get_styled_input(console_ui, prompt, password=False):
 
 def select_profile(profile_manager, console_ui):
     """Выбор профиля"""
+    from rich.panel import Panel
+
     profiles = profile_manager.get_profiles()
     
     if not profiles:
@@ -158,8 +324,72 @@ def select_profile(profile_manager, console_ui):
             
         console_ui.display_error("Неверный выбор. Попробуйте снова.")
 
-def main():
-    steam_manager = SteamManager()
+def print_login_report(report):
+    """Итог конвейера входа для --fleet"""
+    rate = f"{report['per_minute']:.1f}/мин" if report["per_minute"] else "-"
+    print(f"Вошли {report['ok']}/{report['accounts']} за {report['seconds']:.1f} с ({rate}), "
+          f"попыток: {report['attempts']}")
+    for username, result in report["failed"].items():
+        print(f"  не вошел {username}: {result}", file=sys.stderr)
+
+def patch_gevent():
+    """monkey.patch_all для режимов с SteamClient (--fleet и интерактивный), как в daemon.py:
+    потоки ротации, журнала и резолвера становятся гринлетами, а не лезут в сокеты SteamClient
+    из чужих потоков ОС, sleep и сокеты ведут себя одинаково во всех точках входа.
+    Патчим здесь, а не в начале файла, чтобы --import-profiles и прочие разовые команды не платили за gevent;
+    до этого места из модулей с потоками импортирован только threading, и ни одного потока еще нет"""
+    from gevent import monkey
+    monkey.patch_all()
+
+def run_fleet(path):
+    """Запуск всех аккаунтов из файла в одном процессе. Без интерфейса, так что вывод - обычный print"""
+    import signal
+    import gevent
+    from zoblako.core.session_pool import SessionPool, load_fleet
+    from zoblako.core.profile_manager import ProfileManager
+
+    profile_manager = ProfileManager()
+    pool = SessionPool()
+    profile_manager.remember_login_keys(pool.events)
+    for account in load_fleet(path, profile_manager):
+        if not account.get("password") and not account.get("login_key"):
+            print(f"Нет пароля для {account['username']}", file=sys.stderr)
+            continue
+        pool.add_session(account["username"], account["password"], account.get("app_ids", []),
+                         account.get("two_factor_code"), account.get("login_key"), account.get("shared_secret"))
+
+    pool.wait_logins()
+    for session in pool.sessions.values():
+        print(f"{session.username}: {session.status}")
+    print_login_report(pool.pipeline.report())
+
+    def print_budget(budget):
+        print(
+            f"сессий: {budget['online']}/{budget['sessions']}, "
+            f"RSS: {budget['rss_total_mb']:.1f} МБ ({budget['rss_per_session_kb']:.0f} КБ/сессия), "
+            f"CPU: {budget['cpu_percent_total']:.2f}% ({budget['cpu_percent_per_session']:.4f}%/сессия)",
+            flush=True
+        )
+
+    # После monkey.patch_all Ctrl+C не долетает до serve_forever как KeyboardInterrupt,
+    # поэтому останавливаемся так же, как демон: сигнал -> pool.stop
+    gevent.signal_handler(signal.SIGTERM, pool.stop)
+    gevent.signal_handler(signal.SIGINT, pool.stop)
+    pool.report_budget(60, print_budget)
+    pool.serve_forever()
+
+def run_interactive():
+    """Обычный запуск с терминалом: баннер, выбор профиля, вход, живой интерфейс.
+    Все крутится гринлетами на одном хабе: Steam-клиент с heartbeat, интерфейс, команды, ротация и журнал"""
+    import signal
+    import gevent
+    from gevent.event import Event
+    import colorama
+    from rich.panel import Panel
+    from zoblako.ui.console import ConsoleUI
+    from zoblako.core.profile_manager import ProfileManager
+
+    colorama.init()
     console_ui = ConsoleUI()
     profile_manager = ProfileManager()
     
@@ -183,35 +413,91 @@ def main():
         if save:
             if profile_manager.save_profile(username, password):
                 console_ui.display_success("Профиль сохранен")
+                shared_secret = get_styled_input(
+                    console_ui, "shared_secret из maFile для кодов Steam Guard (Enter - пропустить)", password=True)
+                if shared_secret:
+                    profile_manager.save_shared_secret(username, shared_secret.strip())
             else:
                 console_ui.display_error("Не удалось сохранить профиль")
 
-    if not steam_manager.authenticate(username, password, console_ui):
+    # steam (protobuf, крипта, ~0.5 с) грузим здесь, уже после ввода, а не фоном: после monkey.patch_all
+    # импорт в пуле потоков хаба падает на пропатченном subprocess (find_library в pycryptodome),
+    # а обычный поток до патча ломает блокировки импорта, пока patch_all их подменяет
+    from zoblako.core.steam_client import SteamManager
+    from zoblako.core.supervisor import ConnectionSupervisor
+    from zoblako.core.playtime import PlaytimeLedger
+
+    steam_manager = SteamManager()
+    # Ключ входа храним только для сохраненных профилей
+    if username in profile_manager.get_profiles():
+        profile_manager.remember_login_keys(steam_manager.events)
+    if not steam_manager.authenticate(username, password, console_ui,
+                                      login_key=profile_manager.load_login_key(username),
+                                      shared_secret=profile_manager.load_shared_secret(username)):
         console_ui.display_error("Ошибка авторизации")
         return
+    ConnectionSupervisor(steam_manager)
+    ledger = PlaytimeLedger()
+    ledger.attach(steam_manager.events)
+    ledger.start()
+    if steam_manager.resume_rotation():
+        console_ui.display_success("Ротация продолжена с места остановки")
     print_help(console_ui)
-    should_run = [True]
-    ui_thread = threading.Thread(
-        target=update_ui,
-        args=(steam_manager, console_ui, should_run),
-        daemon=True
-    )
-    ui_thread.start()
-    cmd_thread = threading.Thread(
-        target=handle_commands,
-        args=(steam_manager, console_ui, should_run),
-        daemon=True
-    )
-    cmd_thread.start()
+    console_ui.start_live()
+
+    # Ctrl+C и SIGTERM не бросают KeyboardInterrupt в случайный гринлет, а ставят stopped,
+    # и дальше выход всегда идет одним путем
+    stopped = Event()
+    signal_handlers = [gevent.signal_handler(signum, stopped.set) for signum in (signal.SIGINT, signal.SIGTERM)]
+    workers = [gevent.spawn(update_ui, steam_manager, console_ui),
+               gevent.spawn(handle_commands, steam_manager, console_ui, stopped, ledger)]
     try:
-        while should_run[0]:
-            steam_manager.update_status()
-    except KeyboardInterrupt:
+        stopped.wait()
+    finally:
+        # Сначала ввод и интерфейс, потом Steam (ротация сохраняется, игры останавливаются), журнал последним,
+        # чтобы в него попало все наигранное. input в пуле потоков хаба так и висит до выхода процесса
+        gevent.killall(workers)
+        for handler in signal_handlers:
+            handler.cancel()
+        console_ui.stop_live()
         steam_manager.logout()
-        sys.exit(0)
-    except Exception as e:
-        console_ui.display_error(f"Ошибка обновления статуса Steam: {e}")
-        time.sleep(1)
+        ledger.stop()
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--fleet":
+        patch_gevent()
+        metrics.REGISTRY.start_from_env()  # Сервер метрик после патча, чтобы и он крутился на хабе
+        run_fleet(sys.argv[2])
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == "--set-shared-secret":
+        from zoblako.core.profile_manager import ProfileManager
+        profile_manager = ProfileManager()
+        # Без профиля получилась бы запись без пароля, и вход по ней падал бы
+        if sys.argv[2] not in profile_manager.get_profiles():
+            print(f"Профиля {sys.argv[2]} нет, сначала войдите с ним и сохраните профиль", file=sys.stderr)
+            sys.exit(1)
+        # Секрет не в аргументах, чтобы не светился в ps и истории
+        if profile_manager.save_shared_secret(sys.argv[2], getpass("shared_secret: ").strip()):
+            print(f"shared_secret для {sys.argv[2]} сохранен")
+        return
+    if len(sys.argv) > 2 and sys.argv[1] in ("--import-profiles", "--export-profiles"):
+        from zoblako.core.profile_manager import ProfileManager
+        profile_manager = ProfileManager()
+        if sys.argv[1] == "--import-profiles":
+            print(f"Импортировано профилей: {profile_manager.import_profiles(sys.argv[2])}")
+        else:
+            print(f"Выгружено профилей: {profile_manager.export_profiles(sys.argv[2])}")
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "--refresh-catalog":
+        from zoblako.core.catalog import AppCatalog
+        # Без аргумента - свежий GetAppList, с аргументом - файл снимка (TSV или JSON от GetAppList)
+        catalog = AppCatalog()
+        print(f"Приложений в каталоге: {catalog.refresh(*sys.argv[2:3])}")
+        return
+
+    patch_gevent()
+    metrics.REGISTRY.start_from_env()
+    run_interactive()
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,265 @@
+"""
+Модуль для локального каталога приложений Steam: название по app_id и поиск app_id по названию без сети
+"""
+import os
+import re
+import json
+import math
+import time
+import heapq
+import bisect
+import threading
+from array import array
+
+from zoblako.core.storage import process_default
+
+_NOT_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Ключ для поиска: регистр, ™/®/двоеточия и прочая пунктуация не важны"""
+    return _NOT_WORD.sub(" ", text.casefold()).strip()
+
+
+def trigrams(key):
+    """Триграммы ключа, слова с краев добиваются пробелами, чтобы короткие слова тоже давали триграммы"""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AppCatalog:
+    """Каталог приложений Steam в памяти.
+
+    app_id отсортированы в array('I'), название ищется бисекцией. Для поиска по началу названия -
+    отсортированные нормализованные ключи и та же бисекция. Для неточного поиска - индекс слов
+    и триграммы по словарю слов (_ensure_words), строится при первом таком поиске.
+    На диске - TSV "app_id<TAB>название" (снимок ISteamApps/GetAppList), обновляется refresh()"""
+
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'cache', 'app_catalog.tsv')
+    APP_LIST_URL = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+    TIMEOUT = (3.05, 60)  # Список на 150k+ приложений весит мегабайты
+    MIN_SIMILARITY = 0.3
+    PREFIX_WORDS = 50  # Сколько слов словаря максимум подставляем под недописанное слово
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        self._ids = array('I')  # app_id по возрастанию
+        self._names = []  # название для _ids[i]
+        self._keys = []  # нормализованные названия по возрастанию
+        self._key_apps = array('I')  # номер в _ids для _keys[i]
+        self._words = None  # слово -> array('I') номеров в _keys, строится при первом неточном поиске
+        self._vocabulary = None  # различные слова по возрастанию
+        self._word_trigrams = None  # триграмма -> array('I') номеров в _vocabulary
+        self._word_trigram_counts = None
+        self._lock = threading.Lock()
+        self.loaded_at = 0.0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _build(self, entries):
+        """Сборка индексов из {app_id: название}"""
+        ids = array('I', sorted(entries))
+        names = [entries[app_id] for app_id in ids]
+        keyed = sorted((normalize(name), i) for i, name in enumerate(names))
+        keyed = [(key, i) for key, i in keyed if key]
+        with self._lock:
+            self._ids, self._names = ids, names
+            self._keys = [key for key, _ in keyed]
+            self._key_apps = array('I', (i for _, i in keyed))
+            self._words = self._vocabulary = self._word_trigrams = self._word_trigram_counts = None
+            self.loaded_at = time.time()
+
+    def load(self, path=None):
+        """Чтение снимка: TSV или JSON в формате GetAppList. Нет файла - каталог пустой, False"""
+        path = path or self.path
+        try:
+            with open(path, encoding="utf-8") as f:
+                if path.endswith(".json"):
+                    entries = self._parse_app_list(json.load(f))
+                else:
+                    entries = {}
+                    for line in f:
+                        app_id, _, name = line.rstrip("\n").partition("\t")
+                        if name:
+                            entries[int(app_id)] = name
+        except (OSError, ValueError):
+            return False
+        self._build(entries)
+        return bool(entries)
+
+    @staticmethod
+    def _parse_app_list(data):
+        """{app_id: название} из ответа GetAppList, пустые названия (их там тысячи) пропускаем"""
+        return {int(app["appid"]): app["name"].strip()
+                for app in data["applist"]["apps"] if app.get("name", "").strip()}
+
+    def save(self):
+        """Атомарная запись снимка"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for app_id, name in zip(self._ids, self._names):
+                # Табы и переводы строк в названиях бывают, TSV они бы сломали
+                f.write(f"{app_id}\t{' '.join(name.split())}\n")
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, source=APP_LIST_URL, session=None, timeout=TIMEOUT):
+        """Обновление из GetAppList (URL) или из файла снимка, возвращает число приложений"""
+        if not source.startswith(("http://", "https://")):
+            if not self.load(source):
+                raise ValueError(f"Не удалось прочитать каталог из {source}")
+        else:
+            import requests
+            response = (session or requests).get(source, timeout=timeout)
+            response.raise_for_status()
+            self._build(self._parse_app_list(response.json()))
+        self.save()
+        return len(self)
+
+    def name(self, app_id):
+        """Название по app_id, None - в каталоге нет"""
+        ids = self._ids
+        i = bisect.bisect_left(ids, app_id)
+        if i < len(ids) and ids[i] == app_id:
+            return self._names[i]
+        return None
+
+    def get_many(self, app_ids):
+        """{app_id: название} для тех, что есть в каталоге"""
+        found = {}
+        for app_id in app_ids:
+            name = self.name(int(app_id))
+            if name is not None:
+                found[int(app_id)] = name
+        return found
+
+    def prefix(self, text, limit=20):
+        """Приложения, название которых начинается с text, [(app_id, название)] по алфавиту"""
+        key = normalize(text)
+        if not key:
+            return []
+        keys = self._keys
+        start = bisect.bisect_left(keys, key)
+        end = bisect.bisect_left(keys, key + "\uffff", start, min(len(keys), start + limit))
+        return [self._entry(self._key_apps[i]) for i in range(start, end)]
+
+    def _entry(self, i):
+        return self._ids[i], self._names[i]
+
+    def _ensure_words(self):
+        """Индекс для неточного поиска. Триграммы по целым названиям не годятся: у частых триграмм
+        (" th", "sim") списки на десятки тысяч названий. Поэтому два уровня: слово -> array('I') номеров
+        ключей, и триграммы только по словарю различных слов, которых в разы меньше, чем названий"""
+        with self._lock:
+            if self._words is not None:
+                return
+            postings = {}
+            for i, key in enumerate(self._keys):
+                for word in set(key.split()):
+                    posting = postings.get(word)
+                    if posting is None:
+                        postings[word] = posting = array('I')
+                    posting.append(i)  # Номера растут, так что списки уже отсортированы
+            vocabulary = sorted(postings)
+            grams, counts = {}, array('B')
+            for w, word in enumerate(vocabulary):
+                word_grams = trigrams(word)
+                counts.append(min(len(word_grams), 0xFF))
+                for gram in word_grams:
+                    posting = grams.get(gram)
+                    if posting is None:
+                        grams[gram] = posting = array('I')
+                    posting.append(w)
+            self._words, self._vocabulary = postings, vocabulary
+            self._word_trigrams, self._word_trigram_counts = grams, counts
+
+    def _similar_words(self, word, min_similarity, prefix=False):
+        """Слова словаря, похожие на word: {слово: сходство}. Сходство - Жаккар по триграммам.
+        Кандидаты берутся только из самых редких триграмм запроса: у слова со сходством
+        не ниже порога хотя бы одна из них обязана быть. prefix - еще и слова, начинающиеся с word
+        (последнее слово запроса обычно недописано)"""
+        found = {word: 1.0} if word in self._words else {}
+        vocabulary = self._vocabulary
+        if prefix:
+            start = bisect.bisect_right(vocabulary, word)
+            for w in range(start, min(len(vocabulary), start + self.PREFIX_WORDS)):
+                if not vocabulary[w].startswith(word):
+                    break
+                found[vocabulary[w]] = len(word) / len(vocabulary[w])
+        grams = trigrams(word)
+        postings = sorted((self._word_trigrams.get(gram, ()) for gram in grams), key=len)
+        # Общих триграмм нужно не меньше need, иначе Жаккар ниже порога даже у самого короткого слова
+        need = max(1, math.ceil(min_similarity * len(grams)))
+        seeds, rest = postings[:len(grams) - need + 1], postings[len(grams) - need + 1:]
+        shared = {}
+        for posting in seeds:
+            for w in posting:
+                shared[w] = shared.get(w, 0) + 1
+        counts = self._word_trigram_counts
+        for w, common in shared.items():
+            for posting in rest:
+                j = bisect.bisect_left(posting, w)
+                if j < len(posting) and posting[j] == w:
+                    common += 1
+            similarity = common / (len(grams) + counts[w] - common)
+            if similarity >= min_similarity and similarity > found.get(vocabulary[w], 0.0):
+                found[vocabulary[w]] = similarity
+        return found
+
+    def fuzzy(self, text, limit=20, min_similarity=MIN_SIMILARITY):
+        """Неточный поиск: [(app_id, название, сходство)] от самого похожего.
+        Каждое слово запроса ищется среди слов словаря с опечатками, в ответ идут названия, где нашлись
+        все слова запроса. Слово, с которым не остается ни одного названия, пропускаем - лучше
+        "dota 3" найдет Dota 2, чем ничего. Сходство - среднее по словам"""
+        words = normalize(text).split()
+        if not words:
+            return []
+        self._ensure_words()
+        groups = [self._similar_words(word, min_similarity, prefix=n == len(words) - 1)
+                  for n, word in enumerate(words)]
+        groups = [group for group in groups if group]
+        if not groups:
+            return []
+        # Пересечение множеств идет в C, на Python остается только оценка оставшихся кандидатов
+        groups.sort(key=lambda group: sum(len(self._words[word]) for word in group))
+        candidates = None
+        for group in groups:
+            members = set().union(*(self._words[word] for word in group))
+            narrowed = members if candidates is None else candidates & members
+            if narrowed:
+                candidates = narrowed
+        keys = self._keys
+        scored = []
+        for i in candidates:
+            key_words = keys[i].split()
+            score = sum(max((similarity for word, similarity in group.items() if word in key_words), default=0.0)
+                        for group in groups) / len(words)
+            scored.append((-score, len(keys[i]), i))
+        result = []
+        for negative_score, _, i in heapq.nsmallest(limit, scored):
+            app_id, name = self._entry(self._key_apps[i])
+            result.append((app_id, name, -negative_score))
+        return result
+
+    def search(self, text, limit=20):
+        """Поиск для команды search: число - это app_id, дальше совпадения по началу, потом неточные.
+        [(app_id, название)]"""
+        text = text.strip()
+        if text.isdigit():
+            name = self.name(int(text))
+            return [(int(text), name)] if name is not None else []
+        found = self.prefix(text, limit)
+        if len(found) < limit:
+            seen = {app_id for app_id, _ in found}
+            found += [(app_id, name) for app_id, name, _ in self.fuzzy(text, limit)
+                      if app_id not in seen][:limit - len(found)]
+        return found
+
+
+@process_default
+def get_default_catalog():
+    """Общий на процесс каталог, снимок читается при первом обращении"""
+    catalog = AppCatalog()
+    catalog.load()
+    return catalog
@@ -0,0 +1,282 @@
+"""
+Модуль для общего на процесс списка CM-серверов Steam: замер задержки, здоровье, раскладка сессий
+"""
+import os
+import json
+import time
+import random
+import struct
+import logging
+import gevent
+from gevent import socket as gsocket
+from gevent.lock import Semaphore
+from gevent.event import Event
+from steam.core.cm import CMServerList
+
+from zoblako.core import metrics
+from zoblako.core.storage import process_default
+
+log = logging.getLogger("zetpar.cm")
+
+CM_LATENCY = metrics.REGISTRY.gauge(
+    "zetpar_cm_latency_seconds", "Сглаженное время до первого сообщения CM по замерам", ("server",))
+CM_SESSIONS = metrics.REGISTRY.gauge(
+    "zetpar_cm_sessions", "Сессии на CM-сервере", ("server",))
+
+
+class CMDirectory(CMServerList):
+    """Один список CM на все SteamClient процесса вместо своего у каждого.
+    Сервера отдаются по очкам: задержка (время от connect до первого сообщения, сглаженная),
+    штраф за недавние сбои и поправка на то, сколько сессий уже сидит на сервере, чтобы флот
+    не ложился на один CM. Список лежит на диске, так что после перезапуска ранжирование уже есть,
+    а в фоне он перемеривается и раз в REFRESH_INTERVAL обновляется из WebAPI"""
+
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'cache', 'cm_servers.json')
+    REFRESH_INTERVAL = 6 * 3600
+    PROBE_INTERVAL = 600
+    PROBE_COUNT = 24  # Сколько лучших серверов перемериваем за раунд, весь список в сотни CM не нужен
+    PROBE_TIMEOUT = 3
+    CONNECT_TIMEOUT = 10  # У TCPConnection своего нет, и на молчащем CM клиент висит минутами
+    UNKNOWN_LATENCY = 0.5  # Не мерянный сервер - где-то посередине, не впереди мерянных быстрых
+    FAIL_PENALTY = 2.0  # Секунд к очкам за каждый сбой подряд
+    SESSIONS_PER_SERVER = 50  # При такой загрузке очки сервера удваиваются
+    SMOOTHING = 0.3
+
+    def __init__(self, path=None, probe_interval=PROBE_INTERVAL, refresh_interval=REFRESH_INTERVAL):
+        super().__init__()
+        self.path = path or self.DEFAULT_PATH
+        self.probe_interval = probe_interval
+        self.refresh_interval = refresh_interval
+        self._bootstrap_lock = Semaphore()
+        self._replacing = False
+        self._greenlet = None
+        self.load()
+
+    @staticmethod
+    def _label(server_addr):
+        return f"{server_addr[0]}:{server_addr[1]}"
+
+    def load(self):
+        """Чтение списка с диска, битый или отсутствующий файл - просто пустой список"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        now = time.time()
+        for entry in data.get("servers", []):
+            self.list[(entry["host"], int(entry["port"]))].update({
+                "quality": CMServerList.Good,
+                "timestamp": now,
+                "latency": entry.get("latency"),
+                "failures": entry.get("failures", 0),
+                "sessions": 0,
+            })
+        self.cell_id = data.get("cell_id", 0)
+        self.last_updated = data.get("last_updated", 0)
+        return bool(self.list)
+
+    def save(self):
+        """Атомарная запись списка на диск"""
+        data = {
+            "cell_id": self.cell_id,
+            "last_updated": self.last_updated,
+            "servers": [{"host": host, "port": port, "latency": meta.get("latency"),
+                         "failures": meta.get("failures", 0)}
+                        for (host, port), meta in self.list.items()],
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"  # Файл общий у нескольких процессов
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Не удалось сохранить список CM: %s", e)
+
+    def clear(self):
+        """CMClient чистит список перед тем, как залить новый (ClientCMList, bootstrap).
+        Замеры при этом терять не хотим - просто следующий merge_list заменит состав"""
+        self._replacing = True
+
+    def merge_list(self, new_list):
+        """Добавление серверов, после clear - замена состава с сохранением замеров у оставшихся"""
+        new_list = [(str(host), int(port)) for host, port in new_list]
+        if self._replacing:
+            self._replacing = False
+            keep = set(new_list)
+            for server_addr in list(self.list):
+                if server_addr not in keep and not self.list[server_addr].get("sessions"):
+                    del self.list[server_addr]
+        for server_addr in new_list:
+            if server_addr not in self.list:
+                self.list[server_addr].update({"quality": CMServerList.Good, "timestamp": time.time(),
+                                               "latency": None, "failures": 0, "sessions": 0})
+        self.last_updated = int(time.time())
+
+    def mark_good(self, server_addr):
+        meta = self.list[server_addr]
+        meta.update({"quality": CMServerList.Good, "timestamp": time.time(), "failures": 0})
+        meta.setdefault("latency", None)
+        meta.setdefault("sessions", 0)
+
+    def mark_bad(self, server_addr):
+        meta = self.list[server_addr]
+        meta.update({"quality": CMServerList.Bad, "timestamp": time.time(),
+                     "failures": meta.get("failures", 0) + 1})
+        meta.setdefault("latency", None)
+        meta.setdefault("sessions", 0)
+
+    def _score(self, meta):
+        """Очки сервера, меньше - лучше"""
+        latency = meta.get("latency")
+        if latency is None:
+            latency = self.UNKNOWN_LATENCY
+        return (latency * (1 + meta.get("sessions", 0) / self.SESSIONS_PER_SERVER)
+                + self.FAIL_PENALTY * meta.get("failures", 0))
+
+    def ranked(self):
+        """Сервера от лучшего к худшему: сначала хорошие (и плохие, у которых метка истекла), потом плохие.
+        Случайная добавка в доли миллисекунды разводит одинаковые очки по разным серверам"""
+        now = time.time()
+        good, bad = [], []
+        for server_addr, meta in self.list.items():
+            score = self._score(meta) + random.uniform(0, 0.0005)
+            if meta.get("quality") == CMServerList.Bad and now - meta.get("timestamp", 0) < self.bad_timestamp:
+                bad.append((score, server_addr))
+            else:
+                good.append((score, server_addr))
+        good.sort()
+        bad.sort()
+        return [server_addr for _, server_addr in good + bad]
+
+    def __iter__(self):
+        # Плохие идут в конце, а не выпадают: оригинал на полностью плохом списке не отдает ничего
+        return iter(self.ranked())
+
+    def bootstrap_from_webapi(self, cell_id=0):
+        """Запрос списка в WebAPI один на всех: остальные гринлеты ждут и берут готовый"""
+        with self._bootstrap_lock:
+            if len(self) and self.last_updated + self.refresh_interval > time.time():
+                return True
+            if not CMServerList.bootstrap_from_webapi(self, cell_id):
+                return False
+        self.save()
+        return True
+
+    def bootstrap_from_dns(self):
+        with self._bootstrap_lock:
+            if len(self):
+                return True
+            if not CMServerList.bootstrap_from_dns(self):
+                return False
+        self.save()
+        return True
+
+    def _observe(self, server_addr, latency):
+        """Учет замера задержки"""
+        meta = self.list.get(server_addr)
+        if meta is None:
+            return
+        previous = meta.get("latency")
+        meta["latency"] = latency if previous is None else previous + self.SMOOTHING * (latency - previous)
+        CM_LATENCY.labels(self._label(server_addr)).set(meta["latency"])
+
+    def probe(self, server_addr, timeout=PROBE_TIMEOUT):
+        """Замер: connect и ожидание первого кадра (CM сразу шлет ChannelEncryptRequest), секунды или None"""
+        started = time.monotonic()
+        try:
+            with gsocket.create_connection(server_addr, timeout=timeout) as sock:
+                header = sock.recv(8)
+            if len(header) < 8 or struct.unpack("<I4s", header)[1] != b"VT01":
+                raise OSError("не CM")
+        except OSError:
+            if server_addr in self.list:
+                self.mark_bad(server_addr)
+            return None
+        latency = time.monotonic() - started
+        if server_addr in self.list:
+            self.list[server_addr]["failures"] = 0
+            self._observe(server_addr, latency)
+        return latency
+
+    def probe_round(self, count=PROBE_COUNT):
+        """Параллельный замер лучших серверов и всех еще не мерянных из первой сотни"""
+        ranked = self.ranked()
+        targets = ranked[:count] + [server_addr for server_addr in ranked[count:100]
+                                    if self.list[server_addr].get("latency") is None][:count]
+        gevent.joinall([gevent.spawn(self.probe, server_addr) for server_addr in targets])
+        self.save()
+
+    def attach(self, client):
+        """Подключение SteamClient к общему списку: его cm_servers, учет сбоев и сессий по серверам"""
+        client.cm_servers = self
+        connection = client.connection
+        connect = connection.connect
+        raw_connect = connection._connect
+        current = [None]
+
+        def timed_connect(server_addr):
+            connection.socket.settimeout(self.CONNECT_TIMEOUT)
+            try:
+                raw_connect(server_addr)
+            finally:
+                connection.socket.settimeout(None)
+
+        def release():
+            if current[0] is not None:
+                meta = self.list.get(current[0])
+                if meta is not None:
+                    meta["sessions"] = max(0, meta.get("sessions", 0) - 1)
+                    CM_SESSIONS.labels(self._label(current[0])).set(meta["sessions"])
+                current[0] = None
+
+        def tracked_connect(server_addr):
+            release()
+            if not connect(server_addr):
+                self.mark_bad(server_addr)
+                return False
+            meta = self.list.get(server_addr)
+            if meta is not None:
+                meta["sessions"] = meta.get("sessions", 0) + 1
+                CM_SESSIONS.labels(self._label(server_addr)).set(meta["sessions"])
+            current[0] = server_addr
+            return True
+
+        connection._connect = timed_connect
+        connection.connect = tracked_connect
+        client.on(client.EVENT_DISCONNECTED, lambda *args: release())
+        return client
+
+    def start(self, wait=1.0):
+        """Фоновые замеры и обновление списка. Первый раунд ждем до wait секунд,
+        чтобы сессии, которые стартуют следом, уже разошлись по быстрым серверам"""
+        if self._greenlet is not None:
+            return self
+        first_round = Event()
+
+        def loop():
+            while True:
+                if self.list and not self._replacing:
+                    if self.last_updated + self.refresh_interval < time.time():
+                        self.bootstrap_from_webapi(self.cell_id)
+                    self.probe_round()
+                first_round.set()
+                gevent.sleep(self.probe_interval)
+
+        self._greenlet = gevent.spawn(loop)
+        first_round.wait(timeout=wait)
+        return self
+
+    def stop(self):
+        """Остановка фоновых замеров и сохранение"""
+        if self._greenlet is not None:
+            self._greenlet.kill(block=False)
+            self._greenlet = None
+        self.save()
+
+
+@process_default
+def get_default_directory():
+    """Общий на процесс список CM, фоновые замеры запускаются при первом обращении"""
+    return CMDirectory().start()
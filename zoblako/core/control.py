@@ -0,0 +1,240 @@
+"""
+Модуль для управления пулом сессий через Unix-сокет (JSON построчно)
+"""
+import os
+import json
+import socket
+import logging
+import gevent
+from gevent.server import StreamServer
+from gevent import socket as gsocket
+
+from zoblako.core import metrics, profiling
+from zoblako.core.catalog import get_default_catalog
+
+log = logging.getLogger("zetpar.control")
+
+
+class ControlServer:
+    """Управляющий сокет демона: одна JSON-команда на строку, один JSON-ответ на строку.
+
+    Команды:
+        {"cmd": "status"} / {"cmd": "status", "account": "login"}
+        {"cmd": "start", "account": "login", "app_ids": [730, 440]}
+        {"cmd": "stop", "account": "login", "app_ids": [730]}
+        {"cmd": "stopall"} / {"cmd": "stopall", "account": "login"}
+        {"cmd": "add", "account": "login", "app_ids": [730]}
+        {"cmd": "logins"} - итог конвейера входа: сколько вошло, за сколько, кто не вошел
+        {"cmd": "playtime"} / {"cmd": "playtime", "account": "login", "by": "app" | "day"}
+        {"cmd": "library", "account": "login"} - синхронизация библиотеки, "full": true - с наигранным целиком
+        {"cmd": "idle"} / {"cmd": "idle", "account": "login", "under_hours": 100} - игры из библиотеки
+        {"cmd": "search", "text": "witcher", "limit": 20} - App ID по названию из локального каталога
+        {"cmd": "metrics"} - метрики в текстовом формате Prometheus
+        {"cmd": "profile", "seconds": 10} - профиль CPU и памяти в файлы, "mode": "cprofile" | "sample"
+        {"cmd": "spans"} / {"cmd": "spans", "enable": true} - сводка и включение замеров операций
+    """
+
+    DEFAULT_SOCKET = os.path.join(os.path.dirname(__file__), '..', 'data', 'zetpar.sock')
+
+    def __init__(self, pool, socket_path=DEFAULT_SOCKET, profile_manager=None):
+        self.pool = pool
+        self.socket_path = socket_path
+        self.profile_manager = profile_manager
+        self.server = None
+        self.commands = {
+            "status": self._cmd_status,
+            "start": self._cmd_start,
+            "stop": self._cmd_stop,
+            "stopall": self._cmd_stopall,
+            "add": self._cmd_add,
+            "logins": self._cmd_logins,
+            "playtime": self._cmd_playtime,
+            "library": self._cmd_library,
+            "idle": self._cmd_idle,
+            "search": self._cmd_search,
+            "metrics": self._cmd_metrics,
+            "profile": self._cmd_profile,
+            "spans": self._cmd_spans,
+        }
+
+    def start(self):
+        """Открытие сокета, права только для владельца"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = gsocket.socket(gsocket.AF_UNIX, gsocket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        listener.listen(64)
+        self.server = StreamServer(listener, self._handle_connection)
+        self.server.start()
+
+    def stop(self):
+        """Закрытие сокета"""
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _handle_connection(self, conn, address):
+        """Чтение команд из одного подключения"""
+        stream = conn.makefile('rwb')
+        try:
+            for line in stream:
+                if not line.strip():
+                    continue
+                stream.write(json.dumps(self.handle_request(line), ensure_ascii=False).encode() + b"\n")
+                stream.flush()
+        finally:
+            stream.close()
+            conn.close()
+
+    def handle_request(self, raw):
+        """Разбор и выполнение одной команды"""
+        try:
+            request = json.loads(raw)
+            if not isinstance(request, dict):
+                raise ValueError("Команда должна быть JSON-объектом")
+            command = self.commands.get(request.get("cmd"))
+            if command is None:
+                return {"ok": False, "error": f"Неизвестная команда: {request.get('cmd')}"}
+            return {"ok": True, "result": command(request)}
+        except (ValueError, KeyError, TypeError) as e:
+            return {"ok": False, "error": str(e.args[0]) if e.args else repr(e)}
+        except Exception as e:
+            # sqlite3.Error из хранилищ, OSError и прочее: клиент все равно получает ответ, соединение живет
+            log.exception("Ошибка команды %r", raw)
+            return {"ok": False, "error": repr(e)}
+
+    def _session(self, request):
+        """Сессия, к которой обращается команда"""
+        account = request["account"]
+        session = self.pool.get_session(account)
+        if session is None:
+            raise KeyError(f"Нет сессии {account}")
+        if session.status != "online":
+            raise ValueError(f"Сессия {account} не в сети: {session.status}")
+        return session
+
+    def _targets(self, request):
+        """Одна сессия, если указан account, иначе все, что в сети"""
+        if request.get("account"):
+            return [self._session(request)]
+        return [session for session in self.pool.sessions.values() if session.status == "online"]
+
+    @staticmethod
+    def _app_ids(request):
+        """Список app_id из команды"""
+        app_ids = [int(app_id) for app_id in request.get("app_ids", [])]
+        if not app_ids:
+            raise ValueError("Укажите app_ids")
+        return app_ids
+
+    @staticmethod
+    def _messages(results):
+        """Результаты SteamManager в JSON"""
+        return [{"ok": success, "message": message} for success, message in results]
+
+    def _cmd_status(self, request):
+        if request.get("account"):
+            session = self.pool.get_session(request["account"])
+            if session is None:
+                raise KeyError(f"Нет сессии {request['account']}")
+            return self.pool.session_status(session)
+        return [self.pool.session_status(session) for session in self.pool.sessions.values()]
+
+    def _cmd_start(self, request):
+        return self._messages(self._session(request).manager.start_games(self._app_ids(request)))
+
+    def _cmd_stop(self, request):
+        manager = self._session(request).manager
+        return self._messages(manager.stop_game(app_id) for app_id in self._app_ids(request))
+
+    def _cmd_stopall(self, request):
+        targets = self._targets(request)
+        for session in targets:
+            session.manager.stop_rotation()
+            session.manager.stop_all_games()
+        return [session.username for session in targets]
+
+    def _cmd_add(self, request):
+        account = request["account"]
+        password = request.get("password")
+        login_key = shared_secret = None
+        if self.profile_manager is not None:
+            password = password or self.profile_manager.load_profile(account)
+            login_key = self.profile_manager.load_login_key(account)
+            shared_secret = self.profile_manager.load_shared_secret(account)
+        if not password and not login_key:
+            raise ValueError(f"Нет пароля для {account}")
+        session = self.pool.add_session(account, password, request.get("app_ids", []),
+                                        request.get("two_factor_code"), login_key, shared_secret)
+        return {"username": session.username, "status": session.status}
+
+    def _cmd_logins(self, request):
+        return self.pool.pipeline.report()
+
+    def _cmd_playtime(self, request):
+        ledger = self.pool.ledger
+        account = request.get("account")
+        by = request.get("by", "app" if account else "account")
+        if by == "app":
+            return {str(app_id): seconds for app_id, seconds in ledger.total_by_app(account).items()}
+        if by == "day":
+            return ledger.total_by_day(account, request.get("app_id"))
+        if by == "account":
+            return ledger.total_by_account()
+        raise ValueError(f"Неизвестная группировка: {by}")
+
+    def _cmd_library(self, request):
+        session = self._session(request)
+        report = session.manager.sync_library(self.pool.ledger, full=bool(request.get("full")))
+        if report is None:
+            raise ValueError(f"Steam не отдал библиотеку {session.username}")
+        return report
+
+    def _cmd_idle(self, request):
+        under_hours = request.get("under_hours")
+        under_hours = float(under_hours) if under_hours is not None else None
+        results = {}
+        for session in self._targets(request):
+            success, message = session.manager.idle_owned(under_hours, self.pool.ledger)
+            results[session.username] = {"ok": success, "message": message}
+        return results
+
+    def _cmd_search(self, request):
+        text = str(request.get("text", "")).strip()
+        if not text:
+            raise ValueError("Не указан text")
+        limit = int(request.get("limit", 20))
+        # Первый поиск читает снимок (~0.5 с) и строит индекс для неточного поиска - это в пуле потоков хаба,
+        # как каталог в резолвере, чтобы не вставали heartbeat всех сессий. Ждет только это подключение
+        found = gevent.get_hub().threadpool.apply(lambda: get_default_catalog().search(text, limit))
+        return [{"app_id": app_id, "name": name} for app_id, name in found]
+
+    def _cmd_metrics(self, request):
+        return metrics.REGISTRY.render()
+
+    def _cmd_profile(self, request):
+        seconds = float(request.get("seconds", 10))
+        if not 0 < seconds <= 600:
+            raise ValueError("seconds должно быть от 0 до 600")
+        try:
+            return profiling.capture(seconds, request.get("mode", "auto"))
+        except RuntimeError as e:
+            raise ValueError(str(e))
+
+    def _cmd_spans(self, request):
+        if "enable" in request:
+            profiling.enable_spans(bool(request["enable"]))
+        return {"enabled": profiling.spans_enabled(), "spans": profiling.span_stats()}
+
+
+def send_command(request, socket_path=ControlServer.DEFAULT_SOCKET, timeout=30):
+    """Отправка одной команды демону, для скриптов"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(request).encode() + b"\n")
+        with conn.makefile('rb') as stream:
+            return json.loads(stream.readline())
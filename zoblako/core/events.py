@@ -0,0 +1,70 @@
+"""
+Модуль для событий SteamManager
+"""
+import logging
+import threading
+from collections import namedtuple
+
+
+class EventType:
+    """Типы событий сессии"""
+
+    LOGGED_ON = "logged_on"
+    DISCONNECTED = "disconnected"
+    RECONNECTED = "reconnected"
+    GAME_STARTED = "game_started"
+    GAME_STOPPED = "game_stopped"
+    NAME_RESOLVED = "name_resolved"
+    LOGIN_KEY = "login_key"
+
+
+# source - SteamManager, от которого событие; data - словарь с подробностями
+Event = namedtuple("Event", ["type", "source", "data"])
+
+
+class EventBus:
+    """Шина событий внутри процесса, подписчики вызываются синхронно в потоке того, кто шлет"""
+
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, event_type, handler):
+        """Подписка на тип события, event_type=None - на все события"""
+        with self._lock:
+            handlers = list(self._handlers.get(event_type, ()))
+            handlers.append(handler)
+            # Список подменяем целиком, чтобы emit мог читать его без блокировки
+            self._handlers[event_type] = handlers
+        return handler
+
+    def unsubscribe(self, event_type, handler):
+        """Отписка от события"""
+        with self._lock:
+            handlers = [h for h in self._handlers.get(event_type, ()) if h is not handler]
+            self._handlers[event_type] = handlers
+
+    def emit(self, event_type, source=None, **data):
+        """Отправка события всем подписчикам, ошибки подписчика не ломают отправителя"""
+        handlers = self._handlers.get(event_type, []) + self._handlers.get(None, [])
+        if not handlers:
+            return
+        event = Event(event_type, source, data)
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception:
+                logging.getLogger(__name__).exception("Ошибка в обработчике события %s", event_type)
+
+
+def attach_logger(bus, logger=None):
+    """Подписка, которая пишет все события в лог"""
+    logger = logger or logging.getLogger("zetpar.events")
+
+    def log_event(event):
+        account = getattr(getattr(event.source, "client", None), "username", None)
+        # Ключи входа в лог не пишем
+        data = {key: value for key, value in event.data.items() if key != "login_key"}
+        logger.info("%s %s %s", account or "-", event.type, data)
+
+    return bus.subscribe(None, log_event)
@@ -0,0 +1,202 @@
+"""
+Модуль для локального индекса библиотеки аккаунтов: лицензии, игры и наигранное по данным Steam
+"""
+import os
+import time
+import threading
+
+from zoblako.core import storage
+
+
+class OwnedGame:
+    """Игра из библиотеки: наигранное в Steam на момент синхронизации плюс то, что мы сами насидели после"""
+
+    __slots__ = ("app_id", "name", "playtime_seconds")
+
+    def __init__(self, app_id, name, playtime_seconds):
+        self.app_id = app_id
+        self.name = name
+        self.playtime_seconds = playtime_seconds
+
+    @property
+    def hours(self):
+        return self.playtime_seconds / 3600
+
+
+class LibraryIndex:
+    """Библиотеки аккаунтов в SQLite, общий файл на все процессы.
+
+    licenses - пакеты аккаунта с change_number из ClientLicenseList, по ним видно, что поменялось
+    с прошлой синхронизации. package_apps - какие приложения в пакете (PICS), apps - приложения
+    аккаунта: игра или нет (DLC, инструменты), название и playtime_forever из Player.GetOwnedGames.
+    ledger_seconds - сколько было в PlaytimeLedger на момент синхронизации, чтобы между
+    синхронизациями досчитывать наигранное без запросов в Steam"""
+
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'library', 'library.db')
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        self._lock = threading.Lock()
+        self._conn = storage.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS licenses ("
+            " account TEXT NOT NULL,"
+            " package_id INTEGER NOT NULL,"
+            " change_number INTEGER NOT NULL,"
+            " PRIMARY KEY (account, package_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS package_apps ("
+            " account TEXT NOT NULL,"
+            " package_id INTEGER NOT NULL,"
+            " app_id INTEGER NOT NULL,"
+            " PRIMARY KEY (account, package_id, app_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS package_apps_app ON package_apps (account, app_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS apps ("
+            " account TEXT NOT NULL,"
+            " app_id INTEGER NOT NULL,"
+            " game INTEGER NOT NULL,"
+            " name TEXT,"
+            " playtime_minutes INTEGER NOT NULL DEFAULT 0,"
+            " ledger_seconds REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (account, app_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            " account TEXT PRIMARY KEY,"
+            " synced_at REAL NOT NULL DEFAULT 0,"
+            " playtime_synced_at REAL NOT NULL DEFAULT 0)"
+        )
+
+    def diff_licenses(self, account, licenses):
+        """Сравнение {package_id: change_number} с сохраненными: (новые или измененные, пропавшие)"""
+        with self._lock:
+            stored = dict(self._conn.execute(
+                "SELECT package_id, change_number FROM licenses WHERE account = ?", (account,)))
+        changed = [package_id for package_id, change_number in licenses.items()
+                   if stored.get(package_id) != change_number]
+        removed = [package_id for package_id in stored if package_id not in licenses]
+        return changed, removed
+
+    def update_packages(self, account, packages, removed):
+        """Запись пакетов {package_id: (change_number, [app_id])} и удаление пропавших.
+        Возвращает app_id, про которые индекс еще ничего не знает"""
+        new_apps = set()
+
+        def action():
+            orphans = set()
+            for package_id in removed:
+                orphans.update(row[0] for row in self._conn.execute(
+                    "SELECT app_id FROM package_apps WHERE account = ? AND package_id = ?", (account, package_id)))
+                self._conn.execute("DELETE FROM package_apps WHERE account = ? AND package_id = ?",
+                                   (account, package_id))
+                self._conn.execute("DELETE FROM licenses WHERE account = ? AND package_id = ?",
+                                   (account, package_id))
+            for package_id, (change_number, app_ids) in packages.items():
+                self._conn.execute("DELETE FROM package_apps WHERE account = ? AND package_id = ?",
+                                   (account, package_id))
+                self._conn.executemany("INSERT OR IGNORE INTO package_apps (account, package_id, app_id)"
+                                       " VALUES (?, ?, ?)", [(account, package_id, app_id) for app_id in app_ids])
+                self._conn.execute("INSERT OR REPLACE INTO licenses (account, package_id, change_number)"
+                                   " VALUES (?, ?, ?)", (account, package_id, change_number))
+            # Лицензию отозвали (вернули деньги, кончился бесплатный уикенд) - приложение уходит,
+            # если его не дает другой пакет
+            self._conn.executemany(
+                "DELETE FROM apps WHERE account = ? AND app_id = ? AND NOT EXISTS"
+                " (SELECT 1 FROM package_apps WHERE account = apps.account AND app_id = apps.app_id)",
+                [(account, app_id) for app_id in orphans])
+            new_apps.update(row[0] for row in self._conn.execute(
+                "SELECT DISTINCT app_id FROM package_apps WHERE account = ? AND app_id NOT IN"
+                " (SELECT app_id FROM apps WHERE account = ?)", (account, account)))
+            self._conn.execute("INSERT INTO accounts (account, synced_at) VALUES (?, ?)"
+                               " ON CONFLICT(account) DO UPDATE SET synced_at = excluded.synced_at",
+                               (account, time.time()))
+
+        with self._lock:
+            storage.write(self._conn, action)
+        return new_apps
+
+    def update_apps(self, account, games, requested=None, ledger_totals=None):
+        """Запись ответа GetOwnedGames {app_id: (название, минут)}. requested - о каких приложениях
+        спрашивали (None - обо всех, полная синхронизация): кого из них нет в ответе, те не игры"""
+        ledger_totals = ledger_totals or {}
+        now = time.time()
+
+        def action():
+            self._conn.executemany(
+                "INSERT INTO apps (account, app_id, game, name, playtime_minutes, ledger_seconds)"
+                " VALUES (?, ?, 1, ?, ?, ?) ON CONFLICT(account, app_id) DO UPDATE SET"
+                " game = 1, name = excluded.name, playtime_minutes = excluded.playtime_minutes,"
+                " ledger_seconds = excluded.ledger_seconds"
+                # Пишем только то, что поменялось: у большинства игр между синхронизациями все по-старому
+                " WHERE game != 1 OR name IS NOT excluded.name OR playtime_minutes != excluded.playtime_minutes"
+                " OR ledger_seconds != excluded.ledger_seconds",
+                [(account, app_id, name, minutes, ledger_totals.get(app_id, 0.0))
+                 for app_id, (name, minutes) in games.items()])
+            if requested is None:
+                linked = {row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT app_id FROM package_apps WHERE account = ?", (account,))}
+                not_games = [app_id for app_id in linked if app_id not in games]
+                # Бесплатные игры без пакета есть только в полном ответе: пропали из него - больше не наши
+                self._conn.executemany(
+                    "DELETE FROM apps WHERE account = ? AND app_id = ?",
+                    [(account, row[0]) for row in self._conn.execute(
+                        "SELECT app_id FROM apps WHERE account = ? AND game = 1", (account,)).fetchall()
+                     if row[0] not in games and row[0] not in linked])
+                self._conn.execute("INSERT INTO accounts (account, playtime_synced_at) VALUES (?, ?)"
+                                   " ON CONFLICT(account) DO UPDATE SET playtime_synced_at = excluded.playtime_synced_at",
+                                   (account, now))
+            else:
+                not_games = [app_id for app_id in requested if app_id not in games]
+            self._conn.executemany(
+                "INSERT INTO apps (account, app_id, game) VALUES (?, ?, 0)"
+                " ON CONFLICT(account, app_id) DO UPDATE SET game = 0 WHERE game != 0",
+                [(account, app_id) for app_id in not_games])
+
+        with self._lock:
+            storage.write(self._conn, action)
+
+    def playtime_synced_at(self, account):
+        """Когда наигранное последний раз целиком брали из Steam, 0 - ни разу"""
+        with self._lock:
+            row = self._conn.execute("SELECT playtime_synced_at FROM accounts WHERE account = ?",
+                                     (account,)).fetchone()
+        return row[0] if row else 0.0
+
+    def owned_games(self, account, ledger_totals=None):
+        """Игры аккаунта от наименее наигранной. ledger_totals - текущие {app_id: секунды} из
+        PlaytimeLedger, их прирост с синхронизации добавляется к наигранному по Steam"""
+        ledger_totals = ledger_totals or {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT app_id, name, playtime_minutes, ledger_seconds FROM apps WHERE account = ? AND game = 1",
+                (account,)).fetchall()
+        games = [OwnedGame(app_id, name, minutes * 60 + max(0.0, ledger_totals.get(app_id, 0.0) - at_sync))
+                 for app_id, name, minutes, at_sync in rows]
+        games.sort(key=lambda game: (game.playtime_seconds, game.app_id))
+        return games
+
+    def stats(self, account):
+        """Сводка по аккаунту: пакетов, приложений, игр, когда синхронизировали"""
+        with self._lock:
+            packages = self._conn.execute("SELECT COUNT(*) FROM licenses WHERE account = ?", (account,)).fetchone()[0]
+            apps, games = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(game), 0) FROM apps WHERE account = ?", (account,)).fetchone()
+            row = self._conn.execute("SELECT synced_at, playtime_synced_at FROM accounts WHERE account = ?",
+                                     (account,)).fetchone()
+        synced_at, playtime_synced_at = row if row else (0.0, 0.0)
+        return {"packages": packages, "apps": apps, "games": games, "synced_at": synced_at,
+                "playtime_synced_at": playtime_synced_at}
+
+    def close(self):
+        """Закрытие соединения"""
+        with self._lock:
+            self._conn.close()
+
+
+@storage.process_default
+def get_default_library():
+    """Общий на процесс индекс библиотек"""
+    return LibraryIndex()
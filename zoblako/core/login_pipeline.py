@@ -0,0 +1,160 @@
+"""
+Модуль для входа пачки аккаунтов: коды Steam Guard из shared_secret, ограничение параллельности,
+повторы и отчет о том, как прошло
+"""
+import time
+import base64
+import random
+import statistics
+import gevent
+from gevent.lock import BoundedSemaphore
+from steam.enums import EResult
+
+from zoblako.core import metrics
+
+GUARD_PERIOD = 30  # Окно TOTP Steam Guard, секунды
+
+_time_offset = None
+
+
+def set_time_offset(seconds):
+    """Смещение часов Steam относительно хоста, None - спросить у Steam при следующем коде"""
+    global _time_offset
+    _time_offset = seconds
+
+
+def steam_time():
+    """Время по часам Steam: код считается от него, а часы хоста могут уплыть.
+    Смещение спрашиваем один раз на процесс, а не на каждый код, как steam.guard.generate_twofactor_code"""
+    global _time_offset
+    if _time_offset is None:
+        from steam.guard import get_time_offset
+        _time_offset = get_time_offset() or 0
+    return time.time() + _time_offset
+
+
+def guard_code(shared_secret, timestamp=None):
+    """Код Steam Guard из shared_secret (base64, как в maFile мобильного аутентификатора)"""
+    from steam.guard import generate_twofactor_code_for_time
+    return generate_twofactor_code_for_time(base64.b64decode(shared_secret),
+                                            steam_time() if timestamp is None else timestamp)
+
+
+class LoginPipeline:
+    """Вход аккаунтов пула: не больше concurrency логинов одновременно, у одного аккаунта попытки
+    не чаще раза в min_interval, неверный код и временные ошибки повторяем"""
+
+    CONCURRENCY = 16
+    MIN_INTERVAL = 5
+    MAX_ATTEMPTS = 5
+    BASE_DELAY = 2
+    MAX_DELAY = 120
+    THROTTLE_DELAY = 60
+    # Код не подошел: с shared_secret ждем следующее окно и пробуем свежим кодом
+    GUARD_RESULTS = (
+        EResult.TwoFactorCodeMismatch,
+        EResult.InvalidLoginAuthCode,
+        EResult.AccountLoginDeniedNeedTwoFactor,
+    )
+    # Steam или сеть моргнули, повторяем с задержкой
+    TRANSIENT_RESULTS = (
+        EResult.Fail,
+        EResult.NoConnection,
+        EResult.Timeout,
+        EResult.Busy,
+        EResult.ServiceUnavailable,
+        EResult.TryAnotherCM,
+        EResult.ConnectFailed,
+        EResult.Pending,
+    )
+    # Steam просит сбавить темп
+    THROTTLE_RESULTS = (EResult.RateLimitExceeded, EResult.AccountLoginDeniedThrottle)
+
+    def __init__(self, concurrency=CONCURRENCY, min_interval=MIN_INTERVAL, max_attempts=MAX_ATTEMPTS,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY, throttle_delay=THROTTLE_DELAY):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_delay = throttle_delay
+        self._slots = BoundedSemaphore(concurrency)
+        self._last_attempt = {}  # логин -> monotonic последней попытки
+        self.results = {}  # логин -> (EResult, попыток, секунд)
+        self._started = None
+        self._finished = None
+
+    def _wait_turn(self, username):
+        """Ограничение частоты попыток одного аккаунта"""
+        last = self._last_attempt.get(username)
+        if last is not None:
+            gevent.sleep(max(0.0, last + self.min_interval - time.monotonic()))
+
+    def _delay(self, attempt):
+        """Полный джиттер, как у ConnectionSupervisor"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _retry_delay(self, result, attempt, shared_secret):
+        """Сколько ждать перед следующей попыткой, None - повторять бессмысленно"""
+        if result in self.GUARD_RESULTS:
+            if not shared_secret:
+                return None  # Код вводил человек или его нет вовсе, сами не угадаем
+            if attempt > 1:
+                set_time_offset(None)  # Второй промах подряд - похоже, уплыли часы, спросим у Steam заново
+            return GUARD_PERIOD - steam_time() % GUARD_PERIOD + 1
+        if result in self.THROTTLE_RESULTS:
+            return self.throttle_delay * attempt + self._delay(attempt)
+        if result in self.TRANSIENT_RESULTS:
+            return self._delay(attempt)
+        return None
+
+    def login(self, manager, username, password, shared_secret=None, two_factor_code=None, login_key=None):
+        """Вход одного аккаунта с повторами, возвращает последний EResult"""
+        started = time.monotonic()
+        if self._started is None:
+            self._started = started
+        attempt, result = 0, EResult.Fail
+        while attempt < self.max_attempts:
+            self._wait_turn(username)
+            attempt += 1
+            with self._slots:
+                self._last_attempt[username] = time.monotonic()
+                try:
+                    result = manager.login(username, password, two_factor_code, login_key,
+                                           shared_secret=shared_secret)
+                except Exception:
+                    result = EResult.Fail
+            if result == EResult.OK:
+                break
+            delay = self._retry_delay(result, attempt, shared_secret)
+            if delay is None or attempt >= self.max_attempts:
+                break
+            metrics.LOGIN_RETRIES.labels(result.name if isinstance(result, EResult) else str(result)).inc()
+            # Ручной код второй раз не подойдет, ключ входа manager.login уже отбросил, если был пароль
+            two_factor_code = None
+            if password:
+                login_key = None
+            gevent.sleep(delay)
+
+        self._finished = time.monotonic()
+        self.results[username] = (result, attempt, self._finished - started)
+        return result
+
+    def report(self):
+        """Итог по входам: сколько, как быстро, кто не вошел и почему"""
+        ok = [seconds for result, _, seconds in self.results.values() if result == EResult.OK]
+        elapsed = (self._finished - self._started) if self._started is not None and self._finished else 0.0
+        report = {
+            "accounts": len(self.results),
+            "ok": len(ok),
+            "failed": {username: result.name if isinstance(result, EResult) else str(result)
+                       for username, (result, _, _) in self.results.items() if result != EResult.OK},
+            "attempts": sum(attempts for _, attempts, _ in self.results.values()),
+            "seconds": elapsed,
+            "per_minute": len(ok) / elapsed * 60 if elapsed else None,
+        }
+        if ok:
+            ok.sort()
+            report["login_seconds"] = {"median": statistics.median(ok), "p95": ok[int((len(ok) - 1) * 0.95)],
+                                       "max": ok[-1]}
+        return report
@@ -0,0 +1,336 @@
+"""
+Модуль для метрик в текстовом формате Prometheus
+"""
+import os
+import time
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    """Экранирование значения метки"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=()):
+    """{a="1",b="2"} или пустая строка"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    """Число в формате Prometheus"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Общее у всех метрик: имя, описание, метки и дочерние значения по набору меток"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Значение для конкретного набора меток"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """Удаление набора меток, например аккаунта, которого больше нет"""
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, values, child):
+        raise NotImplementedError
+
+    def render(self):
+        """Строки метрики в текстовом формате"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _Value:
+    """Одно число под блокировкой"""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+
+class Counter(_Metric):
+    """Счетчик, только растет"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        """Для метрики без меток"""
+        self.labels().inc(amount)
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_labels_text(self.labelnames, values)} {_number(child.value)}"]
+
+
+class Gauge(Counter):
+    """Текущее значение, может и расти, и падать"""
+
+    kind = "gauge"
+
+    def set(self, value):
+        """Для метрики без меток"""
+        self.labels().set(value)
+
+
+class _Timer:
+    """Контекстный менеджер для замера времени блока"""
+
+    __slots__ = ("_observe", "_start")
+
+    def __init__(self, observe):
+        self._observe = observe
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observe(time.perf_counter() - self._start)
+
+
+class _HistogramValue:
+    """Корзины, сумма и количество наблюдений"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def time(self):
+        return _Timer(self.observe)
+
+
+class Histogram(_Metric):
+    """Распределение длительностей по корзинам"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        """Для метрики без меток"""
+        self.labels().observe(value)
+
+    def time(self):
+        """Для метрики без меток"""
+        return self.labels().time()
+
+    def _samples(self, values, child):
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, values, [('le', _number(bound))])} "
+                         f"{cumulative}")
+        lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, values, [('le', '+Inf')])} {count}")
+        lines.append(f"{self.name}_sum{_labels_text(self.labelnames, values)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels_text(self.labelnames, values)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их выдача: HTTP на локальном порту или файл"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._writer = None
+        self._stop = threading.Event()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        """Атомарная запись в файл, например для node_exporter textfile collector"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_file_export(self, path, interval=15):
+        """Фоновая перезапись файла раз в interval секунд"""
+        def loop():
+            while True:
+                try:
+                    self.write_file(path)
+                except OSError:
+                    pass  # Диск отвалился - не повод падать, попробуем в следующий раз
+                if self._stop.wait(interval):
+                    return
+
+        self._writer = threading.Thread(target=loop, daemon=True, name="metrics-file")
+        self._writer.start()
+
+    def serve(self, port, host="127.0.0.1"):
+        """HTTP-эндпоинт /metrics, по умолчанию только на localhost"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Без порта метрик не нужен
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Скрейп раз в 15 секунд в консоли не нужен
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics-http").start()
+        return self._server.server_address
+
+    def start_from_env(self):
+        """Включение выдачи по ZETPAR_METRICS_PORT и/или ZETPAR_METRICS_FILE"""
+        port = os.environ.get("ZETPAR_METRICS_PORT")
+        path = os.environ.get("ZETPAR_METRICS_FILE")
+        if port:
+            self.serve(int(port), os.environ.get("ZETPAR_METRICS_HOST", "127.0.0.1"))
+        if path:
+            self.start_file_export(path)
+
+    def stop(self):
+        """Остановка HTTP и записи в файл"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+REGISTRY = MetricsRegistry()
+
+LOGIN_SECONDS = REGISTRY.histogram(
+    "zetpar_login_seconds", "Время входа в Steam", ("account", "method"))
+LOGIN_RESULTS = REGISTRY.counter(
+    "zetpar_login_results_total", "Результаты входа по EResult", ("account", "method", "result"))
+LOGIN_RETRIES = REGISTRY.counter(
+    "zetpar_login_retries_total", "Повторы входа в конвейере по причине", ("result",))
+GAMES_PLAYED_CALLS = REGISTRY.counter(
+    "zetpar_games_played_total", "Отправки games_played", ("account",))
+GAMES_PLAYED_SECONDS = REGISTRY.histogram(
+    "zetpar_games_played_seconds", "Время отправки games_played", ("account",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+DISCONNECTS = REGISTRY.counter(
+    "zetpar_disconnects_total", "Обрывы соединения", ("account",))
+RECONNECTS = REGISTRY.counter(
+    "zetpar_reconnects_total", "Успешные переподключения", ("account",))
+RECONNECT_SECONDS = REGISTRY.histogram(
+    "zetpar_reconnect_downtime_seconds", "Простой от обрыва до переподключения", ("account",),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800))
+STORE_API_SECONDS = REGISTRY.histogram(
+    "zetpar_store_api_seconds", "Время запроса к Steam Store за названием игры")
+STORE_API_ERRORS = REGISTRY.counter(
+    "zetpar_store_api_errors_total", "Неудачные запросы к Steam Store")
+NAME_CACHE_REQUESTS = REGISTRY.counter(
+    "zetpar_name_cache_requests_total", "Поиск названий в кэше", ("result",))
+CATALOG_HITS = REGISTRY.counter(
+    "zetpar_catalog_hits_total", "Названия, взятые из локального каталога вместо Steam Store")
+UI_RENDER_SECONDS = REGISTRY.histogram(
+    "zetpar_ui_render_seconds", "Время отрисовки кадра интерфейса",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+SESSION_ONLINE = REGISTRY.gauge(
+    "zetpar_session_online", "1 - аккаунт в сети, 0 - нет", ("account",))
+APPS_ACTIVE = REGISTRY.gauge(
+    "zetpar_apps_active", "Сколько игр сейчас запущено на аккаунте", ("account",))
@@ -0,0 +1,141 @@
+"""
+Модуль для кэша названий игр на диске
+"""
+import os
+import time
+import threading
+
+from zoblako.core import metrics, storage
+
+
+class GameNameCache:
+    """Общий кэш названий игр в SQLite, живет между перезапусками и процессами"""
+
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'cache', 'game_names.db')
+    TTL = 30 * 24 * 3600  # Названия игр почти не меняются
+    NEGATIVE_TTL = 24 * 3600  # success: false перепроверяем раз в сутки
+    MAX_ENTRIES = 100000
+    TOUCH_INTERVAL = 3600  # Чаще раза в час last_access не переписываем, чтобы чтение не превращалось в запись
+
+    def __init__(self, path=None, ttl=TTL, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES):
+        self.path = path or self.DEFAULT_PATH
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._names = [None]  # name_id -> название, 0 - названия нет
+        self._name_ids = {}
+        self._intern_lock = threading.Lock()
+        self._conn = storage.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS game_names ("
+            " app_id INTEGER PRIMARY KEY,"
+            " name TEXT,"
+            " fetched_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS game_names_lru ON game_names (last_access)")
+
+    def _is_fresh(self, name, fetched_at, now):
+        """Проверка TTL записи, для отрицательных записей TTL короче"""
+        ttl = self.ttl if name is not None else self.negative_ttl
+        return now - fetched_at < ttl
+
+    def get_many(self, app_ids):
+        """Поиск в кэше, возвращает {app_id: name}, name=None - игра точно не найдена"""
+        app_ids = [int(app_id) for app_id in app_ids]
+        if not app_ids:
+            return {}
+
+        now = time.time()
+        found = {}
+        stale_touch = []
+        with self._lock:
+            for start in range(0, len(app_ids), 500):
+                chunk = app_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT app_id, name, fetched_at, last_access FROM game_names WHERE app_id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for app_id, name, fetched_at, last_access in rows:
+                    if not self._is_fresh(name, fetched_at, now):
+                        continue
+                    found[app_id] = name
+                    if now - last_access >= self.TOUCH_INTERVAL:
+                        stale_touch.append((now, app_id))
+
+            if stale_touch:
+                storage.write(self._conn, lambda: self._conn.executemany(
+                    "UPDATE game_names SET last_access = ? WHERE app_id = ?", stale_touch))
+        metrics.NAME_CACHE_REQUESTS.labels("hit").inc(len(found))
+        metrics.NAME_CACHE_REQUESTS.labels("miss").inc(len(set(app_ids)) - len(found))
+        return found
+
+    def get(self, app_id):
+        """Поиск одной игры, возвращает (есть_в_кэше, название)"""
+        found = self.get_many([app_id])
+        app_id = int(app_id)
+        if app_id in found:
+            return True, found[app_id]
+        return False, None
+
+    def intern(self, name):
+        """Номер названия в общей на процесс таблице: у тысячи сессий с одной игрой одна строка на всех.
+        Таблица только растет, но различных названий за жизнь процесса - сотни, не миллионы"""
+        if name is None:
+            return 0
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            with self._intern_lock:
+                name_id = self._name_ids.get(name)
+                if name_id is None:
+                    name_id = self._name_ids[name] = len(self._names)
+                    self._names.append(name)
+        return name_id
+
+    def name(self, name_id):
+        """Название по номеру из intern, None - названия нет"""
+        return self._names[name_id]
+
+    def set_many(self, names):
+        """Сохранение {app_id: name}, name=None - отрицательная запись"""
+        if not names:
+            return
+        now = time.time()
+        rows = [(int(app_id), name, now, now) for app_id, name in names.items()]
+
+        def write():
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO game_names (app_id, name, fetched_at, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+
+        with self._lock:
+            storage.write(self._conn, write)
+
+    def set(self, app_id, name):
+        """Сохранение одной игры"""
+        self.set_many({app_id: name})
+
+    def _evict(self):
+        """Выкидываем самые давно использованные записи сверх лимита"""
+        count = self._conn.execute("SELECT COUNT(*) FROM game_names").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM game_names WHERE app_id IN ("
+                " SELECT app_id FROM game_names ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def close(self):
+        """Закрытие соединения"""
+        with self._lock:
+            self._conn.close()
+
+
+@storage.process_default
+def get_default_cache():
+    """Общий на процесс экземпляр кэша"""
+    return GameNameCache()
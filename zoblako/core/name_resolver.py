@@ -0,0 +1,150 @@
+"""
+Модуль для получения названий игр из Steam Store пачками
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+from zoblako.core.name_cache import get_default_cache
+from zoblako.core import metrics, storage
+
+
+class GameNameResolver:
+    """Резолвер названий: кэш, пул соединений, ограниченная параллельность и таймауты"""
+
+    STEAM_STORE_API = "https://store.steampowered.com/api/appdetails"
+    MAX_WORKERS = 8
+    TIMEOUT = (3.05, 10)  # (connect, read), чтобы не висеть вечно на мертвом сторе
+
+    def __init__(self, cache=None, api_url=STEAM_STORE_API, max_workers=MAX_WORKERS,
+                 timeout=TIMEOUT, language="russian", catalog=None):
+        self.cache = cache or get_default_cache()
+        self._catalog = catalog  # Каталог приложений читаем с диска только при первом промахе кэша
+        self._catalog_loading = False
+        self.api_url = api_url
+        self.timeout = timeout
+        self.language = language
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="name-resolver")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.last_error = None
+
+    @property
+    def catalog(self):
+        """Каталог приложений, None - еще читается. Снимок на 150k+ записей читается ~0.5 с, а первый
+        промах кэша бывает прямо в start_games до games_played, поэтому читаем в пуле потоков хаба
+        (настоящий поток ОС, под monkey.patch_all обычный поток был бы гринлетом и встал бы хабом).
+        Пока читается, промахи идут в стор, как без каталога"""
+        if self._catalog is None:
+            with self._lock:
+                if not self._catalog_loading:
+                    self._catalog_loading = True
+                    import gevent
+                    gevent.get_hub().threadpool.spawn(self._load_catalog)
+        return self._catalog
+
+    def _load_catalog(self):
+        from zoblako.core.catalog import get_default_catalog
+        try:
+            self._catalog = get_default_catalog()
+        finally:
+            # Если снимок не прочитался (битый файл, OSError), следующий промах попробует снова
+            self._catalog_loading = False
+
+    def _from_catalog(self, app_ids):
+        """Промахи кэша, которые нашлись в локальном каталоге: {app_id: name}, сразу кладем в кэш"""
+        catalog = self.catalog
+        if catalog is None or not app_ids:
+            return {}
+        found = catalog.get_many(app_ids)
+        if found:
+            metrics.CATALOG_HITS.inc(len(found))
+            self.cache.set_many(found)
+        return found
+
+    def _fetch(self, app_id):
+        """Запрос одной игры, возвращает название или None, если стор сказал success: false"""
+        # appdetails отдает несколько appids только с filters=price_overview,
+        # поэтому по одному, но с filters=basic - это минимальный ответ, где есть name
+        params = {
+            "appids": app_id,
+            "filters": "basic",
+            "l": self.language
+        }
+        try:
+            with metrics.STORE_API_SECONDS.time():
+                response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            metrics.STORE_API_ERRORS.inc()
+            raise
+        entry = response.json().get(str(app_id))
+        if entry is None:
+            raise ValueError(f"В ответе нет {app_id}")
+
+        name = entry["data"]["name"] if entry.get("success") else None
+        self.cache.set(app_id, name)
+        return name
+
+    def _done(self, app_id, future):
+        """Убираем запрос из списка летящих"""
+        with self._lock:
+            if self._in_flight.get(app_id) is future:
+                del self._in_flight[app_id]
+        error = future.exception()
+        if error is not None:
+            self.last_error = error
+
+    def submit(self, app_id):
+        """Запуск запроса в фоне, одинаковые app_id не запрашиваются дважды одновременно"""
+        app_id = int(app_id)
+        found = self._from_catalog([app_id])
+        if found:
+            future = Future()
+            future.set_result(found[app_id])
+            return future
+        with self._lock:
+            future = self._in_flight.get(app_id)
+            if future is None:
+                future = self._executor.submit(self._fetch, app_id)
+                self._in_flight[app_id] = future
+                future.add_done_callback(lambda f, app_id=app_id: self._done(app_id, f))
+        return future
+
+    def resolve_many(self, app_ids, timeout=None):
+        """Получение названий пачкой: {app_id: name}, name=None - игры нет в сторе.
+        Игры, по которым стор не ответил, в результат не попадают"""
+        app_ids = list(dict.fromkeys(int(app_id) for app_id in app_ids))
+        result = self.cache.get_many(app_ids)
+        result.update(self._from_catalog([app_id for app_id in app_ids if app_id not in result]))
+        futures = {app_id: self.submit(app_id) for app_id in app_ids if app_id not in result}
+        if futures:
+            wait(futures.values(), timeout=timeout)
+        for app_id, future in futures.items():
+            if future.done() and future.exception() is None:
+                result[app_id] = future.result()
+        return result
+
+    def resolve(self, app_id, timeout=None):
+        """Получение одного названия, возвращает (получилось, название)"""
+        app_id = int(app_id)
+        result = self.resolve_many([app_id], timeout=timeout)
+        if app_id in result:
+            return True, result[app_id]
+        return False, None
+
+    def close(self):
+        """Остановка фоновых запросов и закрытие соединений"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+@storage.process_default
+def get_default_resolver():
+    """Общий на процесс резолвер, чтобы все сессии делили пул соединений"""
+    return GameNameResolver()
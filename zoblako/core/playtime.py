@@ -0,0 +1,175 @@
+"""
+Модуль для учета наигранного времени
+"""
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+from zoblako.core.events import EventType
+from zoblako.core import storage
+
+
+class PlaytimeLedger:
+    """Журнал наигранного времени по аккаунтам и играм.
+
+    Открытые интервалы живут в памяти, раз в CHECKPOINT_SECONDS их прошедший кусок дописывается
+    в segments одной транзакцией на все сессии (только INSERT, строки не переписываются).
+    Длительность меряется по monotonic, стенное время нужно только чтобы разложить по дням.
+    Старые сегменты сворачиваются в daily_totals, чтобы журнал не рос бесконечно"""
+
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'playtime', 'ledger.db')
+    CHECKPOINT_SECONDS = 60  # Столько максимум теряем при падении процесса
+    COMPACT_AFTER_DAYS = 7
+
+    def __init__(self, path=None, checkpoint_seconds=CHECKPOINT_SECONDS):
+        self.path = path or self.DEFAULT_PATH
+        self.checkpoint_seconds = checkpoint_seconds
+        self._open = {}  # (account, app_id) -> [monotonic отметка, стенная отметка]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = storage.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " id INTEGER PRIMARY KEY,"
+            " account TEXT NOT NULL,"
+            " app_id INTEGER NOT NULL,"
+            " day TEXT NOT NULL,"
+            " started_at REAL NOT NULL,"
+            " seconds REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS segments_account_app ON segments (account, app_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS segments_day ON segments (day)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS daily_totals ("
+            " account TEXT NOT NULL,"
+            " app_id INTEGER NOT NULL,"
+            " day TEXT NOT NULL,"
+            " seconds REAL NOT NULL,"
+            " PRIMARY KEY (account, app_id, day))"
+        )
+
+    @staticmethod
+    def _segment(account, app_id, mark, now_monotonic):
+        """Строка сегмента от отметки до текущего момента"""
+        started_monotonic, started_wall = mark
+        # Сегмент не длиннее чекпоинта, поэтому относим его целиком к дню начала
+        day = datetime.fromtimestamp(started_wall).strftime("%Y-%m-%d")
+        return account, app_id, day, started_wall, now_monotonic - started_monotonic
+
+    def _append(self, rows):
+        """Дописывание сегментов в журнал"""
+        rows = [row for row in rows if row[4] > 0]
+        if rows:
+            storage.write(self._conn, lambda: self._conn.executemany(
+                "INSERT INTO segments (account, app_id, day, started_at, seconds) VALUES (?, ?, ?, ?, ?)", rows))
+
+    def open(self, account, app_id):
+        """Начало интервала"""
+        with self._lock:
+            self._open.setdefault((account, int(app_id)), [time.monotonic(), time.time()])
+
+    def close(self, account, app_id):
+        """Конец интервала, дописываем остаток"""
+        with self._lock:
+            mark = self._open.pop((account, int(app_id)), None)
+            if mark is not None:
+                self._append([self._segment(account, int(app_id), mark, time.monotonic())])
+
+    def checkpoint(self):
+        """Запись прошедшего куска всех открытых интервалов одной транзакцией"""
+        with self._lock:
+            now, now_wall = time.monotonic(), time.time()
+            rows = [self._segment(*key, mark, now) for key, mark in self._open.items()]
+            self._append(rows)
+            for mark in self._open.values():
+                mark[0], mark[1] = now, now_wall
+
+    def compact(self, keep_days=COMPACT_AFTER_DAYS):
+        """Сворачивание сегментов старше keep_days дней в дневные итоги"""
+        border = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+
+        def action():
+            self._conn.execute(
+                "INSERT INTO daily_totals (account, app_id, day, seconds)"
+                " SELECT account, app_id, day, SUM(seconds) FROM segments WHERE day < ?"
+                " GROUP BY account, app_id, day"
+                " ON CONFLICT(account, app_id, day) DO UPDATE SET seconds = seconds + excluded.seconds",
+                (border,))
+            self._conn.execute("DELETE FROM segments WHERE day < ?", (border,))
+
+        with self._lock:
+            storage.write(self._conn, action)
+
+    def _query(self, group_by, **filters):
+        """Сумма по сегментам и дневным итогам плюс еще не записанные открытые интервалы.
+        filters - только account и/или app_id, None означает без фильтра"""
+        filters = {column: value for column, value in filters.items() if value is not None}
+        where = ("WHERE " + " AND ".join(f"{column} = ?" for column in filters)) if filters else ""
+        columns = ", ".join(group_by)
+        sql = (f"SELECT {columns}, SUM(seconds) FROM ("
+               f" SELECT account, app_id, day, seconds FROM segments {where}"
+               f" UNION ALL SELECT account, app_id, day, seconds FROM daily_totals {where})"
+               f" GROUP BY {columns}")
+        with self._lock:
+            totals = {row[:-1]: row[-1] for row in self._conn.execute(sql, tuple(filters.values()) * 2)}
+            now, today = time.monotonic(), datetime.now().strftime("%Y-%m-%d")
+            for (account, app_id), (mark, _) in self._open.items():
+                values = {"account": account, "app_id": app_id, "day": today}
+                if any(values[column] != value for column, value in filters.items()):
+                    continue
+                key = tuple(values[column] for column in group_by)
+                totals[key] = totals.get(key, 0.0) + now - mark
+        return totals
+
+    def total_by_app(self, account=None):
+        """{app_id: секунды}, по аккаунту или по всем"""
+        return {key[0]: seconds for key, seconds in self._query(("app_id",), account=account).items()}
+
+    def total_by_day(self, account=None, app_id=None):
+        """{день: секунды}"""
+        app_id = int(app_id) if app_id is not None else None
+        return {key[0]: seconds for key, seconds in self._query(("day",), account=account, app_id=app_id).items()}
+
+    def total_by_account(self):
+        """{аккаунт: секунды}"""
+        return {key[0]: seconds for key, seconds in self._query(("account",)).items()}
+
+    def total(self, account, app_id):
+        """Всего секунд в игре на аккаунте"""
+        return self._query(("app_id",), account=account, app_id=int(app_id)).get((int(app_id),), 0.0)
+
+    def attach(self, events):
+        """Подписка на события SteamManager: игры запускаются/останавливаются, соединение рвется"""
+        def account_of(event):
+            return event.source.client.username
+
+        events.subscribe(EventType.GAME_STARTED, lambda event: self.open(account_of(event), event.data["app_id"]))
+        events.subscribe(EventType.GAME_STOPPED, lambda event: self.close(account_of(event), event.data["app_id"]))
+
+    def _run(self):
+        """Фоновые чекпоинты и раз в сутки сворачивание"""
+        last_compact = 0.0
+        while not self._stop.wait(self.checkpoint_seconds):
+            self.checkpoint()
+            if time.monotonic() - last_compact > 24 * 3600:
+                self.compact()
+                last_compact = time.monotonic()
+
+    def start(self):
+        """Запуск фоновых чекпоинтов"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Остановка: все открытые интервалы дописываются"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            now = time.monotonic()
+            self._append([self._segment(*key, mark, now) for key, mark in self._open.items()])
+            self._open.clear()
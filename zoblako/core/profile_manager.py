@@ -4,52 +4,106 @@
 import os
 import json
 import base64
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import socket
+import hashlib
+from zoblako.core.profile_store import ProfileStore
 
 class ProfileManager:
     """В идеале я бы конечно все же бы хотел реализовать сохранение фулл сессии, но мне лень"""
+
+    KDF_SALT = b'zetpar_salt'
+    KDF_ITERATIONS = 100000
     
-    def __init__(self):
-        self.profiles_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles')
-        self.profiles_file = os.path.join(self.profiles_dir, 'profiles.json')
+    def __init__(self, profiles_dir=None, key_cache=None):
+        self.profiles_dir = profiles_dir or os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles')
+        self.profiles_file = os.path.join(self.profiles_dir, 'profiles.json')  # Старый формат, только для миграции
+        # Кэш ключа на хосте: включается аргументом или ZETPAR_KEY_CACHE=1
+        self.key_cache = key_cache if key_cache is not None else os.environ.get("ZETPAR_KEY_CACHE") == "1"
         self._ensure_profiles_dir()
-        self.key = self._generate_key()
-        self.fernet = Fernet(self.key)
+        self.store = ProfileStore(os.path.join(self.profiles_dir, 'profiles.db'))
+        self.store.migrate_from_json(self.profiles_file)
+        self._key = None
+        self._fernet = None
+
+    @property
+    def key(self):
+        """Ключ шифрования, PBKDF2 считается только при первом обращении"""
+        if self._key is None:
+            self._key = self._load_cached_key() if self.key_cache else None
+            if self._key is None:
+                self._key = self._generate_key()
+                if self.key_cache:
+                    self._store_cached_key(self._key)
+        return self._key
+
+    @property
+    def fernet(self):
+        """Шифровальщик, создается лениво вместе с ключом"""
+        if self._fernet is None:
+            from cryptography.fernet import Fernet  # cryptography грузим, только когда дошло до шифрования
+            self._fernet = Fernet(self.key)
+        return self._fernet
+
+    def _key_cache_file(self):
+        """Файл кэша ключа, в имени - хост и параметры KDF, чтобы при их смене кэш не подхватился"""
+        host_id = hashlib.sha256(
+            socket.gethostname().encode() + self.KDF_SALT + str(self.KDF_ITERATIONS).encode()
+        ).hexdigest()[:16]
+        return os.path.join(self.profiles_dir, f'.key_cache.{host_id}')
+
+    def _load_cached_key(self):
+        """Чтение ключа из кэша"""
+        from cryptography.fernet import Fernet
+        try:
+            with open(self._key_cache_file(), 'rb') as f:
+                key = f.read().strip()
+            Fernet(key)  # Битый кэш лучше пересчитать, чем падать на расшифровке
+            return key
+        except (OSError, ValueError):
+            return None
+
+    def _store_cached_key(self, key):
+        """Запись ключа в кэш, доступ только владельцу"""
+        try:
+            path = self._key_cache_file()
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(key)
+        except OSError:
+            pass
         
     def _ensure_profiles_dir(self):
         """Создание директории для профилей если она не существует"""
         os.makedirs(self.profiles_dir, exist_ok=True)
-        if not os.path.exists(self.profiles_file):
-            with open(self.profiles_file, 'w') as f:
-                json.dump({}, f)
                 
     def _generate_key(self): # Для галочки
         """Генерация ключа шифрования"""
-        salt = b'zetpar_salt'  
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
-            salt=salt,
-            iterations=100000,
+            salt=self.KDF_SALT,
+            iterations=self.KDF_ITERATIONS,
         )
         key = base64.urlsafe_b64encode(kdf.derive(b'zetpar_key'))  
         return key
         
+    def _encrypt(self, value):
+        """Шифрование строки для хранилища"""
+        return self.fernet.encrypt(value.encode()).decode()
+
+    def _decrypt(self, username, field):
+        """Расшифровка поля профиля, None если его нет"""
+        profile = self.store.get(username)
+        if not profile or field not in profile:
+            return None
+        return self.fernet.decrypt(profile[field].encode()).decode()
+
     def save_profile(self, username, password):
         """Сохранение профиля"""
         try:
-            with open(self.profiles_file, 'r') as f:
-                profiles = json.load(f)
-            encrypted_password = self.fernet.encrypt(password.encode()).decode() # Для галочки часть 2
-            profiles[username] = {
-                'password': encrypted_password
-            }
-            
-            with open(self.profiles_file, 'w') as f:
-                json.dump(profiles, f)
-                
+            self.store.set_fields(username, password=self._encrypt(password)) # Для галочки часть 2
             return True
         except Exception:
             return False
@@ -57,39 +111,71 @@ class ProfileManager:
     def load_profile(self, username):
         """Загрузка профиля"""
         try:
-            with open(self.profiles_file, 'r') as f:
-                profiles = json.load(f)
-                
-            if username in profiles:
-                # Для галочки часть 3
-                encrypted_password = profiles[username]['password'].encode()
-                password = self.fernet.decrypt(encrypted_password).decode()
-                return password
-            return None
+            return self._decrypt(username, 'password') # Для галочки часть 3
         except Exception:
             return None
             
+    def save_login_key(self, username, login_key):
+        """Сохранение ключа входа, с ним перезапуск обходится без пароля и Steam Guard"""
+        try:
+            self.store.set_fields(username, login_key=self._encrypt(login_key) if login_key else None)
+            return True
+        except Exception:
+            return False
+
+    def load_login_key(self, username):
+        """Загрузка ключа входа"""
+        try:
+            return self._decrypt(username, 'login_key')
+        except Exception:
+            return None
+
+    def save_shared_secret(self, username, shared_secret):
+        """Сохранение shared_secret мобильного аутентификатора: из него считаются коды Steam Guard"""
+        try:
+            self.store.set_fields(username, shared_secret=self._encrypt(shared_secret) if shared_secret else None)
+            return True
+        except Exception:
+            return False
+
+    def load_shared_secret(self, username):
+        """Загрузка shared_secret"""
+        try:
+            return self._decrypt(username, 'shared_secret')
+        except Exception:
+            return None
+
+    def remember_login_keys(self, events):
+        """Подписка на новые ключи входа от SteamManager, чтобы сразу класть их в профиль"""
+        from zoblako.core.events import EventType
+        return events.subscribe(EventType.LOGIN_KEY,
+                                lambda event: self.save_login_key(event.data["username"], event.data["login_key"]))
+
     def get_profiles(self):
         """Получение списка сохраненных профилей"""
         try:
-            with open(self.profiles_file, 'r') as f:
-                profiles = json.load(f)
-            return list(profiles.keys())
+            return self.store.usernames()
         except Exception:
             return []
             
     def delete_profile(self, username):
         """Удаление профиля"""
         try:
-            with open(self.profiles_file, 'r') as f:
-                profiles = json.load(f)
-                
-            if username in profiles:
-                del profiles[username]
-                
-                with open(self.profiles_file, 'w') as f:
-                    json.dump(profiles, f)
-                return True
-            return False
+            return self.store.delete(username)
         except Exception:
             return False
+
+    def export_profiles(self, path):
+        """Выгрузка всех профилей в JSON (поля остаются зашифрованными), возвращает количество"""
+        profiles = self.store.export_profiles()
+        tmp_path = path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(profiles, f)
+        os.replace(tmp_path, path)
+        return len(profiles)
+
+    def import_profiles(self, path):
+        """Загрузка профилей из JSON в том же формате, что и выгрузка (и старый profiles.json)"""
+        with open(path, 'r') as f:
+            return self.store.import_profiles(json.load(f))
@@ -0,0 +1,115 @@
+"""
+Модуль для хранения профилей в SQLite
+"""
+import os
+import json
+import time
+import threading
+
+from zoblako.core import storage
+
+
+class ProfileStore:
+    """Хранилище профилей: индекс по логину, атомарные транзакции, общий доступ из нескольких процессов.
+    Значения полей сюда приходят уже зашифрованными, хранилище про шифрование ничего не знает"""
+
+    FIELDS = ("password", "login_key", "shared_secret")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = storage.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " username TEXT PRIMARY KEY,"
+            " updated_at REAL NOT NULL)"
+        )
+        # Новые поля добавляются колонками, старые базы догоняются тут же
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(profiles)")}
+        for field in self.FIELDS:
+            if field not in columns:
+                self._conn.execute(f"ALTER TABLE profiles ADD COLUMN {field} TEXT")
+
+    @classmethod
+    def _check_fields(cls, fields):
+        """Только известные поля, имена колонок подставляются в SQL"""
+        unknown = set(fields) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля профиля: {', '.join(sorted(unknown))}")
+
+    def get(self, username):
+        """Профиль целиком: {поле: значение} или None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.FIELDS)} FROM profiles WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {field: value for field, value in zip(self.FIELDS, row) if value is not None}
+
+    def set_fields(self, username, **fields):
+        """Создание профиля или обновление части полей, None удаляет значение поля"""
+        self._check_fields(fields)
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" * len(fields))
+        updates = "".join(f", {field} = excluded.{field}" for field in fields)
+        sql = (f"INSERT INTO profiles (username, updated_at{', ' if fields else ''}{columns}) "
+               f"VALUES (?, ?{', ' if fields else ''}{placeholders}) "
+               f"ON CONFLICT(username) DO UPDATE SET updated_at = excluded.updated_at{updates}")
+        with self._lock:
+            storage.write(self._conn, lambda: self._conn.execute(sql, (username, time.time(), *fields.values())))
+
+    def delete(self, username):
+        """Удаление профиля, возвращает, был ли он"""
+        with self._lock:
+            cursor = storage.write(self._conn, lambda: self._conn.execute(
+                "DELETE FROM profiles WHERE username = ?", (username,)))
+        return cursor.rowcount > 0
+
+    def usernames(self):
+        """Список логинов по алфавиту"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT username FROM profiles ORDER BY username")]
+
+    def import_profiles(self, profiles):
+        """Массовый импорт {логин: {поле: значение}} одной транзакцией"""
+        rows = []
+        now = time.time()
+        for username, fields in profiles.items():
+            fields = {field: value for field, value in fields.items() if field in self.FIELDS}
+            rows.append((username, now, *(fields.get(field) for field in self.FIELDS)))
+        sql = (f"INSERT OR REPLACE INTO profiles (username, updated_at, {', '.join(self.FIELDS)}) "
+               f"VALUES (?, ?, {', '.join('?' * len(self.FIELDS))})")
+        with self._lock:
+            storage.write(self._conn, lambda: self._conn.executemany(sql, rows))
+        return len(rows)
+
+    def export_profiles(self):
+        """Все профили в виде {логин: {поле: значение}}"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT username, {', '.join(self.FIELDS)} FROM profiles").fetchall()
+        return {
+            row[0]: {field: value for field, value in zip(self.FIELDS, row[1:]) if value is not None}
+            for row in rows
+        }
+
+    def migrate_from_json(self, json_path):
+        """Перенос старого profiles.json, после переноса файл переименовывается в .migrated"""
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r') as f:
+                profiles = json.load(f)
+        except ValueError:
+            return 0
+        count = self.import_profiles(profiles)
+        try:
+            os.replace(json_path, json_path + ".migrated")
+        except OSError:
+            pass  # Другой процесс уже перенес
+        return count
+
+    def close(self):
+        """Закрытие соединения"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,220 @@
+"""
+Модуль для профилирования работающего процесса без перезапуска
+"""
+import os
+import sys
+import time
+import _thread
+import threading
+from functools import wraps
+from collections import Counter
+
+from zoblako.core import metrics
+
+DIAGNOSTICS_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'diagnostics')
+
+SPAN_SECONDS = metrics.REGISTRY.histogram(
+    "zetpar_span_seconds", "Время операций под профилированием", ("span",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+_enabled = os.environ.get("ZETPAR_PROFILE") == "1"
+_stats = {}  # имя -> [вызовов, всего секунд, максимум]
+_stats_lock = threading.Lock()
+_capture_lock = threading.Lock()
+
+
+def enable_spans(enabled=True):
+    """Включение/выключение замеров span, по умолчанию выключены (ZETPAR_PROFILE=1 включает)"""
+    global _enabled
+    _enabled = enabled
+
+
+def spans_enabled():
+    """Идут ли сейчас замеры span"""
+    return _enabled
+
+
+def _record(name, elapsed):
+    """Учет одного замера"""
+    SPAN_SECONDS.labels(name).observe(elapsed)
+    with _stats_lock:
+        entry = _stats.get(name)
+        if entry is None:
+            _stats[name] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+
+def span(name):
+    """Декоратор: время вызова функции, пока замеры выключены - одна проверка флага"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class timed:
+    """То же для блока кода: with timed("commands.handle"): ..."""
+
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name):
+        self.name = name
+        self._start = None
+
+    def __enter__(self):
+        if _enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._start is not None:
+            _record(self.name, time.perf_counter() - self._start)
+            self._start = None
+
+
+def span_stats():
+    """Сводка по span: [{span, calls, total, mean, max}], самые дорогие сверху"""
+    with _stats_lock:
+        items = [(name, *entry) for name, entry in _stats.items()]
+    return [
+        {"span": name, "calls": calls, "total": total, "mean": total / calls, "max": peak}
+        for name, calls, total, peak in sorted(items, key=lambda item: item[2], reverse=True)
+    ]
+
+
+def _gevent_patched():
+    """Пропатчен ли threading gevent'ом (daemon.py)"""
+    if "gevent.monkey" not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched("threading")
+
+
+def _os_primitives():
+    """Настоящие поток ОС и sleep, даже под gevent - иначе сэмплер не вытеснит хаб"""
+    if _gevent_patched():
+        from gevent import monkey
+        return monkey.get_original("_thread", "start_new_thread"), monkey.get_original("time", "sleep")
+    return _thread.start_new_thread, time.sleep
+
+
+class _Sampler:
+    """Сэмплирующий профайлер: раз в interval снимает стеки всех потоков ОС.
+    Результат - свернутые стеки (формат flamegraph.pl / speedscope)"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._running = False
+        self._finished = False
+
+    def _run(self, sleep):
+        own_code = _Sampler._run.__code__  # Свой поток по коду кадра: get_ident под gevent отдает id гринлета
+        while self._running:
+            for frame in sys._current_frames().values():
+                if frame.f_code is own_code:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+            sleep(self.interval)
+        self._finished = True
+
+    def run_for(self, seconds):
+        start_new_thread, sleep = _os_primitives()
+        self._running = True
+        start_new_thread(self._run, (sleep,))
+        time.sleep(seconds)
+        # Флаги вместо join: примитивы синхронизации под gevent между потоками ОС не работают
+        self._running = False
+        while not self._finished:
+            time.sleep(self.interval)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _pick_mode():
+    """cProfile видит только свой поток ОС, а переключения гринлетов путают ему время,
+    так что он только для простого однопоточного процесса, иначе сэмплер"""
+    return "cprofile" if not _gevent_patched() and threading.active_count() == 1 else "sample"
+
+
+def capture(seconds, mode="auto", out_dir=None):
+    """Снятие профиля CPU и снимка памяти за seconds секунд, возвращает {вид: путь}.
+    Блокирует вызвавший поток/гринлет на seconds"""
+    import pstats  # Нужны только при снятии профиля, на старте их не грузим
+    import cProfile
+    import tracemalloc
+
+    if not _capture_lock.acquire(blocking=False):
+        raise RuntimeError("Профилирование уже идет")
+    try:
+        out_dir = out_dir or DIAGNOSTICS_DIR
+        os.makedirs(out_dir, exist_ok=True)
+        prefix = os.path.join(out_dir, time.strftime("%Y%m%d-%H%M%S"))
+        mode = _pick_mode() if mode == "auto" else mode
+        files = {}
+
+        spans_were_enabled = _enabled
+        enable_spans(True)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start(25)
+        try:
+            if mode == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    time.sleep(seconds)
+                finally:
+                    profiler.disable()
+                files["cpu"] = f"{prefix}-cpu.prof"
+                profiler.dump_stats(files["cpu"])
+                files["cpu_text"] = f"{prefix}-cpu.txt"
+                with open(files["cpu_text"], "w") as f:
+                    pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(60)
+            elif mode == "sample":
+                sampler = _Sampler()
+                sampler.run_for(seconds)
+                files["cpu"] = f"{prefix}-cpu.folded"
+                sampler.dump(files["cpu"])
+            else:
+                raise ValueError(f"Неизвестный режим профилирования: {mode}")
+
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+            enable_spans(spans_were_enabled)
+
+        files["memory"] = f"{prefix}-mem.tracemalloc"
+        snapshot.dump(files["memory"])
+        files["memory_text"] = f"{prefix}-mem.txt"
+        with open(files["memory_text"], "w") as f:
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+        files["spans"] = f"{prefix}-spans.txt"
+        with open(files["spans"], "w") as f:
+            for entry in span_stats():
+                f.write(f"{entry['span']:<32} calls={entry['calls']:<8} total={entry['total']:.4f}s "
+                        f"mean={entry['mean'] * 1000:.3f}ms max={entry['max'] * 1000:.3f}ms\n")
+        return {kind: os.path.abspath(path) for kind, path in files.items()}
+    finally:
+        _capture_lock.release()
@@ -0,0 +1,179 @@
+"""
+Модуль для ротации большого списка игр по кусочкам времени
+"""
+import os
+import json
+import time
+import threading
+
+
+class RotationScheduler:
+    """Крутит очередь игр больше лимита Steam: каждый слот времени запускает
+    игры с наименьшим наигранным временем с учетом веса (weighted fair share)"""
+
+    STATE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'rotation')
+    SLICE_SECONDS = 30 * 60
+    RETRY_SECONDS = 10  # Если нет подключения, пробуем снова через столько секунд
+
+    def __init__(self, steam_manager, app_ids, weights=None, slice_seconds=SLICE_SECONDS, state_file=None):
+        self.steam_manager = steam_manager
+        self.queue = list(dict.fromkeys(int(app_id) for app_id in app_ids))
+        self.weights = {app_id: 1.0 for app_id in self.queue}
+        self.weights.update({int(app_id): float(weight) for app_id, weight in (weights or {}).items()
+                             if int(app_id) in self.weights})
+        self.slice_seconds = slice_seconds
+        self.state_file = state_file
+        self.played = {app_id: 0.0 for app_id in self.queue}
+        self.current = []
+        self.slice_ends_at = 0.0  # Время на стене, чтобы после перезапуска доиграть слот
+        self._slice_started = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load_state()
+
+    @classmethod
+    def state_path(cls, username, state_dir=None):
+        """Путь к файлу состояния ротации аккаунта"""
+        return os.path.join(state_dir or cls.STATE_DIR, f"{username}.json")
+
+    @classmethod
+    def resume(cls, steam_manager, state_file):
+        """Восстановление ротации, если она была активна до перезапуска"""
+        try:
+            with open(state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not state.get("active"):
+            return None
+        return cls(steam_manager, state["queue"], state.get("weights"),
+                   state.get("slice_seconds", cls.SLICE_SECONDS), state_file)
+
+    def _load_state(self):
+        """Подтягиваем наигранное время и текущий слот из файла"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        for app_id, seconds in state.get("played", {}).items():
+            if int(app_id) in self.played:
+                self.played[int(app_id)] = float(seconds)
+        current = [app_id for app_id in state.get("current", []) if app_id in self.played]
+        if current and state.get("slice_ends_at", 0) > time.time():
+            self.current = current
+            self.slice_ends_at = state["slice_ends_at"]
+
+    def _save_state(self, active=True):
+        """Сохранение позиции, пишем через временный файл, чтобы не побить при падении"""
+        if not self.state_file:
+            return
+        state = {
+            "active": active,
+            "queue": self.queue,
+            "weights": {str(app_id): weight for app_id, weight in self.weights.items()},
+            "slice_seconds": self.slice_seconds,
+            "played": {str(app_id): seconds for app_id, seconds in self.played.items()},
+            "current": self.current,
+            "slice_ends_at": self.slice_ends_at
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def _priority(self, app_id):
+        """Чем меньше наиграно относительно веса, тем раньше игра попадет в слот"""
+        return self.played[app_id] / self.weights[app_id]
+
+    def _ordered(self):
+        """Очередь в порядке приоритета, при равенстве - в исходном порядке"""
+        position = {app_id: i for i, app_id in enumerate(self.queue)}
+        return sorted(self.queue, key=lambda app_id: (self._priority(app_id), position[app_id]))
+
+    def _next_slice(self):
+        """Выбор игр на следующий слот"""
+        return self._ordered()[:self.steam_manager.max_games]
+
+    def _account_slice(self):
+        """Начисляем отыгранное время играм текущего слота"""
+        if self._slice_started is None:
+            return
+        elapsed = time.monotonic() - self._slice_started
+        for app_id in self.current:
+            self.played[app_id] += elapsed
+        self._slice_started = None
+
+    def _run(self):
+        """Основной цикл ротации"""
+        while not self._stop.is_set():
+            if not self.steam_manager.client.connected:
+                self._stop.wait(self.RETRY_SECONDS)
+                continue
+
+            with self._lock:
+                remaining = self.slice_ends_at - time.time()
+                if not self.current or remaining <= 0:
+                    self.current = self._next_slice()
+                    remaining = self.slice_seconds
+                    self.slice_ends_at = time.time() + remaining
+                self.steam_manager.set_games(self.current)
+                self._slice_started = time.monotonic()
+                self._save_state()
+
+            self._stop.wait(remaining)
+
+            with self._lock:
+                self._account_slice()
+                if not self._stop.is_set():
+                    self.current = []
+                self._save_state(active=not self._stop.is_set())
+
+    def start(self):
+        """Запуск ротации в фоне"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, resume_later=False):
+        """Остановка ротации, наигранное время сохраняется.
+        resume_later=True - при следующем входе ротация продолжится с текущего слота"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            self._account_slice()
+            if not resume_later:
+                self.current = []
+                self.slice_ends_at = 0.0
+            self._save_state(active=resume_later)
+
+    def get_schedule(self, limit=20):
+        """Расписание для таблицы: сначала текущий слот, потом очередь по приоритету"""
+        with self._lock:
+            played = dict(self.played)
+            if self._slice_started is not None:
+                elapsed = time.monotonic() - self._slice_started
+                for app_id in self.current:
+                    played[app_id] += elapsed
+            current = set(self.current)
+            ordered = self.current + [app_id for app_id in self._ordered() if app_id not in current]
+            slice_left = max(self.slice_ends_at - time.time(), 0)
+
+        schedule = []
+        for position, app_id in enumerate(ordered[:limit]):
+            schedule.append({
+                "id": app_id,
+                "weight": self.weights[app_id],
+                "played_seconds": played[app_id],
+                "state": "active" if app_id in current else "queued",
+                # Сколько слотов ждать очереди (грубо, без учета того, как сдвинется приоритет)
+                "slot": 0 if app_id in current else (position - len(current)) // self.steam_manager.max_games + 1,
+                "slice_left": slice_left
+            })
+        return schedule
@@ -0,0 +1,183 @@
+"""
+Модуль для запуска множества аккаунтов в одном процессе
+"""
+import os
+import json
+import time
+import gevent
+from gevent.event import Event
+from gevent.pool import Group
+from steam.enums import EResult
+
+from zoblako.core.steam_client import SteamManager
+from zoblako.core.events import EventBus
+from zoblako.core.supervisor import ConnectionSupervisor
+from zoblako.core.playtime import PlaytimeLedger
+from zoblako.core.login_pipeline import LoginPipeline
+
+
+def load_fleet(path, profile_manager):
+    """Чтение списка аккаунтов для пула, пароли и shared_secret берем из профилей если их нет в файле"""
+    with open(path, 'r') as f:
+        accounts = json.load(f)
+    for account in accounts:
+        if not account.get("password"):
+            account["password"] = profile_manager.load_profile(account["username"])
+        if not account.get("shared_secret"):
+            account["shared_secret"] = profile_manager.load_shared_secret(account["username"])
+        account["login_key"] = profile_manager.load_login_key(account["username"])
+    return accounts
+
+
+class Session:
+    """Маленькая запись о сессии одного аккаунта"""
+
+    __slots__ = ("username", "password", "app_ids", "two_factor_code", "login_key", "shared_secret",
+                 "manager", "greenlet", "status", "result")
+
+    def __init__(self, username, password, app_ids=(), two_factor_code=None, login_key=None, shared_secret=None):
+        self.username = username
+        self.password = password
+        self.app_ids = tuple(int(app_id) for app_id in app_ids)
+        self.two_factor_code = two_factor_code
+        self.login_key = login_key
+        self.shared_secret = shared_secret
+        self.manager = None
+        self.greenlet = None
+        self.status = "pending"
+        self.result = None
+
+
+class SessionPool:
+    """Пул Steam-сессий, все крутятся гринлетами на одном gevent хабе"""
+
+    def __init__(self, manager_factory=SteamManager, ledger=None, pipeline=None):
+        self.manager_factory = manager_factory
+        self.pipeline = pipeline or LoginPipeline()  # Сколько логинов разом, повторы, коды Steam Guard
+        self.sessions = {}
+        self.events = EventBus()  # Одна шина на весь пул, в событии есть source - менеджер сессии
+        self.ledger = ledger or PlaytimeLedger()  # Один журнал и одна транзакция чекпоинта на все сессии
+        self.ledger.attach(self.events)
+        self.ledger.start()
+        self.group = Group()
+        self._stop = Event()
+        self._baseline = self._snapshot()
+
+    def add_session(self, username, password, app_ids=(), two_factor_code=None, login_key=None,
+                    shared_secret=None):
+        """Добавление аккаунта в пул, логин идет в отдельном гринлете через конвейер входа"""
+        if username in self.sessions:
+            raise ValueError(f"Сессия {username} уже есть в пуле")
+
+        session = Session(username, password, app_ids, two_factor_code, login_key, shared_secret)
+        session.manager = self.manager_factory(events=self.events)
+        self.sessions[username] = session
+        session.greenlet = self.group.spawn(self._run_session, session)
+        return session
+
+    def _run_session(self, session):
+        """Логин и запуск игр для одной сессии"""
+        session.status = "login"
+        try:
+            session.result = self.pipeline.login(session.manager, session.username, session.password,
+                                                 session.shared_secret, session.two_factor_code,
+                                                 session.login_key)
+        except Exception as e:
+            session.status = f"error: {e}"
+            return
+
+        if session.result != EResult.OK:
+            session.status = f"error: {session.result!r}"
+            return
+
+        # Пароль после входа больше не нужен, не держим его в памяти (для переподключения он у менеджера)
+        session.password = None
+        session.two_factor_code = None
+        session.login_key = None
+        session.shared_secret = None
+        ConnectionSupervisor(session.manager)
+        # Ротация, сохраненная при выходе (idle_owned на 32+ игр), важнее списка игр из конфига
+        if not session.manager.resume_rotation() and session.app_ids:
+            session.manager.set_games(session.app_ids)
+        session.status = "online"
+
+    def get_session(self, username):
+        """Получение сессии по логину"""
+        return self.sessions.get(username)
+
+    def session_status(self, session):
+        """Статус сессии в виде, пригодном для JSON"""
+        status = {"username": session.username, "status": session.status}
+        if session.status == "online":
+            info = session.manager.get_session_info()
+            status.update({
+                "connected": info["status"] == "В сети",
+                "name": info.get("username"),
+                "steam_id": int(info["steam_id"]) if info.get("steam_id") else None,
+                "games": [session.manager.format_game(game) for game in session.manager.get_current_games()],
+            })
+        status["playtime"] = self.ledger.total_by_app(session.username)
+        if session.manager.supervisor is not None:
+            status["connection"] = session.manager.supervisor.get_stats()
+            if session.manager.supervisor.gave_up is not None:
+                status["status"] = "needs_login"  # Супервизор бросил попытки, сам сессия уже не поднимется
+        return status
+
+    def wait_logins(self, timeout=None):
+        """Ожидание окончания всех логинов"""
+        self.group.join(timeout=timeout)
+
+    def serve_forever(self):
+        """Отдаем управление хабу, пока пул не остановят"""
+        self._stop.wait()
+
+    def stop(self):
+        """Остановка пула и выход из всех аккаунтов"""
+        self.group.kill()
+        for session in self.sessions.values():
+            try:
+                session.manager.logout()
+            except Exception:
+                pass
+        self.ledger.stop()
+        self._stop.set()
+
+    def online_count(self):
+        """Количество сессий в сети"""
+        return sum(1 for session in self.sessions.values() if session.status == "online")
+
+    @staticmethod
+    def _snapshot():
+        """Текущие RSS (байты) и процессорное время (сек) процесса"""
+        times = os.times()
+        cpu = times.user + times.system
+        try:
+            with open("/proc/self/statm") as f:
+                rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            import resource
+            # ru_maxrss в килобайтах на Linux, это максимум, а не текущее значение
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return rss, cpu, time.monotonic()
+
+    def measure_budget(self):
+        """Замер памяти и CPU на одну сессию относительно старта пула"""
+        base_rss, base_cpu, base_time = self._baseline
+        rss, cpu, now = self._snapshot()
+        count = len(self.sessions) or 1
+        elapsed = max(now - base_time, 1e-9)
+        return {
+            "sessions": len(self.sessions),
+            "online": self.online_count(),
+            "rss_total_mb": rss / 1024 / 1024,
+            "rss_per_session_kb": (rss - base_rss) / count / 1024,
+            "cpu_percent_total": (cpu - base_cpu) / elapsed * 100,
+            "cpu_percent_per_session": (cpu - base_cpu) / elapsed * 100 / count,
+        }
+
+    def report_budget(self, interval, callback):
+        """Периодическая отдача замеров в callback, запускается гринлетом"""
+        def loop():
+            while not self._stop.wait(timeout=interval):
+                callback(self.measure_budget())
+        return gevent.spawn(loop)
@@ -2,218 +2,528 @@
 Модуль для работы с Steam API и авторизацией
 """
 import os
-import sys
 import time
-import requests
-from datetime import datetime
+import gevent
 from steam.client import SteamClient
-from rich.console import Console
-from rich.panel import Panel
+from steam.enums import EResult
+from steam.enums.emsg import EMsg
+from zoblako.core.name_resolver import get_default_resolver
+from zoblako.core.events import EventBus, EventType
+from zoblako.core import metrics, profiling
+from zoblako.core.steam_compat import patch_connection, patch_server_list
+from zoblako.core.login_pipeline import LoginPipeline, guard_code
+
+patch_connection()
+patch_server_list()
+
+
+class GameRecord:
+    """Запущенная игра: время старта по monotonic и номер названия в кэше (GameNameCache.intern).
+    Ни datetime, ни строк - строки для вывода собираются только при отрисовке (format_game)"""
+
+    __slots__ = ("app_id", "started", "name_id")
+
+    def __init__(self, app_id, started, name_id=0):
+        self.app_id = app_id
+        self.started = started
+        self.name_id = name_id
+
 
 class SteamManager:
     """Основные методы для управления сессией и игрушками"""
 
-    STEAM_STORE_API = "https://store.steampowered.com/api/appdetails"
-    
-    def __init__(self):
-        self.client = SteamClient()
+    MAX_GAMES = 32  # Больше Steam в одном games_played не принимает
+    LIBRARY_PLAYTIME_TTL = 24 * 3600  # Чаще раза в сутки наигранное по всей библиотеке не перезапрашиваем
+    LIBRARY_TIMEOUT = 15
+
+    def __init__(self, client=None, resolver=None, max_games=MAX_GAMES, events=None, library=None):
+        if client is None:
+            client = SteamClient()
+            # Свой клиент - на общий список CM; чужой (тесты, заменитель) настроен вызывающим
+            if os.environ.get("ZETPAR_CM_DIRECTORY", "1") != "0":
+                from zoblako.core.cm_directory import get_default_directory
+                get_default_directory().attach(client)
+        self.client = client
         self.sentry_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'sentry')
-        self.running_games = {}  
+        self.rotation_path = None  # Папка состояния ротации, None - RotationScheduler.STATE_DIR
+        self.running_games = {}  # app_id -> GameRecord
+        self._games_version = 0  # Растет при каждой смене набора игр
+        self._games_view = (0, ())  # (версия, снимок) для get_current_games
+        self._session_info = {}  # Один словарь на сессию, get_session_info его перезаполняет
+        self.max_games = max_games
+        self._played_ids = frozenset()  # Что последний раз ушло в games_played
+        self.rotation = None
+        self.supervisor = None
+        self._username = None
+        self._password = None  # Держим в памяти только для переподключения
+        self._shared_secret = None  # Как и пароль: для кода Steam Guard при переподключении
         self.should_run = True
         self.console = None  # Будет установлена при авторизации
-        self.game_names_cache = {}  
+        self.resolver = resolver or get_default_resolver()
+        self._library = library  # Индекс библиотеки открываем только когда он понадобится
+        self.events = events or EventBus()
+        self._was_logged_on = False
+        self.client.on(SteamClient.EVENT_LOGGED_ON, self._handle_logged_on)
+        self.client.on(SteamClient.EVENT_DISCONNECTED, self._handle_disconnected)
+        self.client.on(SteamClient.EVENT_NEW_LOGIN_KEY, self._handle_new_login_key)
         os.makedirs(self.sentry_path, exist_ok=True)
+
+    def _handle_logged_on(self):
+        """Вход или повторный вход после обрыва"""
+        event_type = EventType.RECONNECTED if self._was_logged_on else EventType.LOGGED_ON
+        self._was_logged_on = True
+        metrics.SESSION_ONLINE.labels(self.client.username).set(1)
+        self.events.emit(event_type, self, username=self.client.username)
+
+    def _handle_disconnected(self):
+        """Обрыв соединения с CM"""
+        # Без соединения игры не идут: для Steam они остановлены, после входа отправим набор заново
+        stopped, self._played_ids = self._played_ids, frozenset()
+        for app_id in stopped:
+            self.events.emit(EventType.GAME_STOPPED, self, app_id=app_id)
+        metrics.SESSION_ONLINE.labels(self.client.username).set(0)
+        metrics.APPS_ACTIVE.labels(self.client.username).set(0)
+        self.events.emit(EventType.DISCONNECTED, self, username=self.client.username)
         
+    def get_game_names(self, app_ids):
+        """Получение названий пачкой, {app_id: name}"""
+        names = self.resolver.resolve_many(app_ids)
+        if self.resolver.last_error is not None and len(names) < len(set(app_ids)):
+            self._report_error(f"Ошибка получения названия игры: {self.resolver.last_error}")
+        # Если что-то пошло не так, вместо названия будет ID
+        return {int(app_id): names.get(int(app_id)) or f"Game {app_id}" for app_id in app_ids}
+
     def get_game_name(self, app_id):
         """Получение названия игры по app_id"""
-        # Проверяем кэш
-        if app_id in self.game_names_cache:
-            return self.game_names_cache[app_id]
-            
-        try:
-           
-            params = {
-                "appids": app_id,
-                "l": "russian"  # Я бы не сказал, что это имеет смысл кнч...
-            }
-            response = requests.get(self.STEAM_STORE_API, params=params)
-            data = response.json()
-            
-            if str(app_id) in data and data[str(app_id)]["success"]:
-                game_name = data[str(app_id)]["data"]["name"]
-                self.game_names_cache[app_id] = game_name
-                return game_name
-        except Exception as e:
-            if self.console:
-                self.console.print(Panel(f"Ошибка получения названия игры: {e}", 
-                                       style="steam_red", border_style="steam_red"))
-        
-        # Если что-то пошло не так, возвращаем ID
-        return f"Game {app_id}"
+        return self.get_game_names([app_id])[int(app_id)]
         
+    def _add_running_game(self, app_id):
+        """Запись о запущенной игре, название берем из кэша или подтягиваем в фоне"""
+        cache = self.resolver.cache
+        cached, game_name = cache.get(app_id)
+        self.running_games[app_id] = GameRecord(app_id, time.monotonic(), cache.intern(game_name))
+        self._games_version += 1
+        if not cached:
+            future = self.resolver.submit(app_id)
+            future.add_done_callback(lambda f: self._on_name_resolved(app_id, f))
+        return self.game_name(app_id)
+
+    def _on_name_resolved(self, app_id, future):
+        """Подстановка названия, когда стор ответил (вызывается из потока резолвера)"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        game = self.running_games.get(app_id)
+        if game is not None and future.result() is not None:
+            game.name_id = self.resolver.cache.intern(future.result())
+            self.events.emit(EventType.NAME_RESOLVED, self, app_id=app_id, name=future.result())
+
+    def game_name(self, app_id):
+        """Название запущенной игры, пока стор не ответил - Game <id>"""
+        game = self.running_games.get(app_id)
+        name = self.resolver.cache.name(game.name_id) if game is not None else None
+        return name or f"Game {app_id}"
+
     def set_credential_location(self, username): #Я к слову забил на это, мб потом доделаю, можете ветки допилить если хотите)
         """Установка пути для sentry-файла"""
         sentry_file = os.path.join(self.sentry_path, f"{username}.sentry")
         self.client.set_credential_location(sentry_file)
         return sentry_file
     
-    def authenticate(self, username, password, console_ui):
-        """Аутентификация пользователя"""
+    def _say(self, message, style):
+        """Панель в консоль интерфейса, если она есть. rich грузим только здесь:
+        без интерфейса (флот, демон) он вообще не нужен"""
+        if self.console:
+            from rich.panel import Panel
+            self.console.print(Panel(message, style=style, border_style=style))
+
+    def _report_error(self, message):
+        """Вывод ошибки, если есть куда выводить"""
+        self._say(message, "steam_red")
+
+    @profiling.span("steam.login")
+    def login(self, username, password, two_factor_code=None, login_key=None, shared_secret=None):
+        """Вход без интерактива, возвращает EResult.
+        Если есть ключ входа - сначала пробуем его, Steam отверг ключ - идем по паролю.
+        С shared_secret код Steam Guard считаем сами прямо перед отправкой"""
+        self.set_credential_location(username)
+        self._username = username
+        self._password = password or self._password
+        self._shared_secret = shared_secret or self._shared_secret
+        self.should_run = True
+        if login_key:
+            result = self._timed_login("login_key", username=username, login_key=login_key)
+            if result == EResult.OK or not password:
+                return result
+            # Ключ протух, больше его не используем
+            self.events.emit(EventType.LOGIN_KEY, self, username=username, login_key=None)
+        if not password:
+            # Ни ключа, ни пароля: client.login упал бы с TypeError, а супервизор повторял бы это вечно
+            return EResult.InvalidPassword
+        if self._shared_secret and not two_factor_code:
+            two_factor_code = guard_code(self._shared_secret)
+        return self._timed_login("password", username=username, password=password,
+                                 two_factor_code=two_factor_code)
+
+    def _timed_login(self, method, **kwargs):
+        """client.login с замером времени и кода ответа"""
+        with metrics.LOGIN_SECONDS.labels(kwargs["username"], method).time():
+            result = self.client.login(**kwargs)
+        name = result.name if isinstance(result, EResult) else str(result)
+        metrics.LOGIN_RESULTS.labels(kwargs["username"], method, name).inc()
+        return result
+
+    def relogin(self):
+        """Повторный вход после обрыва: по свежему ключу входа, если он есть, иначе по паролю"""
+        if not self._username:
+            return EResult.Fail
+        return self.login(self._username, self._password, login_key=self.client.login_key)
+
+    def _handle_new_login_key(self):
+        """Steam выдал новый ключ входа, его сохранит подписчик (ProfileManager)"""
+        self.events.emit(EventType.LOGIN_KEY, self, username=self.client.username,
+                         login_key=self.client.login_key)
+
+    def authenticate(self, username, password, console_ui, login_key=None, shared_secret=None):
+        """Аутентификация пользователя. С shared_secret код Steam Guard не спрашиваем"""
         self.console = console_ui.console  
-        sentry_file = self.set_credential_location(username)
-        
+
         def get_guard_code():
             """Запрос кода Steam Guard"""
-            self.console.print(Panel("Введите код Steam Guard из мобильного приложения (оставьте пустым, если не требуется)", 
-                                   style="steam_blue", border_style="steam_blue"))
+            self._say("Введите код Steam Guard из мобильного приложения (оставьте пустым, если не требуется)", "steam_blue")
             return input("> ")
+
+        if login_key:
+            # Пароль и shared_secret отдаем и здесь: если ключ протухнет потом, relogin войдет по ним.
+            # Отверг Steam ключ сейчас - login сам пойдет по паролю (с кодом из shared_secret, если он есть)
+            result = self.login(username, password, login_key=login_key, shared_secret=shared_secret)
+            if result == EResult.OK:
+                self._say(f"Вход по сохраненной сессии как {self.client.user.name}", "steam_green")
+                return True
+            self._say(f"Сохраненная сессия не подошла ({result!r})", "steam_red")
+            if not password:
+                return False
+        else:
+            # Здесь я чет не познал, в теории можно была отрисовывать qr, но это без меня
+            code = None if shared_secret else get_guard_code()
+
+            # Реализация первой попытки аутентификации
+            result = self.login(username, password, code, shared_secret=shared_secret)
         
-        # Здесь я чет не познал, в теории можно была отрисовывать qr, но это без меня
-        guard_code = get_guard_code()
-        
-        # Реализация первой попытки аутентификации
-        result = self.client.login(username=username, password=password, two_factor_code=guard_code)
-        
-        # Повторный запрос кода, если ты баклан
-        while result in (None, 'invalid_2fa'):
-            self.console.print(Panel("Неверный код. Введите код Steam Guard снова", 
-                                   style="steam_red", border_style="steam_red"))
-            guard_code = input("> ")
-            result = self.client.login(username=username, password=password, two_factor_code=guard_code)
+        # Повторный запрос кода, если ты баклан (или сохраненный shared_secret не подошел)
+        while result in LoginPipeline.GUARD_RESULTS:
+            self._say("Неверный код. Введите код Steam Guard снова", "steam_red")
+            code = input("> ")
+            result = self.login(username, password, code)
         
-        if result != 1:
-            self.console.print(Panel(f"Ошибка входа в Steam. Проверьте логин и пароль. (Код ошибки: {result})", 
-                                   style="steam_red", border_style="steam_red"))
+        if result != EResult.OK:
+            self._say(f"Ошибка входа в Steam. Проверьте логин и пароль. (Код ошибки: {result})", "steam_red")
             return False
             
-        self.console.print(Panel(f"Успешный вход в Steam как {self.client.user.name}", 
-                               style="steam_green", border_style="steam_green"))
+        self._say(f"Успешный вход в Steam как {self.client.user.name}", "steam_green")
         return True
     
-    def start_game(self, app_id):
-        """Запуск игры"""
+    @profiling.span("steam.start_games")
+    def start_games(self, app_ids):
+        """Запуск нескольких игр одним games_played, уже запущенные не трогаем"""
+        if not self.client.connected:
+            return [(False, "Нет подключения к Steam")]
+
+        results = []
         try:
-            app_id = int(app_id)
-            if not self.client.connected:
-                return False, "Нет подключения к Steam"
-                
-            # Останавливаем все текущие игры (только в теории, на практике у меня ток 1 игра и запускается:))
-            self.stop_all_games()
-            game_name = self.get_game_name(app_id)
-            
-            self.running_games[app_id] = {
-                "start_time": datetime.now(),
-                "name": game_name
-            }
-            
-            # Тута игрушку запускаем
-            self.client.games_played([app_id])
-            
-            return True, f"Игра {game_name} запущена"
-            
-        except ValueError:
-            return False, "Неверный формат App ID"
+            for app_id in app_ids:
+                try:
+                    app_id = int(app_id)
+                except ValueError:
+                    results.append((False, "Неверный формат App ID"))
+                    continue
+                if app_id in self.running_games:
+                    results.append((False, f"Игра {self.game_name(app_id)} уже запущена"))
+                elif len(self.running_games) >= self.max_games:
+                    results.append((False, f"Достигнут лимит одновременно запущенных игр ({self.max_games})"))
+                else:
+                    game_name = self._add_running_game(app_id)
+                    results.append((True, f"Игра {game_name} запущена"))
+
+            # Тута игрушки запускаем, стор для этого не нужен
+            self._sync_games_played()
+            return results
+
         except Exception as e:
-            self.console.print(Panel(f"Ошибка при запуске игры: {e}", 
-                                   style="steam_red", border_style="steam_red"))
-            return False, f"Ошибка при запуске игры: {e}"
+            self._report_error(f"Ошибка при запуске игры: {e}")
+            return results + [(False, f"Ошибка при запуске игры: {e}")]
+
+    def start_game(self, app_id):
+        """Запуск игры"""
+        return self.start_games([app_id])[0]
     
+    @profiling.span("steam.stop_game")
     def stop_game(self, app_id):
         """Остановка игры"""
         try:
             app_id = int(app_id)
             if app_id in self.running_games:
-                game_name = self.running_games[app_id]["name"]
+                game_name = self.game_name(app_id)
                 del self.running_games[app_id]
-                if self.running_games:
-                    self.client.games_played(list(self.running_games.keys()))
-                else:
-                    self.client.games_played([])
+                self._games_version += 1
+                self._sync_games_played()
                 return True, f"Игра {game_name} остановлена"
             return False, "Игра не запущена"
         except ValueError:
             return False, "Неверный формат App ID"
         except Exception as e:
-            self.console.print(Panel(f"Ошибка при остановке игры: {e}", 
-                                   style="steam_red", border_style="steam_red"))
+            self._report_error(f"Ошибка при остановке игры: {e}")
             return False, f"Ошибка при остановке игры: {e}"
     
+    @profiling.span("steam.set_games")
+    def set_games(self, app_ids):
+        """Замена набора игр, лишнее сверх лимита отбрасывается"""
+        app_ids = list(dict.fromkeys(int(app_id) for app_id in app_ids))[:self.max_games]
+        for app_id in list(self.running_games):
+            if app_id not in app_ids:
+                del self.running_games[app_id]
+        self._games_version += 1
+        for app_id in app_ids:
+            if app_id not in self.running_games:
+                self._add_running_game(app_id)
+        if self.client.connected:
+            self._sync_games_played()
+
+    @profiling.span("steam.stop_all_games")
     def stop_all_games(self):
         """Остановка всех игр"""
         self.running_games.clear()
+        self._games_version += 1
         if self.client.connected:
-            self.client.games_played([])
+            self._sync_games_played()
+
+    def _rotation_state_file(self):
+        """Файл состояния ротации текущего аккаунта"""
+        from zoblako.core.rotation import RotationScheduler
+        return RotationScheduler.state_path(self.client.username or "default", self.rotation_path)
+
+    def start_rotation(self, app_ids, weights=None, slice_seconds=None):
+        """Запуск ротации очереди игр, которая не влезает в лимит"""
+        from zoblako.core.rotation import RotationScheduler
+        if not self.client.connected:
+            return False, "Нет подключения к Steam"
+        self.stop_rotation()
+        self.rotation = RotationScheduler(self, app_ids, weights,
+                                          slice_seconds or RotationScheduler.SLICE_SECONDS,
+                                          self._rotation_state_file())
+        self.rotation.start()
+        return True, f"Ротация запущена: {len(self.rotation.queue)} игр, слот {self.rotation.slice_seconds // 60} мин"
+
+    def resume_rotation(self):
+        """Продолжение ротации после перезапуска, если она была активна"""
+        from zoblako.core.rotation import RotationScheduler
+        self.rotation = RotationScheduler.resume(self, self._rotation_state_file())
+        if self.rotation is not None:
+            self.rotation.start()
+        return self.rotation is not None
+
+    def stop_rotation(self, resume_later=False):
+        """Остановка ротации"""
+        if self.rotation is None:
+            return False
+        self.rotation.stop(resume_later)
+        self.rotation = None
+        return True
+
+    @property
+    def library(self):
+        if self._library is None:
+            from zoblako.core.library import get_default_library
+            self._library = get_default_library()
+        return self._library
+
+    @profiling.span("steam.sync_library")
+    def sync_library(self, ledger=None, full=False):
+        """Синхронизация индекса библиотеки аккаунта, возвращает сводку или None, если Steam не ответил.
+        Список лицензий Steam присылает сам после входа, по change_number пакетов видно, что поменялось:
+        состав запрашиваем (PICS) только у новых и измененных пакетов, а в GetOwnedGames спрашиваем
+        только о новых приложениях. Целиком наигранное перезапрашиваем раз в LIBRARY_PLAYTIME_TTL или с full"""
+        if not self.client.logged_on:
+            return None
+
+        account = self.client.username
+        library = self.library
+        try:
+            if not self.client.licenses:
+                self.client.wait_event(EMsg.ClientLicenseList, timeout=self.LIBRARY_TIMEOUT, raises=True)
+            # Пакет 0 - общий бесплатный пакет Steam на тысячи приложений, сыгранные из него
+            # бесплатные игры и так приходят в полном GetOwnedGames
+            licenses = {package_id: license for package_id, license in self.client.licenses.items() if package_id}
+            changed, removed = library.diff_licenses(account, {package_id: license.change_number
+                                                               for package_id, license in licenses.items()})
+            report = {"packages_changed": len(changed), "packages_removed": len(removed), "requests": 0}
+
+            packages = {}
+            if changed:
+                info = self.client.get_product_info(
+                    packages=[{"packageid": package_id, "access_token": licenses[package_id].access_token}
+                              for package_id in changed],
+                    auto_access_tokens=False, timeout=self.LIBRARY_TIMEOUT)
+                report["requests"] += 1
+                for package_id in changed:
+                    app_ids = info["packages"].get(package_id, {}).get("appids", {})
+                    packages[package_id] = (licenses[package_id].change_number,
+                                            [int(app_id) for app_id in app_ids.values()])
+            new_apps = library.update_packages(account, packages, removed)
+
+            full = full or library.playtime_synced_at(account) + self.LIBRARY_PLAYTIME_TTL < time.time()
+            report["apps_new"] = len(new_apps)
+            if full or new_apps:
+                params = {"steamid": self.client.steam_id.as_64, "include_appinfo": True,
+                          "include_played_free_games": True}
+                if not full:
+                    params["appids_filter"] = sorted(new_apps)
+                response = self.client.send_um_and_wait("Player.GetOwnedGames#1", params,
+                                                        timeout=self.LIBRARY_TIMEOUT, raises=True)
+                report["requests"] += 1
+                if response.header.eresult != EResult.OK:
+                    self._report_error(f"Steam не отдал библиотеку: {EResult(response.header.eresult)!r}")
+                    return None
+                games = {game.appid: (game.name or None, game.playtime_forever) for game in response.body.games}
+                library.update_apps(account, games, None if full else new_apps,
+                                    ledger.total_by_app(account) if ledger is not None else None)
+                # Названия пришли заодно - в стор за ними ходить не придется
+                self.resolver.cache.set_many({app_id: name for app_id, (name, _) in games.items() if name})
+        except gevent.Timeout:
+            self._report_error("Steam не ответил на запрос библиотеки")
+            return None
+        report["full"] = full
+        report.update(library.stats(account))
+        return report
+
+    def owned_games(self, ledger=None):
+        """Игры аккаунта из локального индекса, от наименее наигранной, без запросов в Steam"""
+        return self.library.owned_games(self.client.username,
+                                        ledger.total_by_app(self.client.username) if ledger is not None else None)
+
+    def idle_owned(self, max_hours=None, ledger=None):
+        """Запуск всех игр библиотеки или тех, где наиграно меньше max_hours часов.
+        Берем из индекса, синхронизируем только если индекс аккаунта пуст. Не влезает в лимит - ротация"""
+        if not self.client.connected:
+            return False, "Нет подключения к Steam"
+        games = self.owned_games(ledger)
+        if not games and self.sync_library(ledger) is not None:
+            games = self.owned_games(ledger)
+        app_ids = [game.app_id for game in games if max_hours is None or game.hours < max_hours]
+        if not app_ids:
+            return False, "В библиотеке нет подходящих игр"
+        if len(app_ids) > self.max_games:
+            return self.start_rotation(app_ids)
+        self.stop_rotation()
+        self.set_games(app_ids)
+        return True, f"Запущено игр из библиотеки: {len(app_ids)}"
+
+    @profiling.span("steam.get_schedule")
+    def get_schedule(self):
+        """Расписание ротации для интерфейса"""
+        if self.rotation is None:
+            return None
+        schedule = self.rotation.get_schedule()
+        names = self.resolver.cache.get_many([entry["id"] for entry in schedule])
+        for entry in schedule:
+            entry["name"] = names.get(entry["id"]) or f"Game {entry['id']}"
+        return schedule
+
+    @profiling.span("steam.games_played")
+    def _sync_games_played(self, force=False):
+        """Отправка games_played, только если набор игр реально поменялся"""
+        app_ids = frozenset(self.running_games)
+        if not force and app_ids == self._played_ids:
+            return False
+        account = self.client.username
+        with metrics.GAMES_PLAYED_SECONDS.labels(account).time():
+            self.client.games_played(list(self.running_games))
+        metrics.GAMES_PLAYED_CALLS.labels(account).inc()
+        metrics.APPS_ACTIVE.labels(account).set(len(app_ids))
+        started, stopped = app_ids - self._played_ids, self._played_ids - app_ids
+        self._played_ids = app_ids
+        for app_id in stopped:
+            self.events.emit(EventType.GAME_STOPPED, self, app_id=app_id)
+        for app_id in started:
+            self.events.emit(EventType.GAME_STARTED, self, app_id=app_id,
+                             name=self.game_name(app_id))
+        return True
             
+    @profiling.span("steam.get_current_games")
     def get_current_games(self):
-        """Получение списка текущих игр"""
+        """Текущие игры кортежем GameRecord. Кортеж общий, пока набор игр не поменяется,
+        строки для вывода - format_game"""
         if not self.client.connected:
-            return []
-        
-        games = []
-        for game_id, game_data in self.running_games.items():
-            game_info = {
-                "id": game_id,
-                "name": game_data["name"],
-                "start_time": game_data["start_time"].strftime("%H:%M:%S"),
-                "play_time": self.get_play_time(game_data["start_time"])
-            }
-            games.append(game_info)
-        return games
+            return ()
+        version = self._games_version
+        if self._games_view[0] != version:
+            # Версию читаем до сборки: если набор поменяют из другого потока, следующий вызов пересоберет
+            self._games_view = (version, tuple(self.running_games.values()))
+        return self._games_view[1]
+
+    def format_game(self, game):
+        """Строка таблицы для игры: зовется только при отрисовке или ответе в JSON"""
+        elapsed = time.monotonic() - game.started
+        return {
+            "id": game.app_id,
+            "name": self.resolver.cache.name(game.name_id) or f"Game {game.app_id}",
+            "start_time": time.strftime("%H:%M:%S", time.localtime(time.time() - elapsed)),
+            "play_time": self.format_duration(elapsed)
+        }
     
-    def get_play_time(self, start_time):
-        """Расчет времени в игре"""
-        delta = datetime.now() - start_time
-        hours, remainder = divmod(delta.seconds, 3600)
+    @staticmethod
+    def format_duration(seconds):
+        """Секунды в ЧЧ:ММ:СС"""
+        hours, remainder = divmod(int(seconds), 3600)
         minutes, seconds = divmod(remainder, 60)
         return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    def get_play_time(self, started):
+        """Расчет времени в игре, started - time.monotonic() на старте"""
+        return self.format_duration(time.monotonic() - started)
     
+    @profiling.span("steam.get_session_info")
     def get_session_info(self):
-        """Получение информации о текущей сессии"""
+        """Получение информации о текущей сессии.
+        Словарь один на сессию и перезаполняется при каждом вызове: кому нужен снимок - копирует"""
+        info = self._session_info
+        info.clear()
         if not self.client.connected:
-            return {"status": "Не в сети"}
+            info["status"] = "Не в сети"
+            if self.supervisor is not None and self.supervisor.gave_up is not None:
+                info["status"] = "Нужен вход"
+                info["reason"] = self.supervisor.gave_up.name
+            elif self.supervisor is not None and self.supervisor.down_since is not None:
+                info["status"] = "Переподключение..."
+                info["downtime"] = self.format_duration(self.supervisor.current_downtime())
+            return info
         
-        return {
-            "status": "В сети",
-            "username": self.client.user.name,
-            "steam_id": self.client.steam_id,
-            "games_running": len(self.running_games)
-        }
+        info["status"] = "В сети"
+        info["username"] = self.client.user.name
+        info["steam_id"] = self.client.steam_id
+        info["games_running"] = len(self.running_games)
+        if self.supervisor is not None and self.supervisor.disconnects:
+            stats = self.supervisor.get_stats()
+            info["reconnects"] = f"{stats['reconnects']}/{stats['disconnects']}"
+            info["downtime"] = self.format_duration(stats["downtime_seconds"])
+        return info
     
     def update_status(self):
-        """Обновление статуса игр и поддержание соединения"""
+        """Повторная отправка запущенных игр: после переподключения Steam про них не помнит.
+        Соединение и heartbeat держат гринлеты самого SteamClient, крутить run_forever для этого не нужно"""
         try:
-            # Обновляем статус игр
             if self.running_games and self.client.connected:
-                game_ids = list(self.running_games.keys())
-                if game_ids:
-                    self.client.games_played(game_ids)
-
-            self.client.run_forever() # Эту штуку не менять,
-                                      # потому что либа кусок говна на gevent и по другому поддерживать не получится
-
-        except KeyboardInterrupt:
-            
-            if self.console:
-                self.console.print(
-                    Panel("Программа прервана пользователем.", style="steam_red", border_style="steam_red")
-                )
-            sys.exit(0)
-
-
+                self._sync_games_played(force=True)
         except Exception as e:
-            if self.console:
-                self.console.print(Panel(f"Ошибка обновления статуса: {e}", 
-                                       style="steam_red", border_style="steam_red"))
-            time.sleep(1)
-                     
-            
+            self._say(f"Ошибка обновления статуса: {e}", "steam_red")
+
     def logout(self):
         """Выход из Steam"""
+        self.should_run = False
+        if self.supervisor is not None:
+            self.supervisor.stop()
         if self.client.connected:
+            self.stop_rotation(resume_later=True)
             self.stop_all_games()
             self.client.logout()
-            if self.console:
-                self.console.print(Panel("Выход из Steam выполнен", 
-                                       style="steam_green", border_style="steam_green"))
-                self.console.print(Panel("Завершение работы...", 
-                                       style="steam_blue", border_style="steam_blue"))
+            self._say("Выход из Steam выполнен", "steam_green")
+            self._say("Завершение работы...", "steam_blue")
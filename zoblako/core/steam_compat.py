@@ -0,0 +1,38 @@
+"""
+Модуль для заплаток библиотеки steam
+"""
+import random
+from gevent.socket import wait_read
+from steam.core import connection
+from steam.core.cm import CMServerList
+
+
+def _wait_readable(rlist, wlist, xlist, timeout=None):
+    """Замена gevent.select.select в Connection._reader_loop.
+    Тот сначала зовет настоящий select(), а он падает на дескрипторах >= 1024 (FD_SETSIZE),
+    так что больше ~1000 сессий в одном процессе не поднять. wait_read ждет через libev без лимита"""
+    wait_read(rlist[0].fileno(), timeout)
+    return rlist, wlist, xlist
+
+
+def patch_connection():
+    """Подмена select в steam.core.connection, повторный вызов ничего не делает"""
+    connection.gselect = _wait_readable
+
+
+def _iter_servers(self):
+    """Замена CMServerList.__iter__. Когда плохими помечены все CM (ServiceUnavailable/TryAnotherCM
+    на каждом, у заменителя он вообще один), оригинал сбрасывает пометки и ничего не отдает.
+    CMClient.connect на этом падает с UnboundLocalError и оставляет _connecting=True -
+    клиент больше никогда не подключится. Здесь после сброса отдаем весь список"""
+    good = [server_addr for server_addr, meta in self.list.items() if meta['quality'] == CMServerList.Good]
+    if not good and self.list:
+        self.reset_all()
+        good = list(self.list)
+    random.shuffle(good)
+    return iter(good)
+
+
+def patch_server_list():
+    """Подмена обхода списка CM, повторный вызов ничего не делает"""
+    CMServerList.__iter__ = _iter_servers
@@ -0,0 +1,44 @@
+"""
+Модуль с общими кусочками хранилищ: соединение с SQLite, транзакция на запись и общие на процесс объекты
+"""
+import os
+import sqlite3
+import threading
+import functools
+
+
+def connect(path):
+    """Соединение с файлом SQLite, в который пишут несколько процессов и потоков/гринлетов.
+    WAL + busy_timeout вместо падений на "database is locked", блокировки - на стороне хранилища"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def write(conn, action):
+    """Запись в отдельной транзакции, BEGIN IMMEDIATE сразу берет блокировку на запись.
+    Возвращает то, что вернул action"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = action()
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return result
+
+
+def process_default(factory):
+    """Декоратор для get_default_*: объект создается при первом вызове и дальше общий на процесс"""
+    instance = []
+    lock = threading.Lock()
+
+    @functools.wraps(factory)
+    def get():
+        with lock:
+            if not instance:
+                instance.append(factory())
+            return instance[0]
+    return get
@@ -0,0 +1,121 @@
+"""
+Модуль для автоматического переподключения к Steam
+"""
+import time
+import random
+import gevent
+from steam.enums import EResult
+
+from zoblako.core.events import EventType
+from zoblako.core import metrics
+from zoblako.core.login_pipeline import GUARD_PERIOD, LoginPipeline, set_time_offset, steam_time
+
+
+class ConnectionSupervisor:
+    """Следит за соединением SteamManager: после обрыва переподключается с экспоненциальной
+    задержкой и джиттером, заново входит и возвращает тот же набор игр"""
+
+    BASE_DELAY = 1
+    MAX_DELAY = 300
+    # С такими ответами повторять бессмысленно, нужен человек (пароль или код Steam Guard).
+    # Промах кода при сохраненном shared_secret - не тот случай, см. _reconnect
+    FATAL_RESULTS = (
+        EResult.InvalidPassword,
+        EResult.AccountLogonDenied,
+        EResult.AccountLoginDeniedNeedTwoFactor,
+        EResult.TwoFactorCodeMismatch,
+        EResult.InvalidLoginAuthCode,
+        EResult.AccountDisabled,
+    )
+
+    def __init__(self, steam_manager, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.steam_manager = steam_manager
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.disconnects = 0
+        self.reconnects = 0
+        self.downtime_total = 0.0
+        self.last_downtime = 0.0
+        self.down_since = None  # monotonic, пока соединения нет
+        self.gave_up = None  # EResult, если бросили попытки
+        self._greenlet = None
+        steam_manager.supervisor = self
+        steam_manager.events.subscribe(EventType.DISCONNECTED, self._on_disconnected)
+
+    def _on_disconnected(self, event):
+        """Обрыв: запускаем переподключение, если это не штатный выход"""
+        manager = self.steam_manager
+        if event.source is not manager or not manager.should_run or not manager._was_logged_on:
+            return
+        if self._greenlet is not None and not self._greenlet.dead:
+            return  # Уже переподключаемся, обрывы от неудачных попыток не считаем
+        self.disconnects += 1
+        metrics.DISCONNECTS.labels(manager.client.username).inc()
+        self.down_since = time.monotonic()
+        self.gave_up = None
+        self._greenlet = gevent.spawn(self._reconnect)
+
+    def _delay(self, attempt):
+        """Полный джиттер: случайная задержка от 0 до экспоненциальной границы,
+        чтобы сотня аккаунтов после общего обрыва не ломилась в Steam одновременно"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _reconnect(self):
+        """Цикл попыток переподключения"""
+        manager = self.steam_manager
+        attempt = guard_misses = 0
+        while manager.should_run:
+            gevent.sleep(self._delay(attempt))
+            attempt += 1
+            try:
+                result = manager.relogin()
+            except Exception:
+                result = EResult.Fail
+
+            if result == EResult.OK:
+                manager._sync_games_played(force=True)
+                self.reconnects += 1
+                self.last_downtime = time.monotonic() - self.down_since
+                self.downtime_total += self.last_downtime
+                metrics.RECONNECTS.labels(manager.client.username).inc()
+                metrics.RECONNECT_SECONDS.labels(manager.client.username).observe(self.last_downtime)
+                self.down_since = None
+                return
+            if result in LoginPipeline.GUARD_RESULTS and manager._shared_secret:
+                # Код считаем сами, так что он просто не попал в окно TOTP (часы уплыли) - ждем следующее,
+                # как LoginPipeline. Второй промах подряд - заново спрашиваем у Steam смещение часов
+                guard_misses += 1
+                if guard_misses > 1:
+                    set_time_offset(None)
+                gevent.sleep(GUARD_PERIOD - steam_time() % GUARD_PERIOD + 1)
+                continue
+            if result in self.FATAL_RESULTS:
+                # Больше не переподключаемся, так что и простой дальше не копим: сессия ждет входа, а не связи
+                self.downtime_total += time.monotonic() - self.down_since
+                self.down_since = None
+                self.gave_up = result
+                manager._report_error(f"Переподключение невозможно: {result!r}")
+                return
+
+    def stop(self):
+        """Остановка попыток переподключения"""
+        if self._greenlet is not None:
+            self._greenlet.kill(block=False)
+            self._greenlet = None
+
+    def current_downtime(self):
+        """Простой с учетом текущего обрыва, секунды"""
+        if self.down_since is None:
+            return self.downtime_total
+        return self.downtime_total + time.monotonic() - self.down_since
+
+    def get_stats(self):
+        """Статистика соединения аккаунта"""
+        return {
+            "disconnects": self.disconnects,
+            "reconnects": self.reconnects,
+            "downtime_seconds": self.current_downtime(),
+            "last_downtime_seconds": self.last_downtime,
+            "down": self.down_since is not None,
+            "gave_up": self.gave_up.name if self.gave_up is not None else None,
+        }
@@ -2,7 +2,10 @@
 Модуль для работы с консольным интерфейсом
 """
 import os
-from rich.console import Console
+import time
+import threading
+from rich.console import Console, Group
+from rich.text import Text
 from rich.table import Table
 from rich.theme import Theme
 from rich.style import Style
@@ -10,11 +13,15 @@ from rich.panel import Panel
 from rich.live import Live
 from rich.layout import Layout
 
+from zoblako.core import metrics, profiling
+
 # Тема Steam
 class ConsoleUI:
     """Класс консольного интерфейса, моя гордость и красоточка<3"""
     
-    def __init__(self):
+    REFRESH_PER_SECOND = 1  # Чаще одного кадра в секунду время в игре все равно не меняется
+
+    def __init__(self, refresh_per_second=REFRESH_PER_SECOND):
         self.steam_theme = Theme({
             "steam_blue": "#1b2838",  
             "steam_gray": "#c7d5e0",  
@@ -29,7 +36,16 @@ class ConsoleUI:
         self.layout = Layout()
         self.last_session_data = None
         self.last_games_data = None
-        
+        self.last_schedule_data = None
+        self.refresh_per_second = refresh_per_second
+        self.live = None
+        self._tables = {}  # имя таблицы -> (строки, готовая таблица), перестраиваем только то, что поменялось
+        self._dirty = False
+        self._last_refresh = 0.0
+        self._trailing = None  # Отложенная отрисовка того, что не прошло по частоте кадров
+        self._prompt = None
+        self._lock = threading.RLock()
+
     def clear_screen(self):
         """Очистка экрана"""
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -66,19 +82,143 @@ class ConsoleUI:
             
         return table
         
-    def update_display(self, session_data=None, games_data=None):
+    def create_schedule_table(self, schedule_data):
+        """Создание таблицы с расписанием ротации"""
+        table = Table(title="[steam_blue]Ротация игр[/]", border_style="steam_blue")
+        table.add_column("ID", style="steam_gray")
+        table.add_column("Название", style="steam_blue")
+        table.add_column("Вес", style="info")
+        table.add_column("Наиграно", style="success")
+        table.add_column("Очередь", style="warning")
+
+        for entry in schedule_data:
+            hours, remainder = divmod(int(entry["played_seconds"]), 3600)
+            minutes, seconds = divmod(remainder, 60)
+            if entry["state"] == "active":
+                left_minutes, left_seconds = divmod(int(entry["slice_left"]), 60)
+                queue = f"идет, еще {left_minutes:02d}:{left_seconds:02d}"
+            else:
+                queue = f"через {entry['slot']} слот(а)"
+            table.add_row(
+                str(entry["id"]),
+                entry.get("name", ""),
+                f"{entry['weight']:g}",
+                f"{hours:02d}:{minutes:02d}:{seconds:02d}",
+                queue
+            )
+
+        return table
+
+    def start_live(self):
+        """Запуск живого дашборда, в не-терминале остаемся на обычной печати"""
+        if not self.console.is_terminal or self.live is not None:
+            return False
+        self.live = Live(self._render(), console=self.console, auto_refresh=False,
+                         redirect_stdout=False, redirect_stderr=False)
+        self.live.start()
+        return True
+
+    def stop_live(self):
+        """Остановка живого дашборда"""
+        with self._lock:
+            if self._trailing is not None:
+                self._trailing.cancel()
+                self._trailing = None
+            if self.live is not None:
+                self.live.stop()
+                self.live = None
+
+    def _set_table(self, name, rows, builder):
+        """Пересборка таблицы, только если ее строки поменялись"""
+        cached = self._tables.get(name)
+        if cached is not None and cached[0] == rows:
+            return False
+        self._tables[name] = (rows, builder())
+        return True
+
+    def _render(self):
+        """Сборка кадра: таблицы и строка ввода, если сейчас ждем команду"""
+        parts = [self._tables[name][1] for name in ("session", "games", "schedule") if name in self._tables]
+        if self._prompt is not None:
+            parts.append(Text(self._prompt + _line_buffer(), end=""))
+        return Group(*parts)
+
+    def _flush(self, force=False):
+        """Отрисовка кадра не чаще refresh_per_second. Изменение, которое не прошло по частоте,
+        дорисовывается таймером в конце интервала: без игр update_ui спит до следующего события,
+        и последний stop иначе висел бы неотрисованным"""
+        now = time.monotonic()
+        if not force and not self._dirty:
+            return
+        wait = self._last_refresh + 1 / self.refresh_per_second - now
+        if not force and wait > 0:
+            if self._trailing is None:
+                self._trailing = threading.Timer(wait, self._flush_trailing)
+                self._trailing.daemon = True
+                self._trailing.start()
+            return
+        with metrics.UI_RENDER_SECONDS.time():
+            if self.live is not None:
+                self.live.update(self._render(), refresh=True)
+            else:
+                for name in ("session", "games", "schedule"):
+                    if name in self._tables:
+                        self.console.print(self._tables[name][1])
+        self._dirty = False
+        self._last_refresh = now
+
+    def _flush_trailing(self):
+        with self._lock:
+            self._trailing = None
+            self._flush()
+
+    @profiling.span("ui.update_display")
+    def update_display(self, session_data=None, games_data=None, schedule_data=None):
         """Обновление отображения"""
-        if session_data is not None:
-            self.last_session_data = session_data
-        if games_data is not None:
-            self.last_games_data = games_data
-            
-        if self.last_session_data:
-            self.clear_screen()
-            self.console.print(self.create_session_table(self.last_session_data))
-        if self.last_games_data is not None:
-            self.console.print(self.create_games_table(self.last_games_data))
-        
+        with self._lock:
+            changed = False
+            if session_data is not None:
+                self.last_session_data = session_data
+                changed |= self._set_table("session", tuple(session_data.items()),
+                                           lambda: self.create_session_table(session_data))
+            if games_data is not None:
+                self.last_games_data = games_data
+                changed |= self._set_table("games", tuple(tuple(game.items()) for game in games_data),
+                                           lambda: self.create_games_table(games_data))
+            # Расписание передается всегда, None - ротация выключена
+            self.last_schedule_data = schedule_data
+            if schedule_data:
+                changed |= self._set_table("schedule", tuple(tuple(entry.items()) for entry in schedule_data),
+                                           lambda: self.create_schedule_table(schedule_data))
+            elif self._tables.pop("schedule", None) is not None:
+                changed = True
+
+            self._dirty |= changed
+            self._flush()
+
+    def read_command(self, prompt="> ", read=input):
+        """Ввод команды так, чтобы дашборд не затирал набираемую строку.
+        Строка ввода - последняя строка живого региона, при перерисовке она рисуется заново
+        вместе с уже набранным текстом (если есть readline).
+        read - чем читать строку, под gevent это input в пуле потоков хаба, чтобы ждать ввод, не вставая хабом"""
+        if self.live is None:
+            return read("\n" + prompt)
+
+        with self._lock:
+            self._prompt = prompt
+            self._flush(force=True)
+            # Стираем нарисованное приглашение, его сейчас напечатает сам input
+            self.console.file.write("\r\x1b[2K")
+            self.console.file.flush()
+        try:
+            return read(prompt)
+        finally:
+            with self._lock:
+                self._prompt = None
+                # После Enter курсор уехал на строку ниже региона, возвращаем его туда, где его ждет Live
+                self.console.file.write("\x1b[1A")
+                self._flush(force=True)
+
     def display_session_info(self, session_data):
         """Отображение информации о текущей сессии"""
         self.update_display(session_data=session_data)
@@ -111,3 +251,12 @@ class ConsoleUI:
     def theme(self):
         """Получение темы Steam"""
         return self.steam_theme
+
+
+def _line_buffer():
+    """Уже набранный текст в строке ввода"""
+    try:
+        import readline
+        return readline.get_line_buffer()
+    except ImportError:
+        return ""